@@ -0,0 +1,122 @@
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+# 回测绩效统计：对权益曲线和成交列表各做一次向量化计算，替代 backtrader 的逐 bar analyzer。
+# strategy_engine.backtest 的 BacktestResult.fills 与 future_strategy.BTCMaBreakoutTP.fills 同一格式：
+#   {"bar": 成交 bar 下标, "op": "open_long" / "tp1_short" ..., "side": "buy"/"sell", "size", "price", "commission"}
+
+
+def _round_trips(fills: List[Dict[str, Any]], n: int) -> Dict[str, np.ndarray]:
+    """
+    按方向把成交切成回合：某方向持仓从 0 开始到回到 0 为一笔交易（中间的加仓、TP1 部分平仓都算在内），
+    只做单一方向时与 backtrader TradeAnalyzer 的“开仓到平仓”口径一致。持仓在相对 1e-9 的容差内即视为归零，
+    TradeAnalyzer 要求净持仓精确为 0，分批平仓留下的浮点残量会让它把相邻两笔并成一笔。
+    同时返回每根 bar 收盘时是否持有任一方向的仓位。
+    """
+    empty = np.zeros(0)
+    if not fills:
+        return {"pnl": empty, "bars_held": empty, "exposed": np.zeros(n, dtype=bool)}
+    bar = np.fromiter((f["bar"] for f in fills), dtype=np.int64, count=len(fills))
+    size = np.fromiter((f["size"] for f in fills), dtype=np.float64, count=len(fills))
+    price = np.fromiter((f["price"] for f in fills), dtype=np.float64, count=len(fills))
+    comm = np.fromiter((f.get("commission", 0.0) for f in fills), dtype=np.float64, count=len(fills))
+    is_long = np.array([f["op"].endswith("_long") for f in fills])
+    is_open = np.array([f["op"].startswith("open_") for f in fills])
+    is_buy = np.array([f["side"] == "buy" for f in fills])
+
+    qty = np.where(is_open, size, -size)  # 该方向持仓的变化
+    flow = np.where(is_buy, -size * price, size * price) - comm  # 现金流（含手续费）
+    atol = 1e-9 * float(size.max())
+
+    pnl, held = [], []
+    exposed = np.zeros(n, dtype=bool)
+    for mask in (is_long, ~is_long):
+        if not mask.any():
+            continue
+        q, b = qty[mask], bar[mask]
+        pos = np.cumsum(q)
+        flat = np.abs(pos) <= atol
+        trip = np.concatenate([[0], np.cumsum(flat)[:-1]])
+        closed = int(flat.sum())
+        if closed:
+            pnl.append(np.bincount(trip, weights=flow[mask])[:closed])
+            first = np.flatnonzero(np.diff(trip, prepend=-1) != 0)[:closed]
+            held.append(b[flat] - b[first])
+        per_bar = np.cumsum(np.bincount(b, weights=q, minlength=n))[:n]
+        exposed |= np.abs(per_bar) > atol
+    return {
+        "pnl": np.concatenate(pnl) if pnl else empty,
+        "bars_held": np.concatenate(held).astype(np.float64) if held else empty,
+        "exposed": exposed,
+    }
+
+
+def analyze(
+    equity: Any,
+    fills: List[Dict[str, Any]],
+    init_cash: float,
+    bars_per_year: float = 365.0,
+) -> Dict[str, Any]:
+    """
+    权益曲线（每根 bar 收盘后的账户价值）+ 成交列表 -> 绩效指标。
+
+    收益：final_value / total_return_pct / annual_return_pct（CAGR，按 bars_per_year 年化）；
+    风险：sharpe / sortino（逐 bar 简单收益，年化，无风险利率 0）、max_drawdown（%）、
+    max_drawdown_bars（最长的低于前高的 bar 数）；exposure_pct 为持有任一方向仓位的 bar 占比；
+    交易：按方向的开平回合统计 trades / won / lost / win_rate_pct / avg_trade_pnl / avg_win / avg_loss /
+    best_trade / worst_trade / profit_factor / avg_bars_held，未平的回合不计入。
+    """
+    equity = np.asarray(equity, dtype=np.float64)
+    n = equity.shape[0]
+    final_value = float(equity[-1]) if n else float(init_cash)
+    total_return_pct = (final_value / init_cash - 1) * 100
+    if n > 0 and final_value > 0:
+        annual_return_pct = ((1 + total_return_pct / 100) ** (bars_per_year / n) - 1) * 100
+    elif n > 0:
+        annual_return_pct = -100.0
+    else:
+        annual_return_pct = 0.0
+
+    max_drawdown, max_drawdown_bars = 0.0, 0
+    if n > 0:
+        peak = np.maximum.accumulate(equity)
+        max_drawdown = float(np.max((peak - equity) / peak) * 100)
+        idx = np.arange(n)
+        last_peak = np.maximum.accumulate(np.where(equity >= peak, idx, 0))
+        max_drawdown_bars = int(np.max(idx - last_peak))
+
+    rets = np.diff(equity) / equity[:-1] if n > 1 else np.zeros(0)
+    std = float(rets.std(ddof=1)) if rets.shape[0] > 1 else 0.0
+    sharpe: Optional[float] = float(rets.mean() / std * np.sqrt(bars_per_year)) if std > 0 else None
+    downside = float(np.sqrt(np.mean(np.minimum(rets, 0.0) ** 2))) if rets.shape[0] else 0.0
+    sortino: Optional[float] = float(rets.mean() / downside * np.sqrt(bars_per_year)) if downside > 0 else None
+
+    trips = _round_trips(fills, n)
+    pnl = trips["pnl"]
+    wins, losses = pnl[pnl > 0], pnl[pnl <= 0]
+    gross_loss = float(-losses.sum())
+    n_trades = int(pnl.shape[0])
+
+    return {
+        "final_value": final_value,
+        "total_return_pct": total_return_pct,
+        "annual_return_pct": annual_return_pct,
+        "max_drawdown": max_drawdown,
+        "max_drawdown_bars": max_drawdown_bars,
+        "sharpe": sharpe,
+        "sortino": sortino,
+        "exposure_pct": float(trips["exposed"].mean() * 100) if n else 0.0,
+        "trades": n_trades,
+        "won": int(wins.shape[0]),
+        "lost": int(losses.shape[0]),
+        "win_rate_pct": wins.shape[0] / n_trades * 100 if n_trades else None,
+        "avg_trade_pnl": float(pnl.mean()) if n_trades else None,
+        "avg_win": float(wins.mean()) if wins.shape[0] else None,
+        "avg_loss": float(losses.mean()) if losses.shape[0] else None,
+        "best_trade": float(pnl.max()) if n_trades else None,
+        "worst_trade": float(pnl.min()) if n_trades else None,
+        "profit_factor": float(wins.sum()) / gross_loss if gross_loss > 0 else None,
+        "avg_bars_held": float(trips["bars_held"].mean()) if n_trades else None,
+    }
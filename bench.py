@@ -0,0 +1,391 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from candle_store import CANDLE_DTYPE, candles_from_rows, read_candle_rows, save_columnar
+
+
+# 热点路径基准：每个基准在独立子进程里跑（峰值 RSS 互不影响），结果与基线比较，
+# 任一受控指标比基线差超过阈值即返回非零退出码。完全离线，只依赖标准库 + numpy/pandas/backtrader。
+#
+#   python bench.py                 跑全部基准并与 bench_baseline.json 比较
+#   python bench.py --save          把本次结果写成新基线
+#   python bench.py --ohlcv okx/BTCUSDT_1d_2022_2023.csv --trades trades.json   用录制的数据
+
+BASELINE_PATH = os.getenv("BENCH_BASELINE", "bench_baseline.json")
+DEFAULT_THRESHOLD = 0.25
+# 参与回归判定的指标，数值越大越差。耗时不直接比毫秒：基线与 CI runner 不是同一台机器，
+# 共享 runner 的绝对耗时能差一倍，所以用 rel_cost = 最快一次耗时 / 同一进程里固定参考负载的耗时，
+# 机器快慢对两者同比例生效。峰值 RSS 随解释器和依赖版本的构建变化，只展示不判定
+GATED_METRICS = ("rel_cost", "alloc_kb")
+# 与 live_okx.OHLCV_LIMIT 一致：实盘每次决策看到的 K 线窗口
+WINDOW = 300
+# 实盘 cron 每天都在全新的 runner 上冷启动：import live_okx 并加载 OKX 交易所类的耗时上限（毫秒），
+# 以及这条路径上不允许出现的模块（ccxt.binance 代表“导入了全部交易所”）
+STARTUP_BUDGET_MS = float(os.getenv("BENCH_STARTUP_BUDGET_MS", "500"))
+STARTUP_FORBIDDEN = ("pandas", "backtrader", "matplotlib", "asyncio", "ccxt.binance")
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import live_okx
+live_okx.okx_class()
+elapsed = time.perf_counter() - started
+print(json.dumps({"import_ms": elapsed * 1e3, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (STARTUP_FORBIDDEN,)
+
+
+# ---- 数据 ----
+
+def synthetic_ohlcv(n: int, seed: int = 0) -> list[list]:
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.03, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.01, n)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.01, n)))
+    ts = 1_600_000_000_000 + np.arange(n, dtype=np.int64) * 86_400_000
+    volume = rng.uniform(100, 1000, n)
+    return [[int(t), o, h, lo, c, v] for t, o, h, lo, c, v in zip(ts.tolist(), open_, high, low, close, volume)]
+
+
+def synthetic_trades(n: int, seed: int = 0) -> list[dict]:
+    """两个方向交替的加仓 -> 部分止盈 -> 平仓循环，格式同 ccxt fetch_my_trades。"""
+    rng = np.random.default_rng(seed)
+    trades = []
+    ts = 1_600_000_000_000
+    while len(trades) < n:
+        pos_side = "long" if len(trades) % 2 == 0 else "short"
+        opening, closing = ("buy", "sell") if pos_side == "long" else ("sell", "buy")
+        legs = [(opening, float(rng.integers(1, 10))) for _ in range(int(rng.integers(1, 4)))]
+        total = sum(amount for _, amount in legs)
+        partial = float(np.floor(total * 0.9))
+        legs += [(closing, partial), (closing, total - partial)] if partial else [(closing, total)]
+        for side, amount in legs:
+            ts += 60_000
+            trades.append(
+                {
+                    "id": str(len(trades)),
+                    "timestamp": ts,
+                    "side": side,
+                    "amount": amount,
+                    "price": 30000.0,
+                    "info": {"posSide": pos_side},
+                }
+            )
+    return trades[:n]
+
+
+def load_fixtures(args: argparse.Namespace) -> tuple[list[list], list[dict], dict]:
+    rows = read_candle_rows(args.ohlcv) if args.ohlcv else synthetic_ohlcv(args.bars)
+    if args.trades:
+        with open(args.trades, "r", encoding="utf-8") as f:
+            trades = json.load(f)
+    else:
+        trades = synthetic_trades(args.n_trades)
+    meta = {
+        "ohlcv": args.ohlcv or f"synthetic:{args.bars}",
+        "trades": args.trades or f"synthetic:{args.n_trades}",
+        "bars": len(rows),
+        "n_trades": len(trades),
+    }
+    return rows, trades, meta
+
+
+# ---- 基准 ----
+# 每个基准返回 (op, units)：op() 执行一次被测操作，units 为一次操作处理的 bar / 成交数
+
+def _frame(rows: list[list]) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=list(CANDLE_DTYPE.names))
+
+
+def bench_process_bar(rows: list[list], trades: list[dict], workdir: str) -> tuple[Callable[[], Any], int]:
+    from strategy_engine import StrategyState
+
+    # 与 live_okx 一致：process_bar 直接读 CandleStore 形式的结构化数组
+    bars = candles_from_rows(rows)
+
+    def op() -> None:
+        state = StrategyState()
+        for i in range(WINDOW, len(bars) + 1):
+            state.process_bar(bars[i - WINDOW:i], 10_000.0, 10_000.0)
+
+    return op, max(1, len(bars) - WINDOW + 1)
+
+
+def bench_array_backtest(rows: list[list], trades: list[dict], workdir: str) -> tuple[Callable[[], Any], int]:
+    from strategy_engine import backtest
+
+    df = _frame(rows)
+    return (lambda: backtest(df)), len(df)
+
+
+def bench_run_backtest(rows: list[list], trades: list[dict], workdir: str) -> tuple[Callable[[], Any], int]:
+    from future_main import run_backtest
+
+    path = os.path.join(workdir, "ohlcv")
+    df = _frame(rows)
+    save_columnar(path, {name: df[name].to_numpy() for name in CANDLE_DTYPE.names})
+    # run_backtest 把成交写到 okx/backtest_trades.csv（相对当前目录）
+    os.makedirs(os.path.join(workdir, "okx"), exist_ok=True)
+    os.chdir(workdir)
+
+    def op() -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_backtest(path, plot=False)
+
+    return op, len(rows)
+
+
+def bench_infer_tp1(rows: list[list], trades: list[dict], workdir: str) -> tuple[Callable[[], Any], int]:
+    from live_okx import _infer_tp1_done_from_trades
+
+    def op() -> None:
+        _infer_tp1_done_from_trades(trades, 0.01, "long")
+        _infer_tp1_done_from_trades(trades, 0.01, "short")
+
+    return op, len(trades)
+
+
+def bench_sync_state(rows: list[list], trades: list[dict], workdir: str) -> tuple[Callable[[], Any], int]:
+    from live_okx import ExchangeSession, sync_state_from_exchange
+    from mock_exchange import MockOKX, simulate
+    from strategy_engine import StrategyState
+
+    # 先在模拟账户上跑一段，得到真实的持仓与成交历史
+    exchange = MockOKX(rows, start=min(WINDOW, len(rows)) - 1)
+    simulate(exchange, bars=min(500, len(rows) - WINDOW))
+
+    # 单次 sync 只有几十微秒，一次操作跑 100 次让计时稳定
+    def op() -> None:
+        for _ in range(100):
+            sync_state_from_exchange(exchange, StrategyState(), ExchangeSession(exchange))
+
+    return op, 100
+
+
+def bench_startup(rows: list[list], trades: list[dict], workdir: str) -> tuple[Callable[[], Any], int, Callable[[], dict]]:
+    # 每次操作启动一个全新解释器，计时包含解释器自身启动；import_ms 为进程内 import 部分的最快一次
+    probes: list[dict] = []
+
+    def op() -> None:
+        proc = subprocess.run(
+            [sys.executable, "-c", STARTUP_PROBE],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        probes.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    def report() -> dict:
+        return {
+            "import_ms": min(p["import_ms"] for p in probes),
+            "loaded": sorted({m for p in probes for m in p["loaded"]}),
+        }
+
+    return op, 1, report
+
+
+BENCHMARKS: dict[str, Callable[[list[list], list[dict], str], tuple]] = {
+    "process_bar": bench_process_bar,
+    "array_backtest": bench_array_backtest,
+    "run_backtest": bench_run_backtest,
+    "infer_tp1": bench_infer_tp1,
+    "sync_state": bench_sync_state,
+    "startup": bench_startup,
+}
+
+
+def calibrate(min_time: float = 0.2) -> float:
+    """固定的参考负载（纯 Python 循环 + numpy 排序/累加），累计跑满 min_time 秒，返回最快一次的毫秒数。"""
+    values = np.random.default_rng(0).random(200_000)
+    head = values[:50_000].tolist()
+    best, spent = float("inf"), 0.0
+    while spent < min_time:
+        started = time.perf_counter()
+        acc = 0.0
+        for v in head:
+            acc += v * v
+        np.sort(values)
+        np.cumsum(values)
+        elapsed = time.perf_counter() - started
+        best, spent = min(best, elapsed), spent + elapsed
+    return best * 1e3
+
+
+def measure(name: str, rows: list[list], trades: list[dict], repeat: int, min_time: float) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        # 基准可以额外返回 report()，测完后把它给出的指标并入结果
+        op, units, *reports = BENCHMARKS[name](rows, trades, workdir)
+        op()  # 预热：导入、缓存等一次性开销不计入
+        # 参考负载在计时前后各测一次取最快，与基准耗时处在同一段机器负载下
+        calib_ms = calibrate()
+        # 至少 repeat 次，且累计耗时不少于 min_time 秒（短操作多跑几次，结果更稳定）
+        timings = []
+        while len(timings) < repeat or sum(timings) < min_time:
+            started = time.perf_counter()
+            op()
+            timings.append(time.perf_counter() - started)
+        tracemalloc.start()
+        op()
+        _, alloc_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        extra = {k: v for report in reports for k, v in report().items()}
+    calib_ms = min(calib_ms, calibrate())
+    median = statistics.median(timings)
+    return {
+        "units": units,
+        "runs": len(timings),
+        "latency_ms": median * 1e3,
+        "best_ms": min(timings) * 1e3,
+        "calib_ms": calib_ms,
+        "rel_cost": min(timings) * 1e3 / calib_ms,
+        "p95_ms": float(np.percentile(timings, 95)) * 1e3,
+        "per_unit_us": median / units * 1e6,
+        "units_per_s": units / median if median > 0 else None,
+        "alloc_kb": alloc_peak / 1024,
+        # Linux 上 ru_maxrss 单位为 KB
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        **extra,
+    }
+
+
+# ---- 运行与比较 ----
+
+def _fixture_args(args: argparse.Namespace) -> list[str]:
+    out = ["--bars", str(args.bars), "--n-trades", str(args.n_trades), "--repeat", str(args.repeat), "--min-time", str(args.min_time)]
+    if args.ohlcv:
+        out += ["--ohlcv", os.path.abspath(args.ohlcv)]
+    if args.trades:
+        out += ["--trades", os.path.abspath(args.trades)]
+    return out
+
+
+def run_isolated(name: str, args: argparse.Namespace) -> dict:
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", name, *_fixture_args(args)],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"benchmark {name} failed:\n{proc.stderr.strip()}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for key in GATED_METRICS:
+            old, new = base.get(key), metrics.get(key)
+            if old and new is not None and new > old * (1 + threshold):
+                regressions.append(f"{name}.{key}: {old:.3g} -> {new:.3g} (+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def check_startup(results: dict, budget_ms: float) -> list[str]:
+    """与基线无关的绝对门禁：冷启动 import 耗时预算和禁止加载的模块。"""
+    m = results.get("startup")
+    if not m:
+        return []
+    print(f"\nstartup: import live_okx + OKX class {m['import_ms']:.0f} ms (budget {budget_ms:.0f} ms)")
+    failures = []
+    if m["import_ms"] > budget_ms:
+        failures.append(f"startup.import_ms: {m['import_ms']:.1f} > budget {budget_ms:.1f}")
+    if m["loaded"]:
+        failures.append(f"startup.loaded: {', '.join(m['loaded'])} imported on the live path")
+    return failures
+
+
+def print_table(results: dict, baseline: dict | None) -> None:
+    print(
+        f"{'benchmark':<16}{'units':>8}{'us/unit':>11}{'units/s':>12}{'best ms':>10}{'p95 ms':>10}"
+        f"{'rel cost':>10}{'alloc KB':>11}{'RSS MB':>9}  vs base"
+    )
+    for name, m in results.items():
+        base = (baseline or {}).get("results", {}).get(name)
+        delta = f"{(m['rel_cost'] / base['rel_cost'] - 1) * 100:+.0f}%" if base and base.get("rel_cost") else "-"
+        print(
+            f"{name:<16}{m['units']:>8}{m['per_unit_us']:>11.1f}{m['units_per_s'] or 0:>12.0f}"
+            f"{m['best_ms']:>10.1f}{m['p95_ms']:>10.1f}{m['rel_cost']:>10.3f}{m['alloc_kb']:>11.0f}"
+            f"{m['peak_rss_kb'] / 1024:>9.1f}  {delta}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="热点路径基准与性能回归门禁（离线）")
+    parser.add_argument("--only", default=None, help="逗号分隔的基准名，默认全部：" + ",".join(BENCHMARKS))
+    parser.add_argument("--ohlcv", default=None, help="录制的 K 线（CSV 或列式目录），默认合成数据")
+    parser.add_argument("--trades", default=None, help="录制的成交（ccxt fetch_my_trades 格式的 JSON 列表）")
+    parser.add_argument("--bars", type=int, default=3000, help="合成 K 线数量")
+    parser.add_argument("--n-trades", type=int, default=2000, help="合成成交数量")
+    parser.add_argument("--repeat", type=int, default=5, help="每个基准至少计时的次数")
+    parser.add_argument("--min-time", type=float, default=0.5, help="每个基准至少累计计时的秒数")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="允许的相对退化，0.25 即 25%%")
+    parser.add_argument("--save", action="store_true", help="把本次结果写为新基线")
+    parser.add_argument("--startup-budget-ms", type=float, default=STARTUP_BUDGET_MS, help="冷启动 import 耗时上限（毫秒）")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        rows, trades, _ = load_fixtures(args)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = measure(args.worker, rows, trades, args.repeat, args.min_time)
+        print(json.dumps(result))
+        return 0
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+    _, _, meta = load_fixtures(args)
+    results = {name: run_isolated(name, args) for name in names}
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+    startup_failures = check_startup(results, args.startup_budget_ms)
+
+    if args.save:
+        saved = (baseline or {}).get("results", {}) if baseline and baseline.get("fixtures") == meta else {}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"fixtures": meta, "saved_at": time.time(), "results": {**saved, **results}}, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"no baseline at {args.baseline}; run with --save to record one")
+        return 1 if startup_failures else 0
+    if baseline.get("fixtures") != meta:
+        print(f"baseline fixtures {baseline.get('fixtures')} differ from this run {meta}; re-record with --save")
+        return 2
+
+    regressions = compare(results, baseline, args.threshold) + startup_failures
+    if regressions:
+        print(f"\nREGRESSION (threshold {args.threshold:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\nno regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import os
+from typing import Any, Sequence
+
+import numpy as np
+
+
+CANDLE_DTYPE = np.dtype(
+    [
+        ("timestamp", "<i8"),
+        ("open", "<f8"),
+        ("high", "<f8"),
+        ("low", "<f8"),
+        ("close", "<f8"),
+        ("volume", "<f8"),
+    ]
+)
+
+
+class CandleStore:
+    """
+    本地 K 线仓库：每个 (symbol, timeframe) 一个定长二进制记录文件，只追加写。
+
+    最后一根 bar 可能尚未收盘，所以每次同步都从最后一个已存时间戳开始拉，
+    覆盖最后一条记录后再追加更新的 bar；读取走 np.memmap，tail() 返回零拷贝视图。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, symbol: str, timeframe: str) -> str:
+        safe = symbol.replace("/", "-").replace(":", "_")
+        return os.path.join(self.root, f"{safe}_{timeframe}.bin")
+
+    def read(self, symbol: str, timeframe: str) -> np.ndarray:
+        path = self.path(symbol, timeframe)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        count = size // CANDLE_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=CANDLE_DTYPE)
+        return np.memmap(path, dtype=CANDLE_DTYPE, mode="r", shape=(count,))
+
+    def tail(self, symbol: str, timeframe: str, n: int) -> np.ndarray:
+        data = self.read(symbol, timeframe)
+        return data[-n:] if n > 0 else data[:0]
+
+    def last_timestamp(self, symbol: str, timeframe: str) -> int | None:
+        data = self.read(symbol, timeframe)
+        if data.shape[0] == 0:
+            return None
+        return int(data["timestamp"][-1])
+
+    def write(self, symbol: str, timeframe: str, rows: Sequence[Sequence[Any]]) -> int:
+        """
+        合并 ccxt 格式的 [ts, o, h, l, c, v] 行：早于最后已存 bar 的忽略，
+        与最后已存 bar 同时间戳的覆盖，其余按时间顺序追加。返回写入条数。
+        """
+        if not rows:
+            return 0
+        last_ts = self.last_timestamp(symbol, timeframe)
+        by_ts: dict = {}
+        for r in rows:
+            ts = int(r[0])
+            if last_ts is not None and ts < last_ts:
+                continue
+            by_ts[ts] = r
+        if not by_ts:
+            return 0
+
+        records = np.empty(len(by_ts), dtype=CANDLE_DTYPE)
+        for i, ts in enumerate(sorted(by_ts)):
+            r = by_ts[ts]
+            records[i] = (ts, *(float(x or 0) for x in r[1:6]))
+
+        path = self.path(symbol, timeframe)
+        os.makedirs(self.root, exist_ok=True)
+        mode = "r+b" if os.path.exists(path) else "wb"
+        with open(path, mode) as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            end -= end % CANDLE_DTYPE.itemsize  # 截掉上次中断写入留下的半条记录
+            if last_ts is not None and int(records["timestamp"][0]) == last_ts:
+                end -= CANDLE_DTYPE.itemsize
+            f.seek(end)
+            f.truncate()
+            f.write(records.tobytes())
+        return int(records.shape[0])
+
+    def sync(
+        self,
+        exchange: Any,
+        symbol: str,
+        timeframe: str,
+        limit: int = 300,
+        page: int = 300,
+    ) -> np.ndarray:
+        """
+        Pull only bars at or after the last stored timestamp (the last stored bar
+        is re-fetched so an unconfirmed candle gets its final values), then
+        return a view of the newest `limit` bars.
+        """
+        since = self.last_timestamp(symbol, timeframe)
+        if since is None:
+            self.write(symbol, timeframe, exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit))
+        else:
+            while True:
+                batch = exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=page)
+                self.write(symbol, timeframe, batch)
+                if len(batch) < page or int(batch[-1][0]) <= since:
+                    break
+                since = int(batch[-1][0])
+        return self.tail(symbol, timeframe, limit)
+
+    async def sync_async(
+        self,
+        exchange: Any,
+        symbol: str,
+        timeframe: str,
+        limit: int = 300,
+        page: int = 300,
+    ) -> np.ndarray:
+        """sync() for ccxt.async_support exchanges."""
+        since = self.last_timestamp(symbol, timeframe)
+        if since is None:
+            self.write(symbol, timeframe, await exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit))
+        else:
+            while True:
+                batch = await exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=page)
+                self.write(symbol, timeframe, batch)
+                if len(batch) < page or int(batch[-1][0]) <= since:
+                    break
+                since = int(batch[-1][0])
+        return self.tail(symbol, timeframe, limit)
+
+
+def candles_from_rows(rows: Sequence[Sequence[Any]]) -> np.ndarray:
+    """ccxt 格式的 [ts, o, h, l, c, v] 行转成 CANDLE_DTYPE 结构化数组，与 CandleStore.tail() 同一形式。"""
+    records = np.empty(len(rows), dtype=CANDLE_DTYPE)
+    for i, r in enumerate(rows):
+        records[i] = (int(r[0]), *(float(x or 0) for x in r[1:6]))
+    return records
+
+
+def is_columnar(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "timestamp.npy"))
+
+
+def save_columnar(path: str, data: Any) -> None:
+    """
+    列式保存：path 为目录，每列一个 .npy（timestamp 为 int64 毫秒，其余 float64），
+    读取时用 np.load(mmap_mode="r") 直接映射，不做任何文本解析。
+    data 可以是 DataFrame 或 {列名: 数组} 映射，必须包含 timestamp 列。
+    """
+    os.makedirs(path, exist_ok=True)
+    for name in CANDLE_DTYPE.names:
+        col = np.ascontiguousarray(np.asarray(data[name]), dtype=CANDLE_DTYPE[name])
+        final = os.path.join(path, f"{name}.npy")
+        tmp = os.path.join(path, f".{name}.tmp.npy")
+        np.save(tmp, col)
+        os.replace(tmp, final)
+
+
+def load_columnar(path: str) -> dict:
+    return {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        for name in CANDLE_DTYPE.names
+    }
+
+
+def read_candle_rows(path: str) -> list[list]:
+    """读取列式目录或 CSV（timestamp 或 date 列），返回 ccxt 格式的 [ts, o, h, l, c, v] 行。"""
+    if is_columnar(path):
+        cols = load_columnar(path)
+        return [list(r) for r in zip(*(cols[name].tolist() for name in CANDLE_DTYPE.names))]
+
+    import pandas as pd
+
+    raw = pd.read_csv(path)
+    if "timestamp" not in raw.columns:
+        # 先统一到毫秒单位再取整数：pandas 3 解析出的是 datetime64[us]，不能假定纳秒
+        raw["timestamp"] = pd.to_datetime(raw["date"]).dt.as_unit("ms").astype("int64")
+    rows = raw[list(CANDLE_DTYPE.names)].values.tolist()
+    return [[int(r[0]), *r[1:]] for r in rows]
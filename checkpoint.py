@@ -0,0 +1,159 @@
+import json
+import os
+import pickle
+import struct
+import time
+import zlib
+from typing import Any
+
+from strategy_engine import StrategyState
+
+
+# 二进制格式：magic + 版本 + crc32 + pickle(纯 dict/list/float 结构)
+_MAGIC = b"SSCK"
+_HEADER = struct.Struct("<4sHI")
+_VERSION = 1
+
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class StateCheckpoint:
+    """
+    StrategyState 的崩溃安全检查点，一个文件保存所有 symbol 的状态（含指标预热状态）。
+
+    写前日志：下单前 begin() 把决策后的状态和待下单动作写入 <path>.wal，
+    下单完成后 commit() 原子替换主文件并删除 .wal。启动时若 .wal 仍在，说明上次在
+    下单过程中中断，load() 返回 .wal 里的状态并标记 pending，由调用方按 read_pending()
+    里记录的 clOrdId 与交易所对账后再 commit()。
+
+    主文件里的 acted 记录每个 symbol 最近一次已下单的 decision_id，对账后同一根 bar 不再重新决策。
+
+    fmt="binary" 时用紧凑的二进制编码（适合多 entry、多合约的大状态）；
+    读取时按文件头自动识别，也兼容旧版只含单个 StrategyState 的 state.json。
+    """
+
+    def __init__(self, path: str, fmt: str = "json"):
+        if fmt not in ("json", "binary"):
+            raise ValueError(f"unknown checkpoint format: {fmt}")
+        self.path = path
+        self.fmt = fmt
+        self.wal_path = f"{path}.wal"
+        self.pending = False
+
+    def _encode(self, payload: dict) -> bytes:
+        if self.fmt == "binary":
+            body = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+            return _HEADER.pack(_MAGIC, _VERSION, zlib.crc32(body)) + body
+        return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def _decode(data: bytes) -> dict | None:
+        if data[:4] == _MAGIC:
+            if len(data) < _HEADER.size:
+                return None
+            _, version, crc = _HEADER.unpack_from(data)
+            body = data[_HEADER.size:]
+            if version != _VERSION or zlib.crc32(body) != crc:
+                return None
+            return pickle.loads(body)
+        try:
+            return json.loads(data.decode("utf-8"))
+        except ValueError:
+            return None
+
+    def _write(self, path: str, payload: dict) -> None:
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(self._encode(payload))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        _fsync_dir(path)
+
+    def _read(self, path: str) -> dict | None:
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data:
+            return None
+        raw = self._decode(data)
+        if not isinstance(raw, dict):
+            return None
+        if "states" not in raw and "params" in raw:
+            # 旧版 state.json：单个 StrategyState，不区分 symbol
+            raw = {"states": {None: raw}}
+        return raw
+
+    def load_all(self) -> dict[str | None, StrategyState]:
+        raw = self._read(self.wal_path)
+        self.pending = raw is not None
+        if raw is None:
+            raw = self._read(self.path)
+        if raw is None:
+            return {}
+        return {symbol: StrategyState.from_dict(s) for symbol, s in raw.get("states", {}).items()}
+
+    def load(self, symbol: str) -> StrategyState | None:
+        states = self.load_all()
+        return states.get(symbol) or states.get(None)
+
+    def read_pending(self) -> dict | None:
+        """上次中断时的写前日志原文（states / actions / decision_id），没有则返回 None。"""
+        return self._read(self.wal_path)
+
+    def acted(self, symbol: str) -> str | None:
+        """该 symbol 最近一次已下单（或已对账）的 decision_id。"""
+        return ((self._read(self.path) or {}).get("acted") or {}).get(symbol)
+
+    def _payload(
+        self,
+        states: dict[str, StrategyState],
+        decision_id: str | None,
+        acted: dict[str, str] | None = None,
+        **extra: Any,
+    ) -> dict:
+        # 与已有检查点合并，单合约与组合运行可以共用同一个文件
+        existing = self._read(self.path) or {}
+        merged = {symbol: raw for symbol, raw in existing.get("states", {}).items() if symbol is not None}
+        merged.update((symbol, state.to_dict()) for symbol, state in states.items())
+        return {
+            "version": _VERSION,
+            "saved_at": time.time(),
+            "decision_id": decision_id,
+            "states": merged,
+            "acted": {**(existing.get("acted") or {}), **(acted or {})},
+            **extra,
+        }
+
+    def begin(self, states: dict[str, StrategyState], decision_id: str | None, actions: dict[str, list[dict]]) -> None:
+        """下单前：写入决策后的状态与待执行动作。"""
+        self._write(self.wal_path, self._payload(states, decision_id, actions=actions))
+        self.pending = True
+
+    def commit(
+        self,
+        states: dict[str, StrategyState],
+        decision_id: str | None = None,
+        acted: dict[str, str] | None = None,
+    ) -> None:
+        """下单后：原子替换检查点并清除写前日志；acted 为本次已下单的 {symbol: decision_id}。"""
+        self._write(self.path, self._payload(states, decision_id, acted))
+        try:
+            os.remove(self.wal_path)
+        except FileNotFoundError:
+            pass
+        _fsync_dir(self.path)
+        self.pending = False
@@ -1,61 +1,183 @@
 # download_data.py
+import argparse
+import json
+import os
+import re
+import threading
 import okx.MarketData as MarketData
 import pandas as pd
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from API_real import api_key, secret_key, passphrase
+from candle_store import save_columnar
 
 flag = "0"  # 0=实盘  1=模拟s
 
 marketAPI = MarketData.MarketAPI(api_key, secret_key, passphrase, False, flag)
 
-
-def get_btc_daily(start="2022-05-01", end="2023-12-01"):
-    start_ts = int(datetime.strptime(start, "%Y-%m-%d").timestamp() * 1000)
-    end_ts = int(datetime.strptime(end, "%Y-%m-%d").timestamp() * 1000)
-
-    all_data = []
-    # 直接跳转到 end 日期的次日开始往回下载，跳过 2025/2026 年的数据
-    jump_start_ts = end_ts + 86400000
-    after = str(jump_start_ts)
-
+# OKX history-candles 单次最多 100 根；限频 20 次/2s，这里默认留一半余量
+PAGE_LIMIT = 100
+DEFAULT_RATE = 10.0
+RAW_COLUMNS = [
+    "timestamp", "open", "high", "low", "close", "volume",
+    "volCcy", "volCcyQuote", "confirm"
+]
+
+_BAR_UNITS_MS = {"m": 60_000, "H": 3_600_000, "D": 86_400_000, "W": 7 * 86_400_000}
+
+
+def bar_to_ms(bar: str) -> int:
+    m = re.fullmatch(r"(\d+)([mHDW])(?:utc)?", bar)
+    if not m:
+        raise ValueError(f"不支持的 bar: {bar}")
+    return int(m.group(1)) * _BAR_UNITS_MS[m.group(2)]
+
+
+class TokenBucket:
+    """线程安全令牌桶：每秒补充 rate 个令牌，最多攒 capacity 个。"""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def split_windows(start_ts: int, end_ts: int, bar_ms: int, limit: int = PAGE_LIMIT) -> list[tuple[int, int]]:
+    """把 [start_ts, end_ts] 切成每段最多 limit 根 bar 的半开区间 [ws, we)。"""
+    span = bar_ms * limit
+    windows = []
+    ws = start_ts
+    while ws <= end_ts:
+        we = min(ws + span, end_ts + 1)
+        windows.append((ws, we))
+        ws = we
+    return windows
+
+
+def fetch_window(api, inst_id: str, bar: str, ws: int, we: int, bucket: TokenBucket, retries: int = 3) -> list[list]:
+    rows = []
+    after = we
     while True:
-        # 使用 get_history_candlesticks 获取历史数据
-        res = marketAPI.get_history_candlesticks(
-            instId="SOL-USDT",
-            bar="1D",
-            after=after,
-            limit=100
-        )
+        for attempt in range(retries):
+            bucket.acquire()
+            try:
+                # after: 早于该时间戳；before: 晚于该时间戳
+                res = api.get_history_candlesticks(
+                    instId=inst_id,
+                    bar=bar,
+                    after=str(after),
+                    before=str(ws - 1),
+                    limit=PAGE_LIMIT
+                )
+                if str(res.get("code", "0")) != "0":
+                    raise RuntimeError(f"OKX error {res.get('code')}: {res.get('msg')}")
+                break
+            except Exception:
+                if attempt == retries - 1:
+                    raise
+                time.sleep(0.5 * 2 ** attempt)
 
         data = res["data"]
         if not data:
             break
-
-        for row in data:
-            ts = int(row[0])
-            if ts < start_ts:
-                break
-            if start_ts <= ts <= end_ts:
-                all_data.append(row)
-
-        after = data[-1][0]
-
-        if int(data[-1][0]) < start_ts:
+        rows.extend(r for r in data if ws <= int(r[0]) < we)
+        oldest = int(data[-1][0])
+        if oldest <= ws or len(data) < PAGE_LIMIT:
             break
+        after = oldest
+    return rows
+
+
+def _checkpoint_path(checkpoint_dir: str, bar: str, ws: int, we: int) -> str:
+    # 窗口起止与 bar 都进文件名：换了 end 或 bar 重跑时不会误用旧窗口
+    return os.path.join(checkpoint_dir, f"{bar}_{ws}_{we}.json")
+
+
+def download_history(
+    inst_id: str = "SOL-USDT",
+    bar: str = "1D",
+    start: str = "2022-05-01",
+    end: str = "2023-12-01",
+    out_path: str | None = None,
+    workers: int = 4,
+    rate: float = DEFAULT_RATE,
+    api=None,
+) -> pd.DataFrame:
+    """
+    并发、可断点续传地下载历史 K 线：按时间切窗口，线程池 + 令牌桶限频拉取，
+    每个完成的窗口落盘到 checkpoint 目录，崩溃后重跑会跳过已完成的窗口。
+    """
+    api = api or marketAPI
+    start_ts = int(datetime.strptime(start, "%Y-%m-%d").timestamp() * 1000)
+    end_ts = int(datetime.strptime(end, "%Y-%m-%d").timestamp() * 1000)
+    if out_path is None:
+        out_path = f"okx/{inst_id.replace('-', '')}_{bar.lower()}_{start[:4]}_{end[:4]}.csv"
+    base = out_path[:-4] if out_path.endswith(".csv") else out_path
+    checkpoint_dir = f"{base}.parts"
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    windows = split_windows(start_ts, end_ts, bar_to_ms(bar))
+    todo = [(ws, we) for ws, we in windows if not os.path.exists(_checkpoint_path(checkpoint_dir, bar, ws, we))]
+    print(f"{inst_id} {bar}: {len(windows)} 个窗口，待下载 {len(todo)} 个")
+
+    bucket = TokenBucket(rate)
+    failed = []
+    # 本次拉到的窗口直接留在内存里输出，不依赖是否落盘
+    fetched: dict[tuple[int, int], list[list]] = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch_window, api, inst_id, bar, ws, we, bucket): (ws, we) for ws, we in todo}
+        for fut in as_completed(futures):
+            try:
+                rows = fut.result()
+            except Exception as e:
+                # 单个窗口失败不影响其它窗口落盘，最后统一报错，重跑即可续传
+                failed.append((futures[fut][0], e))
+                continue
+            fetched[futures[fut]] = rows
+            # 含未收盘 bar 的窗口只是不落盘（下次重新拉），本次输出照样包含其中已收盘的行
+            if any(len(r) > 8 and str(r[8]) == "0" for r in rows):
+                continue
+            path = _checkpoint_path(checkpoint_dir, bar, *futures[fut])
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump(rows, f)
+            os.replace(f"{path}.tmp", path)
+    if failed:
+        raise RuntimeError(f"{len(failed)} 个窗口下载失败，重新运行即可从断点继续；首个错误: {failed[0][1]!r}")
 
-        time.sleep(0.1)
-
-    df = pd.DataFrame(all_data, columns=[
-        "timestamp", "open", "high", "low", "close", "volume",
-        "volCcy", "volCcyQuote", "confirm"
-    ])
-
+    all_data = []
+    for ws, we in windows:
+        if (ws, we) in fetched:
+            all_data.extend(fetched[(ws, we)])
+            continue
+        path = _checkpoint_path(checkpoint_dir, bar, ws, we)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                all_data.extend(json.load(f))
+
+    df = pd.DataFrame(all_data, columns=RAW_COLUMNS[:len(all_data[0])] if all_data else RAW_COLUMNS)
+
+    df["timestamp"] = df["timestamp"].astype("int64")
+    df = df.drop_duplicates("timestamp")
     df["date"] = pd.to_datetime(df["timestamp"], unit="ms")
 
     df = df.sort_values("date")
 
-    df = df[["date", "open", "high", "low", "close", "volume"]]
+    df = df[["date", "timestamp", "open", "high", "low", "close", "volume"]]
     df = df.astype({
         "open": float,
         "high": float,
@@ -64,9 +186,41 @@ def get_btc_daily(start="2022-05-01", end="2023-12-01"):
         "volume": float
     })
 
-    df.to_csv("okx/SOLUSDT_1d_2022_2023.csv", index=False)
-    print("数据已保存为 SOLUSDT_1d_2022_2023.csv")
+    df.drop(columns=["timestamp"]).to_csv(out_path, index=False)
+    print(f"数据已保存为 {out_path}")
+
+    # 同时写一份列式二进制（每列一个 .npy），回测可直接 memmap 读取
+    save_columnar(base, df)
+    print(f"列式数据已保存至 {base}/")
+    return df
+
+
+def get_btc_daily(start="2022-05-01", end="2023-12-01"):
+    return download_history(
+        inst_id="SOL-USDT",
+        bar="1D",
+        start=start,
+        end=end,
+        out_path="okx/SOLUSDT_1d_2022_2023.csv",
+    )
 
 
 if __name__ == "__main__":
-    get_btc_daily()
+    parser = argparse.ArgumentParser(description="下载 OKX 历史 K 线")
+    parser.add_argument("--inst-id", default="SOL-USDT")
+    parser.add_argument("--bar", default="1D")
+    parser.add_argument("--start", default="2022-05-01")
+    parser.add_argument("--end", default="2023-12-01")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE)
+    args = parser.parse_args()
+    download_history(
+        inst_id=args.inst_id,
+        bar=args.bar,
+        start=args.start,
+        end=args.end,
+        out_path=args.out,
+        workers=args.workers,
+        rate=args.rate,
+    )
@@ -0,0 +1,233 @@
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from stop_utils import first_hit, ladder_exit, stop_loss_mask, take_profit_mask
+
+
+@dataclass
+class Entry:
+    price: float
+    size: float
+    tp1_done: bool = False
+
+
+_INF = float("inf")
+
+
+class EntryBook:
+    """
+    同一方向的持仓 entry，按开仓顺序存成 price / size / tp1_done 三列数组。
+
+    对外表现得像 List[Entry]（len、迭代、下标、与 list 比较），迭代/下标返回的是
+    Entry 副本；修改只能通过 append / pop / take_tp1。first_exit() 对整本账一次
+    向量化计算 TP1/SL/TP2，并按“最新的 entry 优先、每根 bar 最多一个动作”的规则返回命中项。
+    """
+
+    __slots__ = ("_price", "_size", "_tp1", "_n", "_bounds")
+
+    def __init__(self, entries: Iterable[Entry] = ()):
+        entries = list(entries)
+        cap = max(8, len(entries))
+        self._price = np.empty(cap, dtype=np.float64)
+        self._size = np.empty(cap, dtype=np.float64)
+        self._tp1 = np.zeros(cap, dtype=bool)
+        self._n = 0
+        self._bounds: Optional[Tuple[float, float, float, float]] = None
+        for e in entries:
+            self.add(e.price, e.size, e.tp1_done)
+
+    # ---- list 兼容接口 ----
+    def __len__(self) -> int:
+        return self._n
+
+    def __iter__(self) -> Iterator[Entry]:
+        for i in range(self._n):
+            yield self._entry(i)
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Entry, List[Entry]]:
+        if isinstance(i, slice):
+            return [self._entry(j) for j in range(*i.indices(self._n))]
+        return self._entry(self._index(i))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (EntryBook, list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"EntryBook({list(self)!r})"
+
+    def _index(self, i: int) -> int:
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError("entry index out of range")
+        return i
+
+    def _entry(self, i: int) -> Entry:
+        return Entry(price=float(self._price[i]), size=float(self._size[i]), tp1_done=bool(self._tp1[i]))
+
+    # ---- 列视图 ----
+    @property
+    def prices(self) -> np.ndarray:
+        return self._price[: self._n]
+
+    @property
+    def sizes(self) -> np.ndarray:
+        return self._size[: self._n]
+
+    @property
+    def tp1_done(self) -> np.ndarray:
+        return self._tp1[: self._n]
+
+    # ---- 修改 ----
+    def add(self, price: float, size: float, tp1_done: bool = False) -> None:
+        n = self._n
+        if n == self._price.shape[0]:
+            cap = 2 * n
+            self._price = np.resize(self._price, cap)
+            self._size = np.resize(self._size, cap)
+            self._tp1 = np.resize(self._tp1, cap)
+        self._price[n] = price
+        self._size[n] = size
+        self._tp1[n] = tp1_done
+        self._n = n + 1
+        self._bounds = None
+
+    def append(self, entry: Entry) -> None:
+        self.add(entry.price, entry.size, entry.tp1_done)
+
+    def pop(self, i: int = -1) -> Entry:
+        i = self._index(i)
+        entry = self._entry(i)
+        n = self._n
+        self._price[i:n - 1] = self._price[i + 1:n]
+        self._size[i:n - 1] = self._size[i + 1:n]
+        self._tp1[i:n - 1] = self._tp1[i + 1:n]
+        self._n = n - 1
+        self._bounds = None
+        return entry
+
+    def take_tp1(self, i: int, sell_prop: float) -> float:
+        """第 i 笔执行 TP1：标记 tp1_done，扣减并返回平掉的数量。"""
+        i = self._index(i)
+        size = float(self._size[i])
+        sell_size = size * sell_prop
+        self._size[i] = size - sell_size
+        self._tp1[i] = True
+        self._bounds = None
+        return sell_size
+
+    # ---- 止盈止损 ----
+    def _ladder_bounds(self) -> Tuple[float, float, float, float]:
+        # 未做 TP1 的最低/最高价、已做 TP1 的最低/最高价；多头 pnl 随开仓价单调递减、空头单调递增
+        if self._bounds is None:
+            price = self.prices
+            done = self.tp1_done
+            open_px = price[~done]
+            done_px = price[done]
+            self._bounds = (
+                float(open_px.min()) if open_px.size else _INF,
+                float(open_px.max()) if open_px.size else -_INF,
+                float(done_px.min()) if done_px.size else _INF,
+                float(done_px.max()) if done_px.size else -_INF,
+            )
+        return self._bounds
+
+    def _may_fire(self, price: float, side: str, tp1_pct: float, sl_pct: float, tp2_pct: float) -> bool:
+        open_lo, open_hi, done_lo, done_hi = self._ladder_bounds()
+        if side == "long":
+            if open_lo != _INF and price / open_lo - 1.0 >= tp1_pct:
+                return True
+            if done_lo != _INF and price / done_lo - 1.0 >= tp2_pct:
+                return True
+            worst = max(open_hi, done_hi)
+            return sl_pct > 0 and price / worst - 1.0 <= -sl_pct
+        if open_hi != -_INF and open_hi / price - 1.0 >= tp1_pct:
+            return True
+        if done_hi != -_INF and done_hi / price - 1.0 >= tp2_pct:
+            return True
+        worst = min(open_lo, done_lo)
+        return sl_pct > 0 and worst / price - 1.0 <= -sl_pct
+
+    def first_exit(
+        self,
+        price: float,
+        side: str,
+        tp1_pct: float,
+        sl_pct: float,
+        tp2_pct: float,
+    ) -> Optional[Tuple[int, str]]:
+        """
+        返回 (下标, "tp1" | "sl" | "tp2")：从最新的 entry 往前第一笔触发的规则，
+        同一笔内按 TP1 -> SL -> TP2 的优先级；都不触发时返回 None。
+        """
+        if self._n == 0 or not self._may_fire(price, side, tp1_pct, sl_pct, tp2_pct):
+            return None
+        return ladder_exit(self.prices, self.tp1_done, price, side, tp1_pct, sl_pct, tp2_pct)
+
+    def next_candidate(
+        self,
+        high: np.ndarray,
+        low: np.ndarray,
+        side: str,
+        tp1_pct: float,
+        sl_pct: float,
+        tp2_pct: float,
+    ) -> int:
+        """
+        在一段 K 线里找第一根可能触发 TP1/SL/TP2 的 bar（与 first_exit 的预检查逐元素一致），
+        没有则返回 -1。止盈看有利方向的极值、止损看不利方向的极值；只按收盘价判断时
+        high 和 low 都传收盘价。账本不变时，此前的 bar 都不会产生动作，回测可以直接跳过。
+        """
+        if self._n == 0 or len(high) == 0:
+            return -1
+        open_lo, open_hi, done_lo, done_hi = self._ladder_bounds()
+        mask = np.zeros(len(high), dtype=bool)
+        if side == "long":
+            if open_lo != _INF:
+                mask |= take_profit_mask(open_lo, high, "long", tp1_pct)
+            if done_lo != _INF:
+                mask |= take_profit_mask(done_lo, high, "long", tp2_pct)
+            mask |= stop_loss_mask(max(open_hi, done_hi), low, "long", sl_pct)
+        else:
+            if open_hi != -_INF:
+                mask |= take_profit_mask(open_hi, low, "short", tp1_pct)
+            if done_hi != -_INF:
+                mask |= take_profit_mask(done_hi, low, "short", tp2_pct)
+            mask |= stop_loss_mask(min(open_lo, done_lo), high, "short", sl_pct)
+        return first_hit(mask)
+
+    def touched(
+        self,
+        high: float,
+        low: float,
+        side: str,
+        tp1_pct: float,
+        sl_pct: float,
+        tp2_pct: float,
+        rules: Tuple[str, ...],
+    ) -> Optional[Tuple[int, str]]:
+        """按一根 K 线的高低点判断 rules 中哪条规则被触及（优先级同 first_exit）。"""
+        if self._n == 0:
+            return None
+        favorable, adverse = (high, low) if side == "long" else (low, high)
+        return ladder_exit(
+            self.prices, self.tp1_done, favorable, side, tp1_pct, sl_pct, tp2_pct, sl_price=adverse, rules=rules
+        )
+
+    def trigger_levels(self, side: str, tp1_pct: float, sl_pct: float, tp2_pct: float) -> Tuple[float, float]:
+        """
+        (上涨触发价, 下跌触发价)：价格涨到前者或跌到后者时至少有一条规则触发；
+        没有对应规则时分别为 inf / -inf。
+        """
+        open_lo, open_hi, done_lo, done_hi = self._ladder_bounds()
+        if side == "long":
+            up = min(open_lo * (1.0 + tp1_pct), done_lo * (1.0 + tp2_pct))
+            down = max(open_hi, done_hi) * (1.0 - sl_pct) if sl_pct > 0 and self._n else -_INF
+            return up, down
+        up = min(open_lo, done_lo) / (1.0 - sl_pct) if 0 < sl_pct < 1 and self._n else _INF
+        down = max(open_hi / (1.0 + tp1_pct), done_hi / (1.0 + tp2_pct))
+        return up, down
@@ -1,5 +1,10 @@
 # future_main.py
+import sys
+
 import backtrader as bt
+import pandas as pd
+from analytics import analyze
+from candle_store import is_columnar, load_columnar
 from future_strategy import BTCMaBreakoutTP   
 
 
@@ -27,19 +32,45 @@ class CryptoCSVData(bt.feeds.GenericCSVData):
     )
 
 
+def make_data_feed(path: str):
+    """
+    path 为 CSV 文件时走 CryptoCSVData；为 candle_store.save_columnar 写出的
+    列式目录时直接 memmap 读取，跳过逐行 strptime。
+    """
+    if not is_columnar(path):
+        return CryptoCSVData(dataname=path)
+    cols = load_columnar(path)
+    df = pd.DataFrame(
+        {k: cols[k] for k in ("open", "high", "low", "close", "volume")},
+        index=pd.to_datetime(cols["timestamp"], unit="ms"),
+    )
+    return bt.feeds.PandasData(
+        dataname=df,
+        openinterest=None,
+        timeframe=bt.TimeFrame.Days,
+        compression=1,
+    )
+
+
 def run_backtest(
     csv_path: str,
     init_cash: float = 10_000.0,
     commission: float = 0.001,  # 0.1%
     slippage_perc: float = 0.0, # 可自行设置模拟滑点
-):
+    plot: bool = True,
+) -> dict:
+    """
+    跑一次 backtrader 回测，打印并返回 analytics.analyze 的绩效指标。
+    plot=False 为无界面模式：不挂观察者、不画图，适合参数扫描和 CI。
+    """
     cerebro = bt.Cerebro(stdstats=False)
-    # 只添加账户价值观察者，不添加回撤观察者
-    cerebro.addobserver(bt.observers.Value)
-    # 添加买卖点观察者
-    cerebro.addobserver(bt.observers.BuySell)
+    if plot:
+        # 只添加账户价值观察者，不添加回撤观察者
+        cerebro.addobserver(bt.observers.Value)
+        # 添加买卖点观察者
+        cerebro.addobserver(bt.observers.BuySell)
 
-    data = CryptoCSVData(dataname=csv_path)
+    data = make_data_feed(csv_path)
     cerebro.adddata(data)
 
     cerebro.broker.setcash(init_cash)
@@ -62,12 +93,6 @@ def run_backtest(
         csv_output="okx/backtest_trades.csv"
     )
 
-    # 分析器
-    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name="sharpe", timeframe=bt.TimeFrame.Days, annualize=True)
-    cerebro.addanalyzer(bt.analyzers.DrawDown, _name="dd")
-    cerebro.addanalyzer(bt.analyzers.Returns, _name="rets", timeframe=bt.TimeFrame.Days)
-    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name="trades")
-
     print("===== Backtest Start =====")
     print(f"CSV: {csv_path}")
     print(f"Initial Cash: {init_cash:.2f}, Commission: {commission}, Slippage: {slippage_perc}")
@@ -76,33 +101,29 @@ def run_backtest(
     results = cerebro.run()
     strat = results[0]
 
-    final_value = cerebro.broker.getvalue()
-    sharpe = strat.analyzers.sharpe.get_analysis()
-    dd = strat.analyzers.dd.get_analysis()
-    rets = strat.analyzers.rets.get_analysis()
-    trades = strat.analyzers.trades.get_analysis()
+    # 绩效指标在回测结束后对权益曲线和成交列表一次性计算（Crypto 365天/年），不再挂逐 bar 的 analyzer
+    stats = analyze(strat.equity, strat.fills, init_cash, bars_per_year=365.0)
+
+    def fmt(value, spec: str) -> str:
+        return "N/A" if value is None else format(value, spec)
 
     print("\n===== Summary =====")
-    print(f"Final Value: {final_value:.4f}")
-    
-    # 手动计算更直观的百分比收益率（Crypto 365天/年）
-    total_return_pct = (final_value / init_cash - 1) * 100
-    
-    # 获取总天数
-    days_passed = len(data)
-    if days_passed > 0:
-        annual_return_pct = ((1 + total_return_pct/100) ** (365 / days_passed) - 1) * 100
-    else:
-        annual_return_pct = 0
-        
-    max_drawdown = dd.get('max', {}).get('drawdown', 0)
-    sharpe_ratio = sharpe.get('sharperatio', 0)
-    
-    print(f"Total Return: {total_return_pct:.4f} %")
-    print(f"Annual Return: {annual_return_pct:.4f} %")
-    print(f"Max Drawdown: {max_drawdown:.4f} %")
-    print(f"Sharpe: {sharpe_ratio:.4f}" if sharpe_ratio is not None else "Sharpe: N/A")
-    
+    print(f"Final Value: {cerebro.broker.getvalue():.4f}")
+    print(f"Total Return: {stats['total_return_pct']:.4f} %")
+    print(f"Annual Return: {stats['annual_return_pct']:.4f} %")
+    print(f"Max Drawdown: {stats['max_drawdown']:.4f} % ({stats['max_drawdown_bars']} bars)")
+    print(f"Sharpe: {fmt(stats['sharpe'], '.4f')}")
+    print(f"Sortino: {fmt(stats['sortino'], '.4f')}")
+    print(f"Exposure: {stats['exposure_pct']:.2f} %")
+    print(
+        f"Trades: {stats['trades']} (won {stats['won']}, lost {stats['lost']}, "
+        f"win rate {fmt(stats['win_rate_pct'], '.2f')} %)"
+    )
+    print(
+        f"Avg Trade PnL: {fmt(stats['avg_trade_pnl'], '.2f')} | Profit Factor: {fmt(stats['profit_factor'], '.2f')} "
+        f"| Avg Bars Held: {fmt(stats['avg_bars_held'], '.1f')}"
+    )
+
     # 统计交易次数
     print(f"Long Trades (Completed): {strat.completed_long_trades}")
     print(f"Short Trades (Completed): {strat.completed_short_trades}")
@@ -110,7 +131,9 @@ def run_backtest(
     print("===================")
 
     # 画图
-    cerebro.plot(style="candlestick", iplot=False)
+    if plot:
+        cerebro.plot(style="candlestick", iplot=False)
+    return stats
 
 
 if __name__ == "__main__":
@@ -122,4 +145,5 @@ if __name__ == "__main__":
         init_cash=80000.0,
         commission=0.0005,
         slippage_perc=0.0003,
+        plot="--headless" not in sys.argv[1:],
     )
@@ -1,54 +1,50 @@
+from dataclasses import asdict
+
 import backtrader as bt
-from stop_utils import should_stop_loss
+from entry_book import EntryBook
+from rule_core import SIGNAL_SPEC, decide, entry_signal, spec_periods
+from strategy_engine import StrategyParams
 
 
 class BTCMaBreakoutTP(bt.Strategy):
     """
-    多空双向均线突破策略：
-    - 多头：价格上穿 MA5 且上穿 MA10 -> 做多 (1x)
-    - 空头：价格下穿 MA5 且下穿 MA10 -> 做空 (1x)
-    - 止盈：每一笔仓位独立计算，TP1 (6%) 平一半，TP2 (12%) 全平
+    多空双向均线突破策略（rule_core 的 backtrader 适配层）：
+    - 多头：价格上穿 MA(ma_fast) 且上穿 MA(ma_slow)，且在 MA120 之上 -> 做多 (1x)
+    - 空头：价格下穿 MA(ma_fast) 且下穿 MA(ma_slow)，且在 MA120 之下 -> 做空 (1x)
+    - 止盈止损：每一笔仓位独立计算，TP1 平 tp1_sell_prop，SL / TP2 全平
+    - 信号条件由 params.signal_spec 声明，只构建其中引用到的指标
     """
 
+    # 参数默认值与实盘引擎 (strategy_engine.StrategyParams) 一致
     params = dict(
-        ma_fast=5,
-        ma_slow=10,
-        buy_pct=0.05,          # 每次做多/做空占用当前总资产的比例
-        tp1_pct=0.05,        # +4% (多头盈利) 或 -4% (空头价格下跌盈利)
-        tp2_pct=0.08,        # +8%
-        sl_pct=0.18,         # -5% 止损
-        tp1_sell_prop=0.9,   # 第一段止盈平掉该仓位的比例
+        **{k: v for k, v in asdict(StrategyParams()).items() if k != "exit_mode"},
         printlog=False,      # 默认关闭打印
         csv_output="trades.csv", # 交易记录输出路径
+        signal_spec=SIGNAL_SPEC, # 入场规则，见 rule_core.SIGNAL_SPEC
     )
 
     def __init__(self):
         self.close = self.datas[0].close
 
-        self.ma5 = bt.indicators.SimpleMovingAverage(self.close, period=self.p.ma_fast)
-        self.ma10 = bt.indicators.SimpleMovingAverage(self.close, period=self.p.ma_slow)
-        self.ma20= bt.indicators.SimpleMovingAverage(self.close, period=20)
-        self.ma240= bt.indicators.SimpleMovingAverage(self.close, period=240)
-        self.ma60= bt.indicators.SimpleMovingAverage(self.close, period=60)
-        self.ma120= bt.indicators.SimpleMovingAverage(self.close, period=120)
-        self.ma180= bt.indicators.SimpleMovingAverage(self.close, period=180)
-        self.ma30= bt.indicators.SimpleMovingAverage(self.close, period=30)
-
-        # 信号指标
-        self.cross_ma5 = bt.indicators.CrossOver(self.close, self.ma5, plot=False)
-        self.cross_ma10 = bt.indicators.CrossOver(self.close, self.ma10, plot=False)
-
-        self.cross_ma20 = bt.indicators.CrossOver(self.close, self.ma20, plot=False)
-        
+        # 只构建 signal_spec 实际引用到的 SMA，同一周期只建一次，预热长度也只取决于用到的最长周期
+        self.smas = {
+            period: bt.indicators.SimpleMovingAverage(self.close, period=period)
+            for period in spec_periods(self.p.signal_spec, self.p)
+        }
 
         self.order = None
 
-        # 交易状态：支持多空双向加仓
-        self.long_entries = []   # 做多仓位列表
-        self.short_entries = []  # 做空仓位列表
+        # 交易状态：支持多空双向加仓（price / size / tp1_done 按列存储）
+        self.long_entries = EntryBook()   # 做多仓位
+        self.short_entries = EntryBook()  # 做空仓位
 
         # 用于保存交易记录
         self.trade_logs = []
+        self.actions = []  # (bar 下标, op)，供 parity.py 与引擎对比
+        # 每根 bar 的账户价值与成交（同 strategy_engine.backtest 的 fills 格式），供 analytics.analyze 统计
+        self.equity = []
+        self.fills = []
+        self.order_op = None
         self.completed_long_trades = 0
         self.completed_short_trades = 0
 
@@ -75,6 +71,14 @@ class BTCMaBreakoutTP(bt.Strategy):
                 "commission": order.executed.comm,
                 "pnl": order.executed.pnl
             })
+            self.fills.append({
+                "bar": len(self.data) - 1,
+                "op": self.order_op,
+                "side": "buy" if order.isbuy() else "sell",
+                "size": abs(order.executed.size),
+                "price": order.executed.price,
+                "commission": order.executed.comm,
+            })
 
             self.log(
                 f"{type_str} executed price={order.executed.price:.2f}, "
@@ -86,7 +90,11 @@ class BTCMaBreakoutTP(bt.Strategy):
 
         self.order = None
 
+    def prenext(self):
+        self.equity.append(self.broker.getvalue())
+
     def next(self):
+        self.equity.append(self.broker.getvalue())
         if self.order:
             return
 
@@ -94,99 +102,39 @@ class BTCMaBreakoutTP(bt.Strategy):
         if price <= 0:
             return
 
-        # ====== 信号检测 ======
-        # 1. 做多信号：上穿 MA10 和 MA20 且价格在 MA120 之下
-        if self.cross_ma10[0] > 0 and self.cross_ma20[0] > 0 and price > self.ma120[0]:
-            total_value = self.broker.getvalue()
-            buy_amount = total_value * self.p.buy_pct
-            size_btc = buy_amount / price
-            
-            if self.broker.getcash() >= buy_amount:
-                self.log(f"SIGNAL LONG: price={price:.2f}, amount={buy_amount:.2f}")
-                self.order = self.buy(size=size_btc)
-                # 记录这笔多单条目
-                self.long_entries.append({
-                    'price': price,
-                    'size': size_btc,
-                    'tp1_done': False
-                })
-                return
-
-        # 2. 做空信号：下穿 MA10 和 MA20 且价格在 MA120 之上
-        if self.cross_ma10[0] < 0 and self.cross_ma20[0] < 0 and price < self.ma120[0]:
-            total_value = self.broker.getvalue()
-            sell_amount = total_value * self.p.buy_pct
-            size_btc = sell_amount / price
-            
-            # 1倍做空模拟：卖出 size_btc (即使无持仓也会产生负持仓)
-            self.log(f"SIGNAL SHORT: price={price:.2f}, amount={sell_amount:.2f}")
-            self.order = self.sell(size=size_btc)
-            # 记录这笔空单条目
-            self.short_entries.append({
-                'price': price,
-                'size': size_btc,
-                'tp1_done': False
-            })
+        # 信号与止盈止损阶梯都由 rule_core 决定，与实盘 process_bar、向量化回测同一份规则
+        prev_price = float(self.close[-1])
+        smas = {period: (line[0], line[-1]) for period, line in self.smas.items()}
+        spec = self.p.signal_spec
+        action = decide(
+            self.p,
+            self.long_entries,
+            self.short_entries,
+            price,
+            entry_signal(spec.get("long", ()), price, prev_price, smas, self.p),
+            entry_signal(spec.get("short", ()), price, prev_price, smas, self.p),
+            self.broker.getvalue(),
+            self.broker.getcash(),
+        )
+        if action is None:
             return
 
-        # ====== 止盈 / 止损管理 (多头) ======
-        for i in range(len(self.long_entries) - 1, -1, -1):
-            entry = self.long_entries[i]
-            pnl_pct = (price / entry['price']) - 1.0
-
-            # 1) TP1: 小止盈优先，先平一半
-            if (not entry['tp1_done']) and pnl_pct >= self.p.tp1_pct:
-                sell_btc = entry['size'] * self.p.tp1_sell_prop
-                self.log(f"LONG TP1 HIT @ {entry['price']:.2f}")
-                entry['tp1_done'] = True
-                entry['size'] -= sell_btc
-                self.order = self.sell(size=sell_btc)
-                return
-
-            # 2) SL: 小止盈之后再看止损
-            if should_stop_loss(entry['price'], price, "long", self.p.sl_pct):
-                self.log(f"LONG SL HIT @ {entry['price']:.2f}")
-                self.order = self.sell(size=entry['size'])
-                self.long_entries.pop(i)
-                return
-
-            # 3) TP2: 只有在已经做过 TP1 后，才允许全平
-            if entry['tp1_done'] and pnl_pct >= self.p.tp2_pct:
-                self.log(f"LONG TP2 HIT @ {entry['price']:.2f}")
-                self.order = self.sell(size=entry['size'])
-                self.long_entries.pop(i)
+        op, side, size, _ = action
+        self.actions.append((len(self.data) - 1, op))
+        if op == "open_long":
+            self.log(f"SIGNAL LONG: price={price:.2f}, amount={size * price:.2f}")
+        elif op == "open_short":
+            # 1倍做空模拟：卖出 size (即使无持仓也会产生负持仓)
+            self.log(f"SIGNAL SHORT: price={price:.2f}, amount={size * price:.2f}")
+        else:
+            rule, book_side = op.split("_")
+            self.log(f"{book_side.upper()} {rule.upper()} HIT @ {price:.2f}")
+            if op == "tp2_long":
                 self.completed_long_trades += 1
-                return
-
-        # ====== 止盈 / 止损管理 (空头) ======
-        for i in range(len(self.short_entries) - 1, -1, -1):
-            entry = self.short_entries[i]
-            # 空头盈利计算：(开仓价 / 当前价) - 1
-            pnl_pct = (entry['price'] / price) - 1.0
-
-            # 1) TP1: 小止盈优先，先平一半空单
-            if (not entry['tp1_done']) and pnl_pct >= self.p.tp1_pct:
-                buy_btc = entry['size'] * self.p.tp1_sell_prop
-                self.log(f"SHORT TP1 HIT @ {entry['price']:.2f}")
-                entry['tp1_done'] = True
-                entry['size'] -= buy_btc
-                self.order = self.buy(size=buy_btc)
-                return
-
-            # 2) SL: 小止盈之后再看止损 (买入回补)
-            if should_stop_loss(entry['price'], price, "short", self.p.sl_pct):
-                self.log(f"SHORT SL HIT @ {entry['price']:.2f}")
-                self.order = self.buy(size=entry['size'])
-                self.short_entries.pop(i)
-                return
-
-            # 3) TP2: 只有在已经做过 TP1 后，才允许全平
-            if entry['tp1_done'] and pnl_pct >= self.p.tp2_pct:
-                self.log(f"SHORT TP2 HIT @ {entry['price']:.2f}")
-                self.order = self.buy(size=entry['size'])
-                self.short_entries.pop(i)
+            elif op == "tp2_short":
                 self.completed_short_trades += 1
-                return
+        self.order_op = op
+        self.order = self.buy(size=size) if side == "buy" else self.sell(size=size)
 
     def stop(self):
         self.log(
@@ -194,7 +142,7 @@ class BTCMaBreakoutTP(bt.Strategy):
         )
         
         # 将交易记录保存到 CSV
-        if self.trade_logs:
+        if self.trade_logs and self.p.csv_output:
             import pandas as pd
             df = pd.DataFrame(self.trade_logs)
             df.to_csv(self.p.csv_output, index=False)
@@ -0,0 +1,203 @@
+import math
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional, Sequence, Tuple
+
+
+@dataclass
+class RollingSMA:
+    """
+    Streaming simple moving average kept as a running sum.
+
+    push/replace_last are O(1); the sum is re-derived with math.fsum once every
+    `period` updates so floating point drift stays bounded.
+    """
+
+    period: int
+    window: Deque[float] = field(default_factory=deque)
+    total: float = 0.0
+    value: Optional[float] = None
+    prev_value: Optional[float] = None
+    updates: int = 0
+
+    @property
+    def ready(self) -> bool:
+        return len(self.window) >= self.period
+
+    def _refresh(self) -> None:
+        self.updates += 1
+        if self.updates >= self.period:
+            self.total = math.fsum(self.window)
+            self.updates = 0
+        self.value = self.total / self.period if self.ready else None
+
+    def push(self, x: float) -> Optional[float]:
+        self.prev_value = self.value
+        self.window.append(x)
+        self.total += x
+        if len(self.window) > self.period:
+            self.total -= self.window.popleft()
+        self._refresh()
+        return self.value
+
+    def replace_last(self, x: float) -> Optional[float]:
+        if not self.window:
+            return self.push(x)
+        old = self.window[-1]
+        self.window[-1] = x
+        self.total += x - old
+        self._refresh()
+        return self.value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "period": self.period,
+            "window": list(self.window),
+            "total": self.total,
+            "value": self.value,
+            "prev_value": self.prev_value,
+            "updates": self.updates,
+        }
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> "RollingSMA":
+        return cls(
+            period=int(raw["period"]),
+            window=deque(float(x) for x in raw.get("window", [])),
+            total=float(raw.get("total", 0.0)),
+            value=raw.get("value"),
+            prev_value=raw.get("prev_value"),
+            updates=int(raw.get("updates", 0)),
+        )
+
+
+@dataclass
+class SignalIndicators:
+    """
+    Warm indicator state for StrategyState.process_bar: fast/slow/trend SMAs
+    plus the last two closes, keyed by the timestamp of the newest bar seen.
+    """
+
+    fast: RollingSMA
+    slow: RollingSMA
+    trend: RollingSMA
+    last_ts: Optional[int] = None
+    last_close: Optional[float] = None
+    prev_close: Optional[float] = None
+
+    @classmethod
+    def create(cls, ma_fast: int, ma_slow: int, ma_trend: int) -> "SignalIndicators":
+        return cls(fast=RollingSMA(ma_fast), slow=RollingSMA(ma_slow), trend=RollingSMA(ma_trend))
+
+    @classmethod
+    def from_closes(
+        cls,
+        ma_fast: int,
+        ma_slow: int,
+        ma_trend: int,
+        closes: Sequence[float],
+        last_ts: Optional[int],
+    ) -> "SignalIndicators":
+        ind = cls.create(ma_fast, ma_slow, ma_trend)
+        warmup = max(ma_fast, ma_slow, ma_trend) + 1
+        for x in closes[-warmup:]:
+            ind._push(float(x))
+        ind.last_ts = last_ts
+        return ind
+
+    def matches(self, ma_fast: int, ma_slow: int, ma_trend: int) -> bool:
+        return (self.fast.period, self.slow.period, self.trend.period) == (ma_fast, ma_slow, ma_trend)
+
+    @property
+    def ready(self) -> bool:
+        return (
+            self.last_ts is not None
+            and self.prev_close is not None
+            and self.fast.ready
+            and self.slow.ready
+            and self.trend.ready
+            and self.fast.prev_value is not None
+            and self.slow.prev_value is not None
+        )
+
+    def _push(self, x: float) -> None:
+        self.prev_close = self.last_close
+        self.last_close = x
+        self.fast.push(x)
+        self.slow.push(x)
+        self.trend.push(x)
+
+    def _replace_last(self, x: float) -> None:
+        self.last_close = x
+        self.fast.replace_last(x)
+        self.slow.replace_last(x)
+        self.trend.replace_last(x)
+
+    def advance(self, prev_ts: int, last_ts: int, prev_close: float, last_close: float) -> bool:
+        """
+        Feed the two newest bars of a frame. Returns False when the frame does
+        not continue the stored state (gap, reorder, cold) and a rebuild from
+        the full frame is needed.
+        """
+        if not self.ready:
+            return False
+        if last_ts == self.last_ts:
+            # 同一根 K 线被重新评估（未收盘 bar），只替换最新收盘价
+            self._replace_last(last_close)
+            return True
+        if prev_ts == self.last_ts:
+            # 上一根 bar 可能在上次运行时还未确认，先用最终收盘价修正再推进
+            self._replace_last(prev_close)
+            self._push(last_close)
+            self.last_ts = last_ts
+            return True
+        return False
+
+    def snapshot(self) -> Tuple[float, float, float, float, float, float, float]:
+        return (
+            float(self.last_close),
+            float(self.prev_close),
+            float(self.fast.value),
+            float(self.fast.prev_value),
+            float(self.slow.value),
+            float(self.slow.prev_value),
+            float(self.trend.value),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "fast": self.fast.to_dict(),
+            "slow": self.slow.to_dict(),
+            "trend": self.trend.to_dict(),
+            "last_ts": self.last_ts,
+            "last_close": self.last_close,
+            "prev_close": self.prev_close,
+        }
+
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> "SignalIndicators":
+        return cls(
+            fast=RollingSMA.from_dict(raw["fast"]),
+            slow=RollingSMA.from_dict(raw["slow"]),
+            trend=RollingSMA.from_dict(raw["trend"]),
+            last_ts=raw.get("last_ts"),
+            last_close=raw.get("last_close"),
+            prev_close=raw.get("prev_close"),
+        )
+
+
+def sma(values: "np.ndarray", period: int) -> "np.ndarray":
+    """
+    Full-array SMA aligned like pandas rolling(period).mean(): the first
+    period-1 slots are NaN. Each window is summed independently, so long
+    minute series do not accumulate cumsum drift.
+    """
+    import numpy as np
+
+    x = np.asarray(values, dtype=np.float64)
+    out = np.full(x.shape[0], np.nan)
+    if period <= 0 or x.shape[0] < period:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(x, period)
+    out[period - 1:] = windows.mean(axis=1)
+    return out
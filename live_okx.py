@@ -1,12 +1,26 @@
+from __future__ import annotations
+
+import hashlib
 import os
+import re
 import sys
+import threading
 import time
+from datetime import datetime
+from typing import TYPE_CHECKING
 
-import ccxt
-import pandas as pd
+import numpy as np
 
-from strategy_engine import Entry, StrategyParams, StrategyState
+from candle_store import CandleStore, candles_from_rows
+from checkpoint import StateCheckpoint
+from market_cache import MarketCache
+from strategy_engine import Entry, StrategyParams, StrategyState, ohlcv_column
+from trade_ledger import TradeLedger
+from tracing import RunTracer
 
+if TYPE_CHECKING:
+    import ccxt
+    import pandas as pd
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 OKX_DIR = os.path.join(BASE_DIR, "okx")
@@ -24,7 +38,9 @@ PASSWORD = os.getenv("OKX_PASSPHRASE")
 # 现货
 # SYMBOL = "BTC/USDT"
 # TIMEFRAME = "1d"
-# STATE_PATH = os.path.join(os.path.dirname(__file__), "state.json")
+STATE_PATH = os.getenv("STATE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "state.json"))
+# 检查点编码：json 或 binary（多 entry / 多合约时更紧凑）
+STATE_FORMAT = os.getenv("STATE_FORMAT", "json")
 
 # ✅  合约 symbol（USDT 本位永续）
 SYMBOL = "BTC/USDT:USDT"
@@ -36,6 +52,22 @@ HEDGE_MODE = True
 SANDBOX_MODE = True
 PROXY_URL = None
 
+# OKX 批量下单单次最多 20 笔
+BATCH_ORDER_LIMIT = 20
+
+# 合约元数据本地缓存（与 state.json 同目录），默认 7 天有效。TTL 要远大于每天一次的 cron 间隔：
+# 等于 24 小时时，第二天的运行稍晚几分钟启动就会碰到刚过期的缓存而全量 load_markets；
+# 过了一半 TTL 后由后台线程刷新，保持缓存新鲜
+MARKETS_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "markets_cache.json")
+MARKETS_CACHE_TTL = float(os.getenv("MARKETS_CACHE_TTL", str(7 * 24 * 3600)))
+
+# 本地 K 线仓库，只增量拉取新 bar
+CANDLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "candles")
+OHLCV_LIMIT = int(os.getenv("OHLCV_LIMIT", "300"))
+
+# 本地成交账本：已入账成交 + 每笔 entry 状态，同步时只拉新成交
+LEDGER_PATH = os.getenv("LEDGER_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ledger.sqlite3"))
+
 
 def create_strategy_state() -> StrategyState:
     params = StrategyParams(
@@ -46,11 +78,26 @@ def create_strategy_state() -> StrategyState:
         tp2_pct=float(os.getenv("TP2_PCT", "0.14")),
         sl_pct=float(os.getenv("SL_PCT", "0.18")),
         tp1_sell_prop=float(os.getenv("TP1_SELL_PROP", "0.9")),
+        exit_mode=os.getenv("EXIT_MODE", "close"),
     )
     return StrategyState(params=params)
 
 
-def create_exchange() -> ccxt.Exchange:
+def create_state_checkpoint() -> StateCheckpoint:
+    return StateCheckpoint(STATE_PATH, fmt=STATE_FORMAT)
+
+
+def load_strategy_state(checkpoint: StateCheckpoint | None, symbol: str = SYMBOL) -> StrategyState:
+    """从检查点恢复状态；参数始终以当前环境变量为准，entry、计数和指标预热状态取自检查点。"""
+    state = create_strategy_state()
+    saved = checkpoint.load(symbol) if checkpoint is not None else None
+    if saved is None:
+        return state
+    saved.params = state.params
+    return saved
+
+
+def _exchange_config() -> dict:
     if not API_KEY or not SECRET or not PASSWORD:
         raise ValueError("Missing OKX credentials: OKX_API_KEY / OKX_SECRET / OKX_PASSPHRASE")
 
@@ -70,28 +117,344 @@ def create_exchange() -> ccxt.Exchange:
     }
     if PROXY_URL:
         config["proxies"] = {"http": PROXY_URL, "https": PROXY_URL}
-    ex = ccxt.okx(
-        config
-    )
-    ex.set_sandbox_mode(SANDBOX_MODE)
+    return config
+
+
+_OKX_IMPORT_LOCK = threading.Lock()
+
+
+def okx_class(async_support: bool = False) -> type:
+    """
+    按需只加载 OKX 交易所类。ccxt/__init__.py 和 ccxt/async_support/__init__.py 会一次性导入
+    全部一百多个交易所（冷启动约 0.5s）：包还没被导入时，先登记一个不执行 __init__ 的包对象，
+    导入 OKX 子模块后再把它移出 sys.modules，之后的 `import ccxt` 照常完整初始化并复用已加载的子模块。
+    async 版的 ws 辅助模块依赖完整的 ccxt 包，所以只跳过 ccxt.async_support 的 __init__。
+
+    依赖 ccxt 4.x 的包布局（已在 4.5.87 上验证）：每个交易所一个 ccxt/<id>.py 与
+    ccxt/async_support/<id>.py，类名与模块名相同。布局变了导致按子模块导入失败时，
+    退回完整导入 ccxt 取 ccxt.okx，只是冷启动慢一些。
+    """
+    import importlib
+    import importlib.util
+
+    if async_support:
+        import ccxt  # noqa: F401
+        package, module = "ccxt.async_support", "ccxt.async_support.okx"
+    else:
+        package, module = "ccxt", "ccxt.okx"
+    with _OKX_IMPORT_LOCK:
+        loaded = sys.modules.get(module)
+        if loaded is not None and hasattr(loaded, "okx"):
+            return loaded.okx
+        if package not in sys.modules:
+            sys.modules[package] = importlib.util.module_from_spec(importlib.util.find_spec(package))
+            try:
+                return importlib.import_module(module).okx
+            except (ImportError, AttributeError):
+                pass
+            finally:
+                sys.modules.pop(package, None)
+        return importlib.import_module(package).okx
+
+
+def set_position_mode(exchange: ccxt.Exchange) -> None:
     try:
-        ex.set_position_mode(HEDGE_MODE)
+        exchange.set_position_mode(HEDGE_MODE)
     except Exception:
         pass
-    return ex
 
 
-def fetch_ohlcv_df(exchange: ccxt.Exchange) -> pd.DataFrame:
-    ohlcv = exchange.fetch_ohlcv(SYMBOL, timeframe=TIMEFRAME, limit=300)
-    df = pd.DataFrame(
-        ohlcv,
-        columns=["timestamp", "open", "high", "low", "close", "volume"],
+def create_exchange(set_mode: bool = True) -> ccxt.Exchange:
+    """set_mode=False 时不在这里设置持仓模式，由调用方在 tracer.instrument 内调用 set_position_mode。"""
+    ex = okx_class()(
+        _exchange_config()
     )
-    return df
+    ex.set_sandbox_mode(SANDBOX_MODE)
+    if set_mode:
+        set_position_mode(ex)
+    return ex
+
+
+def create_async_exchange():
+    ex = okx_class(async_support=True)(_exchange_config())
+    ex.set_sandbox_mode(SANDBOX_MODE)
+    return ex
+
+
+def create_market_cache() -> MarketCache:
+    return MarketCache(MARKETS_CACHE_PATH, ttl=MARKETS_CACHE_TTL, sandbox=SANDBOX_MODE)
+
+
+def create_trade_ledger() -> TradeLedger:
+    return TradeLedger(LEDGER_PATH)
+
+
+def load_public_markets() -> dict:
+    # 后台刷新用独立的公共实例，不与主线程共用已认证的 exchange 对象
+    config: dict = {"options": {"defaultType": "swap", "fetchCurrencies": False}}
+    if PROXY_URL:
+        config["proxies"] = {"http": PROXY_URL, "https": PROXY_URL}
+    ex = okx_class()(config)
+    ex.set_sandbox_mode(SANDBOX_MODE)
+    return ex.load_markets()
+
+
+def _raise_if_env_mismatch(e: Exception) -> None:
+    msg = str(e)
+    if "50101" in msg or "does not match current environment" in msg:
+        raise RuntimeError(
+            "OKX APIKey 环境不匹配：如果是模拟盘/DEMO key，请设置 OKX_SANDBOX=true；"
+            "如果是实盘 key，请设置 OKX_SANDBOX=false，并确保 key 来自对应环境。"
+            f" 原始错误：{msg}"
+        ) from e
+
+
+class ExchangeSession:
+    """
+    单次运行内的交易所快照：markets / balance / positions / trades 各只拉一次，
+    供 sync、下单、汇总各阶段共用；下单成功后只失效会被订单改变的部分。
 
+    symbols 可以传多个合约（组合运行）：markets 与 positions 一次批量拉取，
+    balance 全账户共用，trades 按 symbol 分别缓存。
 
-def get_account_value_and_cash(exchange: ccxt.Exchange, last_price: float) -> tuple[float, float]:
-    balance = exchange.fetch_balance()
+    传入 ledger 时 trades 只拉取账本最后一笔成交之后的新成交，入账后返回新增部分。
+    """
+
+    # OKX fills-history 单页最多 100 笔，新的在前
+    TRADES_LIMIT = 100
+
+    def __init__(
+        self,
+        exchange: ccxt.Exchange,
+        symbol: str = SYMBOL,
+        market_cache: MarketCache | None = None,
+        symbols: list[str] | None = None,
+        ledger: TradeLedger | None = None,
+    ):
+        self.exchange = exchange
+        self.symbols = list(symbols) if symbols else [symbol]
+        self.symbol = self.symbols[0]
+        self.market_cache = market_cache
+        self.ledger = ledger
+        self._cache: dict = {}
+        # 最近一次拉取失败、缓存里只是空结果占位的 key（"positions" / "trades"）
+        self.failed: set[str] = set()
+
+    def _get(self, key, loader):
+        if key not in self._cache:
+            self._cache[key] = loader()
+        return self._cache[key]
+
+    def invalidate(self, *keys: str) -> None:
+        for cached in list(self._cache):
+            name = cached[0] if isinstance(cached, tuple) else cached
+            if name in keys:
+                del self._cache[cached]
+
+    def markets(self) -> dict:
+        return self._get("markets", self._load_markets)
+
+    def _markets_from_cache(self) -> dict | None:
+        cache = self.market_cache
+        if cache is None:
+            return None
+        cached = cache.load(self.symbols)
+        if not cached:
+            return None
+        # 只注入用到的 symbol 的元数据，ccxt 后续 load_markets() 直接复用，不再下载
+        self.exchange.set_markets(list(cached.values()))
+        if cache.needs_refresh():
+            cache.refresh_async(load_public_markets, self.symbols)
+        return self.exchange.markets
+
+    def _remember_markets(self, markets: dict) -> dict:
+        if self.market_cache is not None:
+            try:
+                self.market_cache.save(markets, self.symbols)
+            except OSError:
+                pass
+        return markets
+
+    def _load_markets(self) -> dict:
+        markets = self._markets_from_cache()
+        if markets is not None:
+            return markets
+        try:
+            markets = self.exchange.load_markets()
+        except Exception as e:
+            _raise_if_env_mismatch(e)
+            raise
+        return self._remember_markets(markets)
+
+    def prime(self, **values) -> None:
+        self._cache.update(values)
+
+    async def markets_async(self) -> dict:
+        if "markets" not in self._cache:
+            markets = self._markets_from_cache()
+            if markets is None:
+                try:
+                    markets = await self.exchange.load_markets()
+                except Exception as e:
+                    _raise_if_env_mismatch(e)
+                    raise
+                self._remember_markets(markets)
+            self._cache["markets"] = markets
+        return self._cache["markets"]
+
+    async def refresh_async(self, *keys: str) -> None:
+        """并发拉取 balance / positions / trades（ccxt.async_support 交易所）。"""
+        import asyncio
+
+        keys = keys or ("balance", "positions", "trades")
+        requests = []
+        if "balance" in keys:
+            requests.append(("balance", self.exchange.fetch_balance()))
+        if "positions" in keys:
+            requests.append(("positions", self.exchange.fetch_positions(self.symbols)))
+        if "trades" in keys:
+            for sym in self.symbols:
+                requests.append((("trades", sym), self._fetch_trades_async(sym)))
+        results = await asyncio.gather(*(coro for _, coro in requests), return_exceptions=True)
+        for (key, _), result in zip(requests, results):
+            name = key[0] if isinstance(key, tuple) else key
+            if isinstance(result, Exception):
+                if key == "balance":
+                    raise result
+                self.failed.add(name)
+                result = []
+            else:
+                self.failed.discard(name)
+                if name == "trades" and self.ledger is not None:
+                    result = self.ledger.ingest(key[1], result, self.contract_size(key[1]))
+            self._cache[key] = result
+
+    def _older_page(self, batch: list[dict], since: int) -> dict | None:
+        """
+        传了 since 时 ccxt 不下发 limit，OKX 只返回 since 之后最新的一页。满页且最老一笔还在 since
+        之后，说明中间还有成交：用最老一笔的 billId 作为 after 继续往前翻，否则返回 None。
+        """
+        if len(batch) < self.TRADES_LIMIT:
+            return None
+        oldest = min(batch, key=lambda t: int(t.get("timestamp") or 0))
+        bill_id = (oldest.get("info") or {}).get("billId")
+        if not bill_id or int(oldest.get("timestamp") or 0) <= since:
+            return None
+        return {"after": bill_id}
+
+    def _fetch_trades(self, symbol: str) -> list[dict]:
+        since = self.ledger.since(symbol) if self.ledger is not None else None
+        if since is None:
+            return self.exchange.fetch_my_trades(symbol, limit=self.TRADES_LIMIT)
+        trades: list[dict] = []
+        params: dict | None = {}
+        while params is not None:
+            batch = self.exchange.fetch_my_trades(symbol, since=since, limit=self.TRADES_LIMIT, params=params)
+            trades.extend(batch)
+            params = self._older_page(batch, since)
+        return trades
+
+    async def _fetch_trades_async(self, symbol: str) -> list[dict]:
+        since = self.ledger.since(symbol) if self.ledger is not None else None
+        if since is None:
+            return await self.exchange.fetch_my_trades(symbol, limit=self.TRADES_LIMIT)
+        trades: list[dict] = []
+        params: dict | None = {}
+        while params is not None:
+            batch = await self.exchange.fetch_my_trades(symbol, since=since, limit=self.TRADES_LIMIT, params=params)
+            trades.extend(batch)
+            params = self._older_page(batch, since)
+        return trades
+
+    def market(self, symbol: str | None = None) -> dict:
+        symbol = symbol or self.symbol
+        return self.markets().get(symbol) or self.exchange.market(symbol)
+
+    def contract_size(self, symbol: str | None = None) -> float:
+        return float(self.market(symbol).get("contractSize", 1) or 1)
+
+    def balance(self) -> dict:
+        return self._get("balance", self.exchange.fetch_balance)
+
+    def positions(self, symbol: str | None = None) -> list[dict]:
+        def load() -> list[dict]:
+            try:
+                positions = self.exchange.fetch_positions(self.symbols)
+            except Exception:
+                self.failed.add("positions")
+                return []
+            self.failed.discard("positions")
+            return positions
+
+        positions = self._get("positions", load)
+        if len(self.symbols) == 1:
+            return positions
+        symbol = symbol or self.symbol
+        return [p for p in positions if p.get("symbol") == symbol]
+
+    def trades(self, symbol: str | None = None) -> list[dict]:
+        symbol = symbol or self.symbol
+
+        def load() -> list[dict]:
+            try:
+                trades = self._fetch_trades(symbol)
+            except Exception:
+                return []
+            if self.ledger is not None:
+                return self.ledger.ingest(symbol, trades, self.contract_size(symbol))
+            return trades
+
+        return self._get(("trades", symbol), load)
+
+    def recent_trades(self, symbol: str | None = None, n: int = 10) -> list[dict]:
+        symbol = symbol or self.symbol
+        trades = self.trades(symbol)
+        if self.ledger is not None:
+            return self.ledger.recent_fills(symbol, n)
+        return sorted(trades, key=lambda x: x.get("timestamp") or 0)[-n:]
+
+    def order_placed(self) -> None:
+        self.invalidate("balance", "positions", "trades")
+
+
+def _candles_to_df(tail) -> pd.DataFrame:
+    import pandas as pd
+
+    return pd.DataFrame({name: tail[name] for name in tail.dtype.names}, copy=False)
+
+
+def fetch_ohlcv_bars(
+    exchange: ccxt.Exchange,
+    store: CandleStore | None = None,
+    limit: int = 300,
+    symbol: str = SYMBOL,
+) -> np.ndarray:
+    """
+    最新 limit 根 K 线，CANDLE_DTYPE 结构化数组（有 store 时是 memmap 的零拷贝视图）。
+    process_bar 直接按列读取，实盘决策路径不需要 pandas。
+    """
+    if store is not None:
+        return store.sync(exchange, symbol, TIMEFRAME, limit=limit)
+    return candles_from_rows(exchange.fetch_ohlcv(symbol, timeframe=TIMEFRAME, limit=limit))
+
+
+def fetch_ohlcv_df(
+    exchange: ccxt.Exchange,
+    store: CandleStore | None = None,
+    limit: int = 300,
+    symbol: str = SYMBOL,
+) -> pd.DataFrame:
+    """fetch_ohlcv_bars 的 DataFrame 版本，供需要 pandas 的分析脚本使用。"""
+    return _candles_to_df(fetch_ohlcv_bars(exchange, store, limit, symbol))
+
+
+def get_account_value_and_cash(
+    exchange: ccxt.Exchange,
+    last_price: float,
+    session: ExchangeSession | None = None,
+) -> tuple[float, float]:
+    session = session or ExchangeSession(exchange)
+    balance = session.balance()
     usdt = balance.get("USDT", {})
     usdt_free = float(usdt.get("free", 0) or 0)
     usdt_total = float(usdt.get("total", 0) or 0)
@@ -155,63 +518,100 @@ def _infer_tp1_done_from_trades(
     return reduced_since_open
 
 
-def sync_state_from_exchange(exchange: ccxt.Exchange, state: StrategyState) -> None:
-    try:
-        markets = exchange.load_markets()
-    except Exception as e:
-        msg = str(e)
-        if "50101" in msg or "does not match current environment" in msg:
-            raise RuntimeError(
-                "OKX APIKey 环境不匹配：如果是模拟盘/DEMO key，请设置 OKX_SANDBOX=true；"
-                "如果是实盘 key，请设置 OKX_SANDBOX=false，并确保 key 来自对应环境。"
-                f" 原始错误：{msg}"
-            ) from e
-        raise
-    market = markets.get(SYMBOL) or exchange.market(SYMBOL)
-    contract_size = float(market.get("contractSize", 1) or 1)
+def _matching_entries(saved: list[Entry], btc_size: float, lot: float) -> list[Entry] | None:
+    """本地保存的逐笔 entry 与交易所持仓一致（允许每笔下单的精度截断）时，按实际持仓缩放后返回。"""
+    total = sum(e.size for e in saved)
+    if not saved or total <= 0 or abs(total - btc_size) > 2 * lot * len(saved) + 1e-12:
+        return None
+    scale = btc_size / total
+    return [Entry(price=e.price, size=e.size * scale, tp1_done=e.tp1_done) for e in saved]
 
-    try:
-        positions = exchange.fetch_positions([SYMBOL])
-    except Exception:
-        positions = []
 
-    try:
-        trades = exchange.fetch_my_trades(SYMBOL, limit=300)
-    except Exception:
-        trades = []
+def sync_state_from_exchange(
+    exchange: ccxt.Exchange,
+    state: StrategyState,
+    session: ExchangeSession | None = None,
+    symbol: str | None = None,
+) -> None:
+    session = session or ExchangeSession(exchange)
+    symbol = symbol or session.symbol
+    contract_size = session.contract_size(symbol)
+    positions = session.positions(symbol)
+    trades = session.trades(symbol)
+    ledger = session.ledger
+    lot = contract_size * float((session.market(symbol).get("precision") or {}).get("amount") or 1)
 
-    long_entry: Entry | None = None
-    short_entry: Entry | None = None
+    # 候选顺序：state 自带的 entry（来自检查点）-> 账本 -> 按持仓合并成一笔
+    local = {"long": state.long_entries, "short": state.short_entries}
+    entries: dict[str, list[Entry]] = {"long": [], "short": []}
+    live = {"long": 0.0, "short": 0.0}
 
     for p in positions:
         side = (p.get("side") or "").lower()
         contracts = float(p.get("contracts", 0) or 0)
-        if contracts <= 0:
+        if contracts <= 0 or side not in entries:
             continue
         btc_size = contracts * contract_size
+        live[side] = btc_size
         entry_price = float(p.get("entryPrice") or 0)
         if entry_price <= 0:
             entry_price = float(p.get("average") or 0)
         if entry_price <= 0:
             continue
 
-        if side == "long":
-            tp1_done = _infer_tp1_done_from_trades(trades, contract_size, "long") if HEDGE_MODE else False
-            long_entry = Entry(price=entry_price, size=btc_size, tp1_done=tp1_done)
-        elif side == "short":
-            tp1_done = _infer_tp1_done_from_trades(trades, contract_size, "short") if HEDGE_MODE else False
-            short_entry = Entry(price=entry_price, size=btc_size, tp1_done=tp1_done)
+        restored = _matching_entries(local[side], btc_size, lot)
+        if restored is None and ledger is not None:
+            restored = _matching_entries(ledger.load_entries(symbol, side), btc_size, lot)
+        if restored is not None:
+            entries[side] = restored
+            continue
+        if ledger is not None:
+            # 账本与持仓对不上（手动下单、部分失败等）：退回合并成一笔，TP1 状态取自账本的增量轨迹
+            tp1_done = ledger.tp1_done(symbol, side) if HEDGE_MODE else False
+        else:
+            tp1_done = _infer_tp1_done_from_trades(trades, contract_size, side) if HEDGE_MODE else False
+        entries[side] = [Entry(price=entry_price, size=btc_size, tp1_done=tp1_done)]
+
+    state.long_entries = entries["long"]
+    state.short_entries = entries["short"]
+    if ledger is not None and "positions" not in session.failed:
+        # 账本的净持仓是成交的累加，首次入账只见到最新一页成交时会偏；每次同步都以交易所持仓为准
+        for side, btc_size in live.items():
+            ledger.reset_net(symbol, side, btc_size)
+
+
+def record_strategy_state(session: ExchangeSession, state: StrategyState, symbol: str | None = None) -> None:
+    """决策后把逐笔 entry 写入账本，下次 sync 时与交易所持仓核对后原样恢复。"""
+    if session.ledger is not None:
+        session.ledger.save_entries(symbol or session.symbol, state.long_entries, state.short_entries)
+
+
+def _client_order_id(symbol: str, act: dict, decision_id: str, index: int) -> str:
+    # OKX clOrdId：最多 32 位字母数字。只由 (symbol, decision_id, 序号, op) 决定，不含数量和价格：
+    # 重启或部分成交后重试时账户价值变了、数量跟着变，id 仍然相同，交易所侧去重和按 id 对账才能对上
+    key = f"{symbol}|{decision_id}|{index}|{act.get('op')}"
+    op = re.sub(r"[^0-9A-Za-z]", "", str(act.get("op", "")))[:8]
+    return (op + hashlib.sha1(key.encode()).hexdigest())[:32]
 
-    state.long_entries = [long_entry] if long_entry else []
-    state.short_entries = [short_entry] if short_entry else []
 
+def assign_client_order_ids(actions: list[dict], symbol: str, decision_id: str) -> list[dict]:
+    """下单前给每个动作写入 decision_id 与 clOrdId，随动作一起进 WAL，中断后按 clOrdId 查单对账。"""
+    for index, act in enumerate(actions):
+        act["decision_id"] = decision_id
+        act["clOrdId"] = _client_order_id(symbol, act, decision_id, index)
+    return actions
 
-def execute_actions(exchange: ccxt.Exchange, actions: list[dict]) -> list[dict]:
-    executed = []
-    markets = exchange.load_markets()
-    market = markets.get(SYMBOL) or exchange.market(SYMBOL)
-    contract_size = float(market.get("contractSize", 1) or 1)
-    for act in actions:
+
+def _order_requests(
+    exchange: ccxt.Exchange,
+    actions: list[dict],
+    contract_size: float,
+    symbol: str = SYMBOL,
+    decision_id: str | None = None,
+) -> list[dict]:
+    decision_id = decision_id or str(int(time.time()))
+    requests = []
+    for index, act in enumerate(actions):
         side = act["side"]
         btc_size = float(act["size"])
         if btc_size <= 0:
@@ -223,35 +623,261 @@ def execute_actions(exchange: ccxt.Exchange, actions: list[dict]) -> list[dict]:
             params["posSide"] = pos_side
         if op.startswith("tp1_") or op.startswith("tp2_") or op.startswith("sl_"):
             params["reduceOnly"] = True
-        params["clOrdId"] = f"btc_{op[:10]}_{int(time.time())}"
+        params["clOrdId"] = act.get("clOrdId") or _client_order_id(symbol, act, decision_id, index)
         contracts = btc_size / contract_size
         if contracts <= 0:
             continue
-        contracts = float(exchange.amount_to_precision(SYMBOL, contracts))
+        contracts = float(exchange.amount_to_precision(symbol, contracts))
         if contracts <= 0:
             continue
-        order = exchange.create_order(SYMBOL, "market", side, contracts, None, params)
-        executed.append({"action": {**act, "contracts": contracts}, "order": order})
-    return executed
+        requests.append({"action": act, "symbol": symbol, "side": side, "contracts": contracts, "params": params})
+    return requests
 
 
-def print_summary(exchange: ccxt.Exchange, df: pd.DataFrame, state: StrategyState, executed: list[dict]) -> None:
-    balance = exchange.fetch_balance()
-    usdt = balance.get("USDT", {})
-    usdt_free = float(usdt.get("free", 0) or 0)
-    usdt_total = float(usdt.get("total", 0) or 0)
-    last_price = float(df["close"].iloc[-1])
-    markets = exchange.load_markets()
-    market = markets.get(SYMBOL) or exchange.market(SYMBOL)
-    contract_size = float(market.get("contractSize", 1) or 1)
+def _batch_payload(chunk: list[dict]) -> list[dict]:
+    return [
+        {
+            "symbol": req["symbol"],
+            "type": "market",
+            "side": req["side"],
+            "amount": req["contracts"],
+            "price": None,
+            "params": req["params"],
+        }
+        for req in chunk
+    ]
+
+
+def _batch_results(chunk: list[dict], orders: list[dict]) -> list[tuple[dict | None, Exception | None]]:
+    results = []
+    for i in range(len(chunk)):
+        order = orders[i] if i < len(orders) else None
+        if order is None or order.get("status") == "rejected":
+            info = (order or {}).get("info") or {}
+            results.append((None, RuntimeError(f"{info.get('sCode')}: {info.get('sMsg')}")))
+        else:
+            results.append((order, None))
+    return results
+
+
+def _executed_items(requests: list[dict], results: list) -> list[dict]:
+    items = []
+    for req, (order, error) in zip(requests, results):
+        item = {"action": {**req["action"], "contracts": req["contracts"]}, "order": order}
+        if error is not None:
+            item["error"] = str(error)
+        items.append(item)
+    return items
+
+
+def _find_order(exchange: ccxt.Exchange, req: dict) -> dict | None:
     try:
-        positions = exchange.fetch_positions([SYMBOL])
+        return exchange.fetch_order(None, req["symbol"], {"clOrdId": req["params"]["clOrdId"]})
     except Exception:
-        positions = []
+        return None
+
+
+def submit_orders(exchange: ccxt.Exchange, requests: list[dict]) -> list[dict]:
+    """
+    每 BATCH_ORDER_LIMIT 笔走一次 OKX 批量下单；批量失败或单笔被拒的订单按 clOrdId
+    查单对账，确认不存在后再逐笔补发，避免重复下单。返回每笔订单的结果。
+    """
+    results: list = [None] * len(requests)
+    batch = len(requests) > 1 and exchange.has.get("createOrders")
+    for start in range(0, len(requests), BATCH_ORDER_LIMIT if batch else 1):
+        chunk = requests[start:start + (BATCH_ORDER_LIMIT if batch else 1)]
+        try:
+            if batch:
+                chunk_results = _batch_results(chunk, exchange.create_orders(_batch_payload(chunk)))
+            else:
+                req = chunk[0]
+                chunk_results = [(exchange.create_order(req["symbol"], "market", req["side"], req["contracts"], None, req["params"]), None)]
+        except Exception as e:
+            chunk_results = [(None, e)] * len(chunk)
+        results[start:start + len(chunk)] = chunk_results
+
+    if batch:
+        for i, (order, error) in enumerate(results):
+            if order is not None:
+                continue
+            req = requests[i]
+            existing = _find_order(exchange, req)
+            if existing is not None:
+                results[i] = (existing, None)
+                continue
+            try:
+                results[i] = (exchange.create_order(req["symbol"], "market", req["side"], req["contracts"], None, req["params"]), None)
+            except Exception as e:
+                results[i] = (None, e)
+    return _executed_items(requests, results)
+
+
+async def _find_order_async(exchange, req: dict) -> dict | None:
     try:
-        recent_trades = exchange.fetch_my_trades(SYMBOL, limit=10)
+        return await exchange.fetch_order(None, req["symbol"], {"clOrdId": req["params"]["clOrdId"]})
     except Exception:
-        recent_trades = []
+        return None
+
+
+async def submit_orders_async(exchange, requests: list[dict]) -> list[dict]:
+    """submit_orders 的 async 版本：批量请求并发发出，补发的单笔订单也并发。"""
+    import asyncio
+
+    async def single(req: dict) -> tuple:
+        try:
+            return await exchange.create_order(req["symbol"], "market", req["side"], req["contracts"], None, req["params"]), None
+        except Exception as e:
+            return None, e
+
+    async def retry(req: dict) -> tuple:
+        existing = await _find_order_async(exchange, req)
+        if existing is not None:
+            return existing, None
+        return await single(req)
+
+    if len(requests) <= 1 or not exchange.has.get("createOrders"):
+        results = list(await asyncio.gather(*(single(req) for req in requests)))
+        return _executed_items(requests, results)
+
+    async def run_chunk(chunk: list[dict]) -> list:
+        try:
+            return _batch_results(chunk, await exchange.create_orders(_batch_payload(chunk)))
+        except Exception as e:
+            return [(None, e)] * len(chunk)
+
+    chunks = [requests[i:i + BATCH_ORDER_LIMIT] for i in range(0, len(requests), BATCH_ORDER_LIMIT)]
+    results = [r for chunk_results in await asyncio.gather(*(run_chunk(c) for c in chunks)) for r in chunk_results]
+    failed = [i for i, (order, _) in enumerate(results) if order is None]
+    for i, result in zip(failed, await asyncio.gather(*(retry(requests[i]) for i in failed))):
+        results[i] = result
+    return _executed_items(requests, results)
+
+
+def _pending_requests(wal: dict) -> list[dict]:
+    # 写前日志里带 clOrdId 的动作，形状与 _order_requests 一致，供按 id 查单
+    return [
+        {"action": act, "symbol": symbol, "params": {"clOrdId": act["clOrdId"]}}
+        for symbol, acts in (wal.get("actions") or {}).items()
+        for act in acts
+        if act.get("clOrdId")
+    ]
+
+
+def _lookup_order(exchange: ccxt.Exchange, req: dict) -> dict | None:
+    # 恢复时只有“交易所确认不存在”才算没发出去；网络错误等照常抛出，保留 .wal 等下次运行再对账
+    from ccxt.base.errors import OrderNotFound
+
+    try:
+        return exchange.fetch_order(None, req["symbol"], {"clOrdId": req["params"]["clOrdId"]})
+    except OrderNotFound:
+        return None
+
+
+async def _lookup_order_async(exchange, req: dict) -> dict | None:
+    from ccxt.base.errors import OrderNotFound
+
+    try:
+        return await exchange.fetch_order(None, req["symbol"], {"clOrdId": req["params"]["clOrdId"]})
+    except OrderNotFound:
+        return None
+
+
+def _apply_recovery(checkpoint: StateCheckpoint, wal: dict, found: list[tuple[dict, dict | None]]) -> dict[str, str]:
+    """
+    把按 clOrdId 查到的订单落到检查点：某个 symbol 只要有一笔订单已到交易所，就采用 .wal 里
+    决策后的状态（实际成交数量随后由 sync_state_from_exchange 按持仓缩放），并把该 decision_id
+    记为已执行，同一根 bar 不再重新决策，没查到的动作也不补发；一笔都没发出去的 symbol 退回
+    主文件里决策前的状态，下次照常决策（clOrdId 相同，重发也能被交易所去重）。返回记为已执行的映射。
+    """
+    actions = wal.get("actions") or {}
+    states: dict[str, StrategyState] = {}
+    acted: dict[str, str] = {}
+    for symbol, raw in (wal.get("states") or {}).items():
+        acts = actions.get(symbol) or []
+        orders = [order for req, order in found if req["symbol"] == symbol]
+        # 旧版 .wal 没有 clOrdId，无法查单，按已发出处理，宁可漏单不重复下单
+        sent = any(order is not None for order in orders) or any(not act.get("clOrdId") for act in acts)
+        if acts and not sent:
+            continue
+        states[symbol] = StrategyState.from_dict(raw)
+        if acts:
+            acted[symbol] = acts[0].get("decision_id") or wal.get("decision_id") or ""
+            filled = sum(float((order or {}).get("filled") or 0) for order in orders)
+            print(f"恢复中断的决策 {symbol} {acted[symbol]}：{len(acts)} 个动作，交易所查到 "
+                  f"{sum(order is not None for order in orders)} 笔订单，已成交 {filled:g} 张")
+    checkpoint.commit(states, wal.get("decision_id"), acted=acted)
+    return acted
+
+
+def recover_pending_decision(exchange: ccxt.Exchange, checkpoint: StateCheckpoint) -> dict[str, str]:
+    """启动时若上次在下单中途中断（.wal 仍在），按 clOrdId 查单对账后提交检查点。"""
+    wal = checkpoint.read_pending()
+    if wal is None:
+        return {}
+    requests = _pending_requests(wal)
+    return _apply_recovery(checkpoint, wal, [(req, _lookup_order(exchange, req)) for req in requests])
+
+
+async def recover_pending_decision_async(exchange, checkpoint: StateCheckpoint) -> dict[str, str]:
+    import asyncio
+
+    wal = checkpoint.read_pending()
+    if wal is None:
+        return {}
+    requests = _pending_requests(wal)
+    orders = await asyncio.gather(*(_lookup_order_async(exchange, req) for req in requests))
+    return _apply_recovery(checkpoint, wal, list(zip(requests, orders)))
+
+
+def execute_actions(
+    exchange: ccxt.Exchange,
+    actions: list[dict],
+    session: ExchangeSession | None = None,
+    symbol: str | None = None,
+    decision_id: str | None = None,
+) -> list[dict]:
+    if not actions:
+        return []
+    session = session or ExchangeSession(exchange)
+    symbol = symbol or session.symbol
+    requests = _order_requests(exchange, actions, session.contract_size(symbol), symbol, decision_id)
+    executed = submit_orders(exchange, requests)
+    if any(item["order"] is not None for item in executed):
+        session.order_placed()
+    return executed
+
+
+async def execute_actions_async(
+    exchange,
+    actions: list[dict],
+    session: ExchangeSession,
+    symbol: str | None = None,
+    decision_id: str | None = None,
+) -> list[dict]:
+    symbol = symbol or session.symbol
+    requests = _order_requests(exchange, actions, session.contract_size(symbol), symbol, decision_id)
+    executed = await submit_orders_async(exchange, requests)
+    if any(item["order"] is not None for item in executed):
+        session.order_placed()
+    return executed
+
+
+def print_summary(
+    exchange: ccxt.Exchange,
+    df: np.ndarray | pd.DataFrame,
+    state: StrategyState,
+    executed: list[dict],
+    session: ExchangeSession | None = None,
+) -> None:
+    session = session or ExchangeSession(exchange)
+    balance = session.balance()
+    usdt = balance.get("USDT", {})
+    usdt_free = float(usdt.get("free", 0) or 0)
+    usdt_total = float(usdt.get("total", 0) or 0)
+    last_price = float(ohlcv_column(df, "close")[-1])
+    contract_size = session.contract_size()
+    positions = session.positions()
+    recent_trades = session.recent_trades()
     long_size = 0.0
     short_size = 0.0
     for p in positions:
@@ -266,7 +892,7 @@ def print_summary(exchange: ccxt.Exchange, df: pd.DataFrame, state: StrategyStat
     total_equity = usdt_total if usdt_total > 0 else usdt_free
 
     print("\n===== BTC Strategy Daily Run =====")
-    print("Time:", pd.Timestamp.now())
+    print("Time:", datetime.now())
     print("Symbol:", SYMBOL, "| Timeframe:", TIMEFRAME)
 
     if executed:
@@ -278,6 +904,7 @@ def print_summary(exchange: ccxt.Exchange, df: pd.DataFrame, state: StrategyStat
                 "| side:", act["side"],
                 "| size:", f"{act['size']:.6f}",
                 "| price:", f"{act['price']:.2f}",
+                *(("| FAILED:", item["error"]) if item.get("error") else ()),
             )
     else:
         print("\nNo orders executed on this run.")
@@ -311,18 +938,171 @@ def print_summary(exchange: ccxt.Exchange, df: pd.DataFrame, state: StrategyStat
     print("==============================\n")
 
 
-def run_once() -> None:
-    exchange = create_exchange()
-    state = create_strategy_state()
-    sync_state_from_exchange(exchange, state)
-    df = fetch_ohlcv_df(exchange)
-    last_price = float(df["close"].iloc[-1])
-    account_value, cash = get_account_value_and_cash(exchange, last_price)
-    actions = state.process_bar(df, account_value, cash)
-    executed = execute_actions(exchange, actions)
-    print_summary(exchange, df, state, executed)
+def run_once(
+    exchange: ccxt.Exchange | None = None,
+    store: CandleStore | None = None,
+    market_cache: MarketCache | None = None,
+    verbose: bool = True,
+    ledger: TradeLedger | None = None,
+    checkpoint: StateCheckpoint | None = None,
+    tracer: RunTracer | None = None,
+) -> list[dict]:
+    """
+    exchange 为空时连接 OKX，并使用本地 markets 缓存、K 线仓库、成交账本与状态检查点；
+    传入 mock_exchange.MockOKX 等交易所对象时只用显式传入的 store / market_cache / ledger / checkpoint。
+
+    每个阶段的耗时与 ccxt 调用统计记在 tracer 里，结束时按 TRACE_JSONL / TRACE_PROM 导出。
+    """
+    tracer = tracer or RunTracer("run_once", SYMBOL)
+    owned = exchange is None
+    try:
+        with tracer.stage("create_exchange"):
+            if owned:
+                exchange = create_exchange(set_mode=False)
+                market_cache = market_cache or create_market_cache()
+                store = store or CandleStore(CANDLES_DIR)
+                ledger = ledger or create_trade_ledger()
+                checkpoint = checkpoint or create_state_checkpoint()
+        # 先包装再发第一个请求，启动时的持仓模式设置也记进追踪
+        with tracer.instrument(exchange):
+            if owned:
+                with tracer.stage("set_position_mode"):
+                    set_position_mode(exchange)
+            session = ExchangeSession(exchange, market_cache=market_cache, ledger=ledger)
+            with tracer.stage("load_markets"):
+                session.markets()
+            with tracer.stage("sync_state"):
+                if checkpoint is not None:
+                    recover_pending_decision(exchange, checkpoint)
+                state = load_strategy_state(checkpoint)
+                sync_state_from_exchange(exchange, state, session)
+            with tracer.stage("fetch_ohlcv"):
+                bars = fetch_ohlcv_bars(exchange, store, limit=OHLCV_LIMIT)
+            with tracer.stage("account"):
+                last_price = float(bars["close"][-1])
+                account_value, cash = get_account_value_and_cash(exchange, last_price, session)
+            decision_id = str(int(bars["timestamp"][-1]))
+            with tracer.stage("process_bar"):
+                if checkpoint is not None and checkpoint.acted(SYMBOL) == decision_id:
+                    # 这根 bar 的决策在中断前已下单，恢复时已对账，不再重复决策
+                    actions = []
+                else:
+                    actions = state.process_bar(bars, account_value, cash)
+            assign_client_order_ids(actions, SYMBOL, decision_id)
+            if checkpoint is not None and actions:
+                with tracer.stage("checkpoint"):
+                    checkpoint.begin({SYMBOL: state}, decision_id, {SYMBOL: actions})
+            with tracer.stage("execute_actions"):
+                executed = execute_actions(exchange, actions, session, decision_id=decision_id)
+            with tracer.stage("checkpoint"):
+                record_strategy_state(session, state)
+                if checkpoint is not None:
+                    checkpoint.commit({SYMBOL: state}, decision_id, acted={SYMBOL: decision_id} if actions else None)
+            if verbose:
+                with tracer.stage("print_summary"):
+                    print_summary(exchange, bars, state, executed, session)
+        if market_cache is not None:
+            with tracer.stage("market_cache"):
+                market_cache.join(timeout=30)
+        return executed
+    finally:
+        tracer.export()
+
+
+async def run_once_async(
+    exchange=None,
+    store: CandleStore | None = None,
+    market_cache: MarketCache | None = None,
+    verbose: bool = True,
+    ledger: TradeLedger | None = None,
+    checkpoint: StateCheckpoint | None = None,
+    tracer: RunTracer | None = None,
+) -> list[dict]:
+    """
+    run_once 的 asyncio 版本：markets 就绪后，持仓、成交、余额、K 线和持仓模式设置
+    并发发出，一起 await 后再进入 process_bar。传入的 exchange 由调用方负责关闭。
+    """
+    import asyncio
+
+    tracer = tracer or RunTracer("run_once_async", SYMBOL)
+    owned = exchange is None
+    with tracer.stage("create_exchange"):
+        if owned:
+            exchange = create_async_exchange()
+            market_cache = market_cache or create_market_cache()
+            store = store or CandleStore(CANDLES_DIR)
+            ledger = ledger or create_trade_ledger()
+            checkpoint = checkpoint or create_state_checkpoint()
+    try:
+        with tracer.instrument(exchange):
+            session = ExchangeSession(exchange, market_cache=market_cache, ledger=ledger)
+
+            async def set_position_mode() -> None:
+                try:
+                    await exchange.set_position_mode(HEDGE_MODE)
+                except Exception:
+                    pass
+
+            with tracer.stage("load_markets"):
+                await session.markets_async()
+            # 余额、持仓、成交、K 线与持仓模式设置并发，归在同一个阶段
+            with tracer.stage("fetch"):
+                if store is not None:
+                    candles = store.sync_async(exchange, SYMBOL, TIMEFRAME, limit=OHLCV_LIMIT)
+                else:
+                    candles = exchange.fetch_ohlcv(SYMBOL, timeframe=TIMEFRAME, limit=OHLCV_LIMIT)
+                _, _, tail = await asyncio.gather(
+                    set_position_mode(),
+                    session.refresh_async("balance", "positions", "trades"),
+                    candles,
+                )
+                bars = tail if store is not None else candles_from_rows(tail)
+
+            with tracer.stage("sync_state"):
+                if checkpoint is not None:
+                    await recover_pending_decision_async(exchange, checkpoint)
+                state = load_strategy_state(checkpoint)
+                sync_state_from_exchange(exchange, state, session)
+            with tracer.stage("account"):
+                last_price = float(bars["close"][-1])
+                account_value, cash = get_account_value_and_cash(exchange, last_price, session)
+            decision_id = str(int(bars["timestamp"][-1]))
+            with tracer.stage("process_bar"):
+                if checkpoint is not None and checkpoint.acted(SYMBOL) == decision_id:
+                    # 这根 bar 的决策在中断前已下单，恢复时已对账，不再重复决策
+                    actions = []
+                else:
+                    actions = state.process_bar(bars, account_value, cash)
+            assign_client_order_ids(actions, SYMBOL, decision_id)
+            if checkpoint is not None and actions:
+                with tracer.stage("checkpoint"):
+                    checkpoint.begin({SYMBOL: state}, decision_id, {SYMBOL: actions})
+            with tracer.stage("execute_actions"):
+                executed = await execute_actions_async(exchange, actions, session, decision_id=decision_id)
+            with tracer.stage("checkpoint"):
+                record_strategy_state(session, state)
+                if checkpoint is not None:
+                    checkpoint.commit({SYMBOL: state}, decision_id, acted={SYMBOL: decision_id} if actions else None)
+            if verbose:
+                with tracer.stage("print_summary"):
+                    if executed:
+                        await session.refresh_async("balance", "positions", "trades")
+                    print_summary(exchange, bars, state, executed, session)
+        if market_cache is not None:
+            with tracer.stage("market_cache"):
+                market_cache.join(timeout=30)
+        return executed
+    finally:
+        if owned:
+            await exchange.close()
+        tracer.export()
 
 
 if __name__ == "__main__":
-    run_once()
+    if "--async" in sys.argv[1:]:
+        import asyncio
+
+        asyncio.run(run_once_async())
+    else:
+        run_once()
 
@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import time
+from typing import Any, Callable, Sequence
+
+import ccxt
+import pandas as pd
+
+from candle_store import CandleStore, read_candle_rows
+from checkpoint import StateCheckpoint
+from live_okx import (
+    CANDLES_DIR,
+    OHLCV_LIMIT,
+    SANDBOX_MODE,
+    SYMBOL,
+    TIMEFRAME,
+    ExchangeSession,
+    _candles_to_df,
+    _exchange_config,
+    assign_client_order_ids,
+    create_market_cache,
+    create_state_checkpoint,
+    create_strategy_state,
+    create_trade_ledger,
+    execute_actions_async,
+    get_account_value_and_cash,
+    load_strategy_state,
+    record_strategy_state,
+    recover_pending_decision_async,
+    sync_state_from_exchange,
+)
+from strategy_engine import StrategyState
+
+
+class ReplayFinished(Exception):
+    pass
+
+
+class ReplaySource:
+    """
+    离线回放数据源，接口与 ccxt.pro 交易所一致（watch_ohlcv / watch_mark_price /
+    fetch_ohlcv），用来在没有 OKX 连接时驱动 StreamRunner。
+
+    前 warmup 根 K 线作为历史（fetch_ohlcv 返回），之后每根 bar 拆成
+    open -> high/low -> close 四个 tick 依次推送；interval 为每个 tick 的间隔秒数。
+    """
+
+    def __init__(self, rows: Sequence[Sequence[Any]], warmup: int = 300, interval: float = 0.0):
+        self.rows = [[int(r[0]), *(float(x) for x in r[1:6])] for r in rows]
+        self.warmup = min(warmup, len(self.rows))
+        self.interval = interval
+        self._candles: asyncio.Queue | None = None
+        self._marks: asyncio.Queue | None = None
+        self._producer: asyncio.Task | None = None
+
+    async def fetch_ohlcv(self, symbol: str, timeframe: str = "1d", since: int | None = None, limit: int = 300) -> list:
+        history = self.rows[: self.warmup]
+        if since is not None:
+            history = [r for r in history if r[0] >= since]
+        return [list(r) for r in history[-limit:]]
+
+    def _start(self) -> None:
+        if self._producer is None:
+            self._candles = asyncio.Queue()
+            self._marks = asyncio.Queue()
+            self._producer = asyncio.ensure_future(self._produce())
+
+    async def _produce(self) -> None:
+        for ts, o, h, l, c, v in self.rows[self.warmup:]:
+            path = (o, l, h, c) if c >= o else (o, h, l, c)
+            high = low = o
+            for i, px in enumerate(path):
+                high, low = max(high, px), min(low, px)
+                vol = v * (i + 1) / len(path)
+                await self._candles.put([[ts, o, high, low, px, vol]])
+                await self._marks.put({"symbol": SYMBOL, "markPrice": px, "timestamp": ts})
+                if self.interval:
+                    await asyncio.sleep(self.interval)
+                else:
+                    await asyncio.sleep(0)
+        await self._candles.put(None)
+        await self._marks.put(None)
+
+    async def watch_ohlcv(self, symbol: str, timeframe: str = "1d", since=None, limit=None) -> list:
+        self._start()
+        item = await self._candles.get()
+        if item is None:
+            await self._candles.put(None)
+            raise ReplayFinished()
+        return item
+
+    async def watch_mark_price(self, symbol: str, params: dict | None = None) -> dict:
+        self._start()
+        item = await self._marks.get()
+        if item is None:
+            await self._marks.put(None)
+            raise ReplayFinished()
+        return item
+
+    async def close(self) -> None:
+        if self._producer is not None:
+            self._producer.cancel()
+
+
+class StreamRunner:
+    """
+    事件驱动的常驻运行模式：
+    - K 线流：写入本地 CandleStore，新 bar 出现即代表上一根已收盘，在已确认的 K 线上跑 process_bar；
+    - mark price 流：每个 tick 只跑 TP1/SL/TP2 (check_exits)，止盈止损从日级延迟降到亚秒级。
+    exchange 为 None 时是 dry-run，只记录动作不下单。
+    传入 checkpoint 时，下单前写前日志、每次决策后提交检查点，重启可直接从检查点恢复。
+    """
+
+    def __init__(
+        self,
+        source: Any,
+        state: StrategyState,
+        store: CandleStore,
+        exchange: Any = None,
+        session: ExchangeSession | None = None,
+        symbol: str = SYMBOL,
+        timeframe: str = TIMEFRAME,
+        limit: int = OHLCV_LIMIT,
+        account_value: float = 10_000.0,
+        on_executed: Callable[[list[dict]], None] | None = None,
+        checkpoint: StateCheckpoint | None = None,
+    ):
+        self.source = source
+        self.state = state
+        self.store = store
+        self.exchange = exchange
+        self.session = session
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.limit = limit
+        self.account_value = account_value
+        self.on_executed = on_executed
+        self.checkpoint = checkpoint
+        self.executed: list[dict] = []
+        self.lock = asyncio.Lock()
+        self.last_tick_latency: float | None = None
+
+    async def warm(self) -> None:
+        since = self.store.last_timestamp(self.symbol, self.timeframe)
+        kwargs = {"since": since} if since is not None else {}
+        rows = await self.source.fetch_ohlcv(self.symbol, timeframe=self.timeframe, limit=self.limit, **kwargs)
+        self.store.write(self.symbol, self.timeframe, rows)
+
+    def _confirmed_df(self) -> pd.DataFrame:
+        tail = self.store.tail(self.symbol, self.timeframe, self.limit + 1)
+        return _candles_to_df(tail[:-1])
+
+    async def _account(self, price: float) -> tuple[float, float]:
+        if self.exchange is None or self.session is None:
+            return self.account_value, self.account_value
+        # 与 run_once 一致：每根 bar 收盘先按交易所持仓校准策略状态，再算账户价值
+        await self.session.refresh_async("balance", "positions", "trades")
+        sync_state_from_exchange(self.exchange, self.state, self.session, symbol=self.symbol)
+        return get_account_value_and_cash(self.exchange, price, self.session)
+
+    async def _execute(self, actions: list[dict], decision_id: str) -> list[dict]:
+        if not actions:
+            return []
+        if self.exchange is None:
+            executed = [{"action": act, "order": None} for act in actions]
+        else:
+            assign_client_order_ids(actions, self.symbol, decision_id)
+            if self.checkpoint is not None:
+                self.checkpoint.begin({self.symbol: self.state}, decision_id, {self.symbol: actions})
+            executed = await execute_actions_async(
+                self.exchange, actions, self.session, symbol=self.symbol, decision_id=decision_id
+            )
+            record_strategy_state(self.session, self.state, self.symbol)
+        self.executed.extend(executed)
+        if self.on_executed is not None:
+            self.on_executed(executed)
+        return executed
+
+    async def on_bar_close(self) -> list[dict]:
+        df = self._confirmed_df()
+        if df.empty:
+            return []
+        async with self.lock:
+            decision_id = str(int(df["timestamp"].iloc[-1]))
+            if self.checkpoint is not None and self.checkpoint.acted(self.symbol) == decision_id:
+                # 重启前这根 bar 已下单并在恢复时对账
+                return []
+            account_value, cash = await self._account(float(df["close"].iloc[-1]))
+            actions = self.state.process_bar(df, account_value, cash)
+            executed = await self._execute(actions, decision_id)
+            if self.checkpoint is not None:
+                acted = {self.symbol: decision_id} if actions and self.exchange is not None else None
+                self.checkpoint.commit({self.symbol: self.state}, decision_id, acted=acted)
+            return executed
+
+    async def on_mark_price(self, price: float, ts: int | None = None) -> list[dict]:
+        if not (self.state.long_entries or self.state.short_entries):
+            return []
+        async with self.lock:
+            decision_id = f"m{ts if ts is not None else int(time.time() * 1000)}"
+            executed = await self._execute(self.state.check_exits(price), decision_id)
+            if executed and self.checkpoint is not None:
+                self.checkpoint.commit({self.symbol: self.state}, decision_id)
+            return executed
+
+    async def _candle_loop(self) -> None:
+        while True:
+            try:
+                candles = await self.source.watch_ohlcv(self.symbol, self.timeframe)
+            except ccxt.NetworkError:
+                # ccxt.pro 会在下一次 watch 时自动重连
+                await asyncio.sleep(1)
+                continue
+            if not candles:
+                continue
+            prev_ts = self.store.last_timestamp(self.symbol, self.timeframe)
+            self.store.write(self.symbol, self.timeframe, candles)
+            newest = int(candles[-1][0])
+            if prev_ts is not None and newest > prev_ts:
+                await self.on_bar_close()
+
+    async def _mark_loop(self) -> None:
+        while True:
+            try:
+                ticker = await self.source.watch_mark_price(self.symbol)
+            except ccxt.NetworkError:
+                await asyncio.sleep(1)
+                continue
+            price = float(ticker.get("markPrice") or ticker.get("last") or 0)
+            if price <= 0:
+                continue
+            started = time.perf_counter()
+            await self.on_mark_price(price, ticker.get("timestamp"))
+            self.last_tick_latency = time.perf_counter() - started
+
+    async def run(self) -> None:
+        await self.warm()
+        tasks = [asyncio.ensure_future(self._candle_loop()), asyncio.ensure_future(self._mark_loop())]
+        try:
+            await asyncio.gather(*tasks)
+        except ReplayFinished:
+            pass
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def run_live_daemon() -> None:
+    import ccxt.pro as ccxtpro
+
+    exchange = ccxtpro.okx(_exchange_config())
+    exchange.set_sandbox_mode(SANDBOX_MODE)
+    try:
+        session = ExchangeSession(exchange, market_cache=create_market_cache(), ledger=create_trade_ledger())
+        await session.markets_async()
+        await session.refresh_async("balance", "positions", "trades")
+        checkpoint = create_state_checkpoint()
+        await recover_pending_decision_async(exchange, checkpoint)
+        state = load_strategy_state(checkpoint)
+        sync_state_from_exchange(exchange, state, session)
+        runner = StreamRunner(
+            exchange,
+            state,
+            CandleStore(CANDLES_DIR),
+            exchange=exchange,
+            session=session,
+            on_executed=lambda items: [print("executed:", item["action"]) for item in items],
+            checkpoint=checkpoint,
+        )
+        await runner.run()
+    finally:
+        await exchange.close()
+
+
+async def run_replay(path: str, warmup: int = 300, interval: float = 0.0, store_dir: str | None = None) -> StreamRunner:
+    import tempfile
+
+    source = ReplaySource(read_candle_rows(path), warmup=warmup, interval=interval)
+    with tempfile.TemporaryDirectory() as tmp:
+        runner = StreamRunner(
+            source,
+            create_strategy_state(),
+            CandleStore(store_dir or tmp),
+            on_executed=lambda items: [print("replay:", item["action"]) for item in items],
+        )
+        await runner.run()
+    return runner
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="事件驱动常驻模式（WebSocket K 线 + mark price）")
+    parser.add_argument("--replay", help="离线回放：CSV 文件或列式目录")
+    parser.add_argument("--warmup", type=int, default=300)
+    parser.add_argument("--interval", type=float, default=0.0, help="回放时每个 tick 的间隔秒数")
+    args = parser.parse_args()
+    if args.replay:
+        asyncio.run(run_replay(args.replay, warmup=args.warmup, interval=args.interval))
+    else:
+        asyncio.run(run_live_daemon())
@@ -0,0 +1,88 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Iterable
+
+
+class MarketCache:
+    """
+    本地缓存合约元数据（contractSize / precision / limits），避免每次冷启动都
+    下载 OKX 全量 instrument 列表。
+
+    - 缓存按 sandbox/实盘 分开，超过 ttl 秒视为失效；
+    - 超过 ttl * refresh_ratio 但仍有效时，照常使用并在后台线程刷新。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 24 * 3600,
+        sandbox: bool = False,
+        refresh_ratio: float = 0.5,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.sandbox = sandbox
+        self.refresh_ratio = refresh_ratio
+        self._thread: threading.Thread | None = None
+
+    def _read(self) -> dict | None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if raw.get("sandbox") != self.sandbox:
+            return None
+        return raw
+
+    def age(self) -> float | None:
+        raw = self._read()
+        if not raw:
+            return None
+        return time.time() - float(raw.get("saved_at", 0))
+
+    def load(self, symbols: Iterable[str]) -> dict | None:
+        raw = self._read()
+        if not raw:
+            return None
+        if time.time() - float(raw.get("saved_at", 0)) > self.ttl:
+            return None
+        markets = raw.get("markets") or {}
+        wanted = list(symbols)
+        if any(s not in markets for s in wanted):
+            return None
+        return {s: markets[s] for s in wanted}
+
+    def save(self, markets: dict, symbols: Iterable[str]) -> None:
+        subset = {s: markets[s] for s in symbols if s in markets}
+        if not subset:
+            return
+        payload = {"saved_at": time.time(), "sandbox": self.sandbox, "markets": subset}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(payload, f, default=str)
+        os.replace(tmp, self.path)
+
+    def needs_refresh(self) -> bool:
+        age = self.age()
+        return age is None or age > self.ttl * self.refresh_ratio
+
+    def refresh_async(self, loader: Callable[[], dict], symbols: Iterable[str]) -> threading.Thread:
+        wanted = list(symbols)
+
+        def run() -> None:
+            try:
+                self.save(loader(), wanted)
+            except Exception:
+                # 后台刷新失败不影响本次运行，下次启动会再试
+                pass
+
+        self._thread = threading.Thread(target=run, name="market-cache-refresh", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def join(self, timeout: float | None = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,467 @@
+import argparse
+import asyncio
+import math
+import time
+from collections import Counter
+from typing import Any, Sequence
+
+import ccxt
+import numpy as np
+
+from candle_store import read_candle_rows
+from live_okx import SYMBOL, TIMEFRAME
+
+
+# OKX /api/v5/trade/fills-history 单页上限
+FILLS_PAGE_LIMIT = 100
+
+
+def _okx_market(symbol: str, contract_size: float, amount_step: float) -> dict:
+    base, rest = symbol.split("/")
+    quote, settle = rest.split(":")
+    return {
+        "id": f"{base}-{quote}-SWAP",
+        "symbol": symbol,
+        "base": base,
+        "quote": quote,
+        "settle": settle,
+        "type": "swap",
+        "spot": False,
+        "swap": True,
+        "contract": True,
+        "linear": True,
+        "active": True,
+        "contractSize": contract_size,
+        "precision": {"amount": amount_step, "price": 0.1},
+        "limits": {"amount": {"min": amount_step, "max": None}},
+        "info": {},
+    }
+
+
+class MockOKX:
+    """
+    进程内模拟的 OKX USDT 永续账户（双向持仓、全仓），实现 live_okx 用到的 ccxt 接口：
+    load_markets / fetch_ohlcv / fetch_balance / fetch_positions / fetch_my_trades /
+    create_order / create_orders / fetch_order 等。
+
+    K 线来自回放数据，时钟停在 cursor 指向的 bar：fetch_ohlcv 只返回该 bar 及之前的数据，
+    市价单按该 bar 的 close（加 slippage）成交。advance() 把时钟推进到下一根 bar。
+    latency 为每次请求的模拟往返耗时（秒），calls 记录各接口的调用次数。
+    """
+
+    def __init__(
+        self,
+        candles: Sequence[Sequence[Any]] | dict[str, Sequence[Sequence[Any]]],
+        symbol: str = SYMBOL,
+        start: int = 0,
+        balance: float = 10_000.0,
+        contract_size: float = 0.01,
+        amount_step: float = 0.01,
+        fee_rate: float = 0.0005,
+        slippage: float = 0.0,
+        leverage: float = 1.0,
+        latency: float = 0.0,
+    ):
+        if not isinstance(candles, dict):
+            candles = {symbol: candles}
+        self.symbol = symbol
+        self._ts: dict[str, np.ndarray] = {}
+        self._ohlcv: dict[str, np.ndarray] = {}
+        for sym, rows in candles.items():
+            arr = np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+            self._ts[sym] = arr[:, 0].astype(np.int64)
+            self._ohlcv[sym] = arr[:, 1:]
+        self.clock = np.unique(np.concatenate(list(self._ts.values())))
+        self.cursor = min(max(start, 0), len(self.clock) - 1)
+
+        self.markets = {sym: _okx_market(sym, contract_size, amount_step) for sym in candles}
+        self.has = {"createOrders": True, "fetchOrder": True, "fetchPositions": True, "fetchMyTrades": True}
+        self.wallet = float(balance)
+        self.fee_rate = fee_rate
+        self.slippage = slippage
+        self.leverage = leverage
+        self.latency = latency
+        self.calls: Counter = Counter()
+
+        # (symbol, posSide) -> [contracts, entry_price]
+        self.positions: dict[tuple[str, str], list[float]] = {}
+        self.trades: list[dict] = []
+        self.orders: dict[str, dict] = {}
+        self._client_ids: dict[str, str] = {}
+        self._seq = 0
+
+    # ---- 时钟 ----
+    @property
+    def now(self) -> int:
+        return int(self.clock[self.cursor])
+
+    def done(self) -> bool:
+        return self.cursor >= len(self.clock) - 1
+
+    def advance(self, bars: int = 1) -> bool:
+        """推进时钟，已到最后一根 bar 时返回 False。"""
+        if self.done():
+            return False
+        self.cursor = min(self.cursor + bars, len(self.clock) - 1)
+        return True
+
+    def last_price(self, symbol: str | None = None) -> float:
+        symbol = symbol or self.symbol
+        end = int(np.searchsorted(self._ts[symbol], self.now, side="right"))
+        if end == 0:
+            raise ccxt.BadSymbol(f"{symbol} has no candles before {self.now}")
+        return float(self._ohlcv[symbol][end - 1, 3])
+
+    # ---- 账户计算 ----
+    def _contract_size(self, symbol: str) -> float:
+        return float(self.markets[symbol]["contractSize"])
+
+    def _unrealized(self) -> float:
+        pnl = 0.0
+        for (sym, pos_side), (contracts, entry) in self.positions.items():
+            qty = contracts * self._contract_size(sym)
+            sign = 1.0 if pos_side == "long" else -1.0
+            pnl += sign * (self.last_price(sym) - entry) * qty
+        return pnl
+
+    def _used_margin(self) -> float:
+        return sum(
+            contracts * self._contract_size(sym) * entry / self.leverage
+            for (sym, _), (contracts, entry) in self.positions.items()
+        )
+
+    def equity(self) -> float:
+        return self.wallet + self._unrealized()
+
+    # ---- 成交撮合 ----
+    def _check_symbol(self, symbol: str) -> None:
+        if symbol not in self.markets:
+            raise ccxt.BadSymbol(f"okx does not have market symbol {symbol}")
+
+    def _fill(self, symbol: str, side: str, amount: float, params: dict | None) -> dict:
+        self._check_symbol(symbol)
+        params = params or {}
+        client_id = params.get("clOrdId")
+        if client_id and client_id in self._client_ids:
+            raise ccxt.InvalidOrder(f"51016 Duplicated clOrdId {client_id}")
+        if side not in ("buy", "sell"):
+            raise ccxt.InvalidOrder(f"invalid side {side}")
+        contracts = float(amount)
+        if contracts <= 0:
+            raise ccxt.InvalidOrder("51000 Parameter sz error")
+
+        pos_side = params.get("posSide") or ("long" if side == "buy" else "short")
+        opening = (side == "buy") == (pos_side == "long")
+        if params.get("reduceOnly") and opening:
+            raise ccxt.InvalidOrder("51169 Order failed because you don't have any positions in this direction")
+
+        key = (symbol, pos_side)
+        held, entry = self.positions.get(key, (0.0, 0.0))
+        last = self.last_price(symbol)
+        price = last * (1 + self.slippage) if side == "buy" else last * (1 - self.slippage)
+        cs = self._contract_size(symbol)
+
+        if opening:
+            notional = contracts * cs * price
+            fee = notional * self.fee_rate
+            free = self.equity() - self._used_margin()
+            if notional / self.leverage + fee > free:
+                raise ccxt.InsufficientFunds("51008 Order failed. Insufficient USDT margin in account")
+            total = held + contracts
+            self.positions[key] = [total, (held * entry + contracts * price) / total]
+        else:
+            if held <= 0:
+                raise ccxt.InvalidOrder("51169 Order failed because you don't have any positions in this direction")
+            contracts = min(contracts, held)
+            sign = 1.0 if pos_side == "long" else -1.0
+            fee = contracts * cs * price * self.fee_rate
+            self.wallet += sign * (price - entry) * contracts * cs
+            remaining = held - contracts
+            if remaining <= 1e-12:
+                del self.positions[key]
+            else:
+                self.positions[key] = [remaining, entry]
+        self.wallet -= fee
+
+        self._seq += 1
+        order_id = str(self._seq)
+        # 成交时间严格递增（bar 时间 + 全局序号），账本按时间增量拉取时不会漏单或乱序
+        ts = self.now + self._seq
+        info = {"ordId": order_id, "billId": order_id, "clOrdId": client_id or "", "posSide": pos_side, "fillPx": str(price)}
+        order = {
+            "id": order_id,
+            "clientOrderId": client_id,
+            "timestamp": ts,
+            "datetime": ccxt.Exchange.iso8601(ts),
+            "symbol": symbol,
+            "type": "market",
+            "side": side,
+            "amount": contracts,
+            "filled": contracts,
+            "remaining": 0.0,
+            "price": price,
+            "average": price,
+            "cost": contracts * cs * price,
+            "status": "closed",
+            "reduceOnly": not opening,
+            "fee": {"cost": fee, "currency": "USDT"},
+            "info": info,
+        }
+        self.orders[order_id] = order
+        if client_id:
+            self._client_ids[client_id] = order_id
+        self.trades.append(
+            {
+                "id": order_id,
+                "order": order_id,
+                "timestamp": ts,
+                "datetime": order["datetime"],
+                "symbol": symbol,
+                "side": side,
+                "amount": contracts,
+                "price": price,
+                "cost": order["cost"],
+                "fee": order["fee"],
+                "info": info,
+            }
+        )
+        return order
+
+    # ---- ccxt 接口（同步） ----
+    def _request(self, name: str) -> None:
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def set_sandbox_mode(self, enabled: bool) -> None:
+        pass
+
+    def set_position_mode(self, hedged: bool, symbol: str | None = None) -> dict:
+        self._request("set_position_mode")
+        return {}
+
+    def load_markets(self, reload: bool = False, params: dict | None = None) -> dict:
+        self._request("load_markets")
+        return self.markets
+
+    def set_markets(self, markets, currencies=None) -> dict:
+        # 本地 markets 缓存注入的元数据只覆盖已模拟的合约
+        values = markets.values() if isinstance(markets, dict) else markets
+        for m in values:
+            if m.get("symbol") in self.markets:
+                self.markets[m["symbol"]] = {**self.markets[m["symbol"]], **m}
+        return self.markets
+
+    def market(self, symbol: str) -> dict:
+        self._check_symbol(symbol)
+        return self.markets[symbol]
+
+    def amount_to_precision(self, symbol: str, amount: float) -> str:
+        step = float(self.market(symbol)["precision"]["amount"])
+        decimals = max(0, -int(math.floor(math.log10(step))))
+        return f"{math.floor(float(amount) / step + 1e-9) * step:.{decimals}f}"
+
+    def fetch_ohlcv(
+        self,
+        symbol: str,
+        timeframe: str = TIMEFRAME,
+        since: int | None = None,
+        limit: int | None = None,
+        params: dict | None = None,
+    ) -> list[list]:
+        self._request("fetch_ohlcv")
+        self._check_symbol(symbol)
+        ts = self._ts[symbol]
+        end = int(np.searchsorted(ts, self.now, side="right"))
+        limit = limit or 100
+        if since is None:
+            start = max(0, end - limit)
+        else:
+            start = int(np.searchsorted(ts, since, side="left"))
+            end = min(end, start + limit)
+        return [[t, *r] for t, r in zip(ts[start:end].tolist(), self._ohlcv[symbol][start:end].tolist())]
+
+    def fetch_balance(self, params: dict | None = None) -> dict:
+        self._request("fetch_balance")
+        total = self.equity()
+        free = max(total - self._used_margin(), 0.0)
+        usdt = {"free": free, "used": total - free, "total": total}
+        return {
+            "USDT": usdt,
+            "free": {"USDT": free},
+            "used": {"USDT": usdt["used"]},
+            "total": {"USDT": total},
+            "info": {},
+        }
+
+    def fetch_positions(self, symbols: list[str] | None = None, params: dict | None = None) -> list[dict]:
+        self._request("fetch_positions")
+        result = []
+        for (sym, pos_side), (contracts, entry) in self.positions.items():
+            if symbols and sym not in symbols:
+                continue
+            cs = self._contract_size(sym)
+            last = self.last_price(sym)
+            sign = 1.0 if pos_side == "long" else -1.0
+            result.append(
+                {
+                    "symbol": sym,
+                    "side": pos_side,
+                    "contracts": contracts,
+                    "contractSize": cs,
+                    "entryPrice": entry,
+                    "markPrice": last,
+                    "notional": contracts * cs * last,
+                    "unrealizedPnl": sign * (last - entry) * contracts * cs,
+                    "leverage": self.leverage,
+                    "marginMode": "cross",
+                    "hedged": True,
+                    "info": {"posSide": pos_side},
+                }
+            )
+        return result
+
+    def fetch_my_trades(
+        self,
+        symbol: str | None = None,
+        since: int | None = None,
+        limit: int | None = None,
+        params: dict | None = None,
+    ) -> list[dict]:
+        self._request("fetch_my_trades")
+        after = (params or {}).get("after")
+        trades = [
+            t for t in self.trades
+            if (symbol is None or t["symbol"] == symbol)
+            and (since is None or t["timestamp"] >= since)
+            and (after is None or int(t["info"]["billId"]) < int(after))
+        ]
+        # 同 OKX fills-history + ccxt：每页最多 100 笔、取最新的一页（按时间升序返回），传了 since 时不下发 limit
+        page = FILLS_PAGE_LIMIT if since is not None or not limit else min(limit, FILLS_PAGE_LIMIT)
+        return trades[-page:]
+
+    def create_order(
+        self,
+        symbol: str,
+        type: str,
+        side: str,
+        amount: float,
+        price: float | None = None,
+        params: dict | None = None,
+    ) -> dict:
+        self._request("create_order")
+        return self._fill(symbol, side, amount, params)
+
+    def create_orders(self, orders: list[dict], params: dict | None = None) -> list[dict]:
+        self._request("create_orders")
+        if len(orders) > 20:
+            raise ccxt.BadRequest("51004 batch orders exceed 20")
+        results = []
+        for o in orders:
+            try:
+                results.append(self._fill(o["symbol"], o["side"], o["amount"], o.get("params")))
+            except ccxt.BaseError as e:
+                code, _, msg = str(e).partition(" ")
+                results.append({"id": None, "status": "rejected", "info": {"sCode": code, "sMsg": msg}})
+        return results
+
+    def fetch_order(self, id: str | None, symbol: str | None = None, params: dict | None = None) -> dict:
+        self._request("fetch_order")
+        client_id = (params or {}).get("clOrdId")
+        order_id = id or self._client_ids.get(client_id or "")
+        if order_id not in self.orders:
+            raise ccxt.OrderNotFound(f"51603 Order does not exist: {id or client_id}")
+        return self.orders[order_id]
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncMockOKX(MockOKX):
+    """MockOKX 的 ccxt.async_support 版本，latency 用 asyncio.sleep 模拟，可与并发请求重叠。"""
+
+    async def _request_async(self, name: str) -> None:
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _request(self, name: str) -> None:
+        # 计数与延迟已在 async 包装里处理
+        pass
+
+    async def set_position_mode(self, hedged: bool, symbol: str | None = None) -> dict:
+        await self._request_async("set_position_mode")
+        return {}
+
+    async def load_markets(self, reload: bool = False, params: dict | None = None) -> dict:
+        await self._request_async("load_markets")
+        return MockOKX.load_markets(self, reload, params)
+
+    async def fetch_ohlcv(self, symbol, timeframe=TIMEFRAME, since=None, limit=None, params=None) -> list[list]:
+        await self._request_async("fetch_ohlcv")
+        return MockOKX.fetch_ohlcv(self, symbol, timeframe, since, limit, params)
+
+    async def fetch_balance(self, params=None) -> dict:
+        await self._request_async("fetch_balance")
+        return MockOKX.fetch_balance(self, params)
+
+    async def fetch_positions(self, symbols=None, params=None) -> list[dict]:
+        await self._request_async("fetch_positions")
+        return MockOKX.fetch_positions(self, symbols, params)
+
+    async def fetch_my_trades(self, symbol=None, since=None, limit=None, params=None) -> list[dict]:
+        await self._request_async("fetch_my_trades")
+        return MockOKX.fetch_my_trades(self, symbol, since, limit, params)
+
+    async def create_order(self, symbol, type, side, amount, price=None, params=None) -> dict:
+        await self._request_async("create_order")
+        return MockOKX.create_order(self, symbol, type, side, amount, price, params)
+
+    async def create_orders(self, orders, params=None) -> list[dict]:
+        await self._request_async("create_orders")
+        return MockOKX.create_orders(self, orders, params)
+
+    async def fetch_order(self, id, symbol=None, params=None) -> dict:
+        await self._request_async("fetch_order")
+        return MockOKX.fetch_order(self, id, symbol, params)
+
+    async def close(self) -> None:
+        pass
+
+
+def simulate(exchange: MockOKX, bars: int | None = None) -> dict:
+    """
+    在模拟交易所上逐根 bar 跑 live_okx.run_once（与实盘同一条代码路径），
+    返回权益曲线、全部下单结果与接口调用次数。
+    """
+    from live_okx import run_once
+
+    equity = []
+    executed = []
+    steps = 0
+    while True:
+        executed.extend(run_once(exchange, verbose=False))
+        equity.append((exchange.now, exchange.equity()))
+        steps += 1
+        if (bars is not None and steps >= bars) or not exchange.advance():
+            break
+    return {"equity": equity, "executed": executed, "calls": dict(exchange.calls)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="在离线模拟 OKX 上端到端运行 run_once")
+    parser.add_argument("data", help="CSV 文件或列式目录")
+    parser.add_argument("--warmup", type=int, default=300, help="起始前已有的 K 线数量")
+    parser.add_argument("--bars", type=int, default=None, help="最多模拟多少根 bar")
+    parser.add_argument("--balance", type=float, default=10_000.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="每次请求的模拟延迟（秒）")
+    args = parser.parse_args()
+
+    ex = MockOKX(read_candle_rows(args.data), start=args.warmup - 1, balance=args.balance, latency=args.latency)
+    started = time.perf_counter()
+    result = simulate(ex, bars=args.bars)
+    elapsed = time.perf_counter() - started
+    steps = len(result["equity"])
+    print(f"bars: {steps} | elapsed: {elapsed:.2f}s | {steps / elapsed:.0f} bars/s")
+    print(f"orders: {len(result['executed'])} | final equity: {result['equity'][-1][1]:.2f}")
+    print("calls:", result["calls"])
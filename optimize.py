@@ -0,0 +1,196 @@
+# optimize.py
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, fields
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from candle_store import is_columnar, load_columnar
+from strategy_engine import StrategyParams, backtest_arrays
+
+
+OHLCV_COLUMNS = ("open", "high", "low", "close", "volume")
+PARAM_NAMES = tuple(f.name for f in fields(StrategyParams))
+
+# 默认搜索空间：与 future_main.run_backtest 手动调参时用到的参数一致
+DEFAULT_SPACE: Dict[str, Sequence[Any]] = {
+    "ma_fast": [5, 10, 15, 20],
+    "ma_slow": [10, 20, 30, 60],
+    "buy_pct": [0.05, 0.10, 0.15],
+    "tp1_pct": [0.04, 0.06, 0.08],
+    "tp2_pct": [0.10, 0.14, 0.20],
+    "sl_pct": [0.10, 0.18],
+    "tp1_sell_prop": [0.5, 0.9],
+}
+
+METRIC_COLUMNS = (
+    "sharpe",
+    "sortino",
+    "max_drawdown",
+    "total_return_pct",
+    "annual_return_pct",
+    "win_rate_pct",
+    "profit_factor",
+    "total_completed",
+    "fills",
+)
+
+
+def grid(space: Dict[str, Sequence[Any]]) -> Iterator[Dict[str, Any]]:
+    names = list(space)
+    for values in itertools.product(*(space[k] for k in names)):
+        yield dict(zip(names, values))
+
+
+def random_combos(space: Dict[str, Sequence[Any]], n_iter: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    names = list(space)
+    for _ in range(n_iter):
+        yield {k: rng.choice(list(space[k])) for k in names}
+
+
+class SharedOHLCV:
+    """
+    OHLCV 列存放在一块 POSIX 共享内存里，shape=(5, n)，每列连续；
+    worker 只按名字 attach，不会把整段数组 pickle 过去。
+    """
+
+    def __init__(self, df: Any):
+        columns = df.columns if hasattr(df, "columns") else df.keys()
+        n = len(df["close"])
+        self.shape = (len(OHLCV_COLUMNS), n)
+        self.dtype = np.dtype(np.float64)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, n * len(OHLCV_COLUMNS) * 8))
+        arr = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf)
+        for i, col in enumerate(OHLCV_COLUMNS):
+            if col in columns:
+                arr[i] = np.asarray(df[col], dtype=np.float64)
+            else:
+                arr[i] = np.nan
+
+    @property
+    def spec(self) -> tuple:
+        return self.shm.name, self.shape, self.dtype.str
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self) -> "SharedOHLCV":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker(spec: tuple, backtest_kwargs: Dict[str, Any]) -> None:
+    name, shape, dtype = spec
+    # fork/spawn 出来的 worker 与主进程共用 resource_tracker，重复登记无害，由主进程统一 unlink
+    shm = shared_memory.SharedMemory(name=name)
+    data = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    _WORKER.update(shm=shm, data=data, kwargs=backtest_kwargs, sma_cache={})
+
+
+def _evaluate(combos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    data = _WORKER["data"]
+    close = data[OHLCV_COLUMNS.index("close")]
+    open_, high, low = (data[OHLCV_COLUMNS.index(col)] for col in ("open", "high", "low"))
+    if np.isnan(open_).all():
+        open_ = None
+    if np.isnan(high).all() or np.isnan(low).all():
+        high = low = None
+    rows = []
+    for combo in combos:
+        params = StrategyParams(**combo)
+        result = backtest_arrays(
+            close,
+            open_=open_,
+            high=high,
+            low=low,
+            params=params,
+            sma_cache=_WORKER["sma_cache"],
+            **_WORKER["kwargs"],
+        )
+        row = asdict(params)
+        row.update({k: result.stats.get(k) for k in METRIC_COLUMNS})
+        rows.append(row)
+    return rows
+
+
+def _chunked(items: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    it = iter(items)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def rank(rows: List[Dict[str, Any]], rank_by: str = "sharpe") -> pd.DataFrame:
+    table = pd.DataFrame(rows, columns=list(PARAM_NAMES) + list(METRIC_COLUMNS))
+    ascending = rank_by == "max_drawdown"
+    return table.sort_values(rank_by, ascending=ascending, na_position="last").reset_index(drop=True)
+
+
+def optimize(
+    df: Any,
+    space: Optional[Dict[str, Sequence[Any]]] = None,
+    n_iter: Optional[int] = None,
+    seed: int = 0,
+    workers: Optional[int] = None,
+    chunksize: int = 32,
+    rank_by: str = "sharpe",
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+    **backtest_kwargs: Any,
+) -> pd.DataFrame:
+    """
+    Grid search (n_iter=None) or random search (n_iter combos) over
+    StrategyParams. Combos are sent to a process pool in chunks; the OHLCV
+    columns are shared through shared memory and each worker keeps an SMA
+    cache, so repeated MA periods are computed once per process. Results are
+    passed to on_result as they finish and returned as a ranked DataFrame.
+    """
+    space = space or DEFAULT_SPACE
+    unknown = set(space) - set(PARAM_NAMES)
+    if unknown:
+        raise ValueError(f"未知参数: {sorted(unknown)}")
+    combos = grid(space) if n_iter is None else random_combos(space, n_iter, seed)
+    workers = workers or os.cpu_count() or 1
+
+    rows: List[Dict[str, Any]] = []
+    with SharedOHLCV(df) as shared:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(shared.spec, backtest_kwargs),
+        ) as pool:
+            futures = [pool.submit(_evaluate, chunk) for chunk in _chunked(combos, chunksize)]
+            for fut in as_completed(futures):
+                for row in fut.result():
+                    rows.append(row)
+                    if on_result is not None:
+                        on_result(row)
+    return rank(rows, rank_by)
+
+
+if __name__ == "__main__":
+    CSV_PATH = "okx/BTCUSDT_1d_2022_2023.csv"
+
+    data = load_columnar(CSV_PATH) if is_columnar(CSV_PATH) else pd.read_csv(CSV_PATH)
+    table = optimize(
+        data,
+        init_cash=80000.0,
+        commission=0.0005,
+        slippage_perc=0.0003,
+    )
+    pd.set_option("display.width", 200)
+    print("===== Top 20 by Sharpe =====")
+    print(table.head(20).to_string())
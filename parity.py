@@ -0,0 +1,103 @@
+import argparse
+import sys
+import time
+from typing import Any
+
+import pandas as pd
+
+from candle_store import CANDLE_DTYPE, candles_from_rows, read_candle_rows
+from strategy_engine import StrategyParams, StrategyState, backtest
+
+
+# 规则一致性基准：同一份 rule_core 规则经三个入口跑出的动作流 (bar 下标, op) 必须逐条一致
+#   live：逐根 bar 调 StrategyState.process_bar（实盘路径），在收盘价成交
+#   array：strategy_engine.backtest 向量化回测，fill_on="close" 对比 live，"next_open" 对比 backtrader
+#   backtrader：future_strategy.BTCMaBreakoutTP，下一根开盘成交
+
+
+def replay_live(df: pd.DataFrame, params: StrategyParams, init_cash: float, commission: float) -> list[tuple]:
+    state = StrategyState(params=params)
+    cash, position = float(init_cash), 0.0
+    # 实盘传给 process_bar 的是 CandleStore 形式的结构化数组
+    bars = candles_from_rows(df[list(CANDLE_DTYPE.names)].values.tolist())
+    close = df["close"].tolist()
+    actions = []
+    for i in range(1, len(df) + 1):
+        price = close[i - 1]
+        for a in state.process_bar(bars[:i], cash + position * price, cash):
+            value = a["size"] * a["price"]
+            comm = value * commission
+            if a["side"] == "buy":
+                cash -= value + comm
+                position += a["size"]
+            else:
+                cash += value - comm
+                position -= a["size"]
+            actions.append((i - 1, a["op"]))
+    return actions
+
+
+def array_actions(df: pd.DataFrame, params: StrategyParams, init_cash: float, commission: float, fill_on: str) -> list[tuple]:
+    result = backtest(df, params, init_cash=init_cash, commission=commission, fill_on=fill_on)
+    # next_open 模式下动作在下一根 bar 成交，换算回产生动作的 bar
+    shift = 1 if fill_on == "next_open" else 0
+    return [(f["bar"] - shift, f["op"]) for f in result.fills]
+
+
+def backtrader_actions(path: str, params: StrategyParams, init_cash: float, commission: float, n: int) -> list[tuple]:
+    import backtrader as bt
+
+    from future_main import make_data_feed
+    from future_strategy import BTCMaBreakoutTP
+
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(make_data_feed(path))
+    cerebro.broker.setcash(init_cash)
+    cerebro.broker.setcommission(commission=commission)
+    kwargs = {k: getattr(params, k) for k in ("ma_fast", "ma_slow", "buy_pct", "tp1_pct", "tp2_pct", "sl_pct", "tp1_sell_prop")}
+    cerebro.addstrategy(BTCMaBreakoutTP, csv_output="", **kwargs)
+    strat = cerebro.run()[0]
+    # 最后一根 bar 上的动作在 backtrader 里不会成交，向量化回测也不会产生
+    return [a for a in strat.actions if a[0] < n - 1]
+
+
+def diff(name: str, expected: list[tuple], actual: list[tuple]) -> bool:
+    if expected == actual:
+        print(f"{name}: OK ({len(actual)} actions)")
+        return True
+    k = next((i for i, (a, b) in enumerate(zip(expected, actual)) if a != b), min(len(expected), len(actual)))
+    print(f"{name}: MISMATCH at action #{k} ({len(expected)} vs {len(actual)} actions)")
+    print(f"  expected: {expected[k:k + 3]}")
+    print(f"  actual:   {actual[k:k + 3]}")
+    return False
+
+
+def timed(label: str, fn: Any, *args: Any) -> Any:
+    started = time.perf_counter()
+    out = fn(*args)
+    print(f"  {label:<20} {time.perf_counter() - started:8.3f}s")
+    return out
+
+
+def run_parity(path: str, init_cash: float = 10_000.0, commission: float = 0.001, skip_backtrader: bool = False) -> bool:
+    df = pd.DataFrame(read_candle_rows(path), columns=list(CANDLE_DTYPE.names))
+    params = StrategyParams()
+    print(f"{path}: {len(df)} bars")
+    live = timed("live (process_bar)", replay_live, df, params, init_cash, commission)
+    array_close = timed("array (close)", array_actions, df, params, init_cash, commission, "close")
+    ok = diff("live vs array", live, array_close)
+    if not skip_backtrader:
+        array_open = timed("array (next_open)", array_actions, df, params, init_cash, commission, "next_open")
+        bt_actions = timed("backtrader", backtrader_actions, path, params, init_cash, commission, len(df))
+        ok = diff("backtrader vs array", array_open, bt_actions) and ok
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对比实盘引擎、向量化回测与 backtrader 的动作流")
+    parser.add_argument("data", nargs="?", default="okx/BTCUSDT_1d_2022_2023.csv", help="CSV 文件或列式目录")
+    parser.add_argument("--cash", type=float, default=10_000.0)
+    parser.add_argument("--commission", type=float, default=0.001)
+    parser.add_argument("--skip-backtrader", action="store_true")
+    args = parser.parse_args()
+    sys.exit(0 if run_parity(args.data, args.cash, args.commission, args.skip_backtrader) else 1)
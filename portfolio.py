@@ -0,0 +1,166 @@
+import asyncio
+import os
+
+import pandas as pd
+
+from candle_store import CandleStore
+from live_okx import (
+    CANDLES_DIR,
+    HEDGE_MODE,
+    OHLCV_LIMIT,
+    TIMEFRAME,
+    ExchangeSession,
+    _candles_to_df,
+    _order_requests,
+    assign_client_order_ids,
+    create_async_exchange,
+    create_market_cache,
+    create_state_checkpoint,
+    create_trade_ledger,
+    get_account_value_and_cash,
+    load_strategy_state,
+    recover_pending_decision_async,
+    record_strategy_state,
+    submit_orders_async,
+    sync_state_from_exchange,
+)
+from strategy_engine import StrategyState
+
+
+# 组合运行的合约列表，逗号分隔
+PORTFOLIO_SYMBOLS = [
+    s.strip()
+    for s in os.getenv("PORTFOLIO_SYMBOLS", "BTC/USDT:USDT,ETH/USDT:USDT,SOL/USDT:USDT").split(",")
+    if s.strip()
+]
+
+
+def plan_portfolio(
+    states: dict[str, StrategyState],
+    frames: dict[str, pd.DataFrame],
+    account_value: float,
+    cash: float,
+) -> dict[str, list[dict]]:
+    """
+    一次遍历所有合约的 process_bar。所有合约共用同一账户权益做仓位计算，
+    已计划的开仓名义价值从可用资金中扣除，避免多个合约同时开仓时超额使用保证金。
+    """
+    plan: dict[str, list[dict]] = {}
+    for symbol, state in states.items():
+        df = frames.get(symbol)
+        if df is None or df.empty:
+            plan[symbol] = []
+            continue
+        actions = state.process_bar(df, account_value, cash)
+        for act in actions:
+            if act["op"].startswith("open_"):
+                cash -= float(act.get("notional", 0) or 0)
+        plan[symbol] = actions
+    return plan
+
+
+def print_portfolio_summary(
+    session: ExchangeSession,
+    states: dict[str, StrategyState],
+    frames: dict[str, pd.DataFrame],
+    executed: dict[str, list[dict]],
+) -> None:
+    balance = session.balance()
+    usdt = balance.get("USDT", {})
+    usdt_free = float(usdt.get("free", 0) or 0)
+    usdt_total = float(usdt.get("total", 0) or 0)
+
+    print("\n===== Portfolio Run =====")
+    print("Time:", pd.Timestamp.now(), "| Timeframe:", TIMEFRAME)
+    print("USDT free:", f"{usdt_free:.4f}", "USDT total:", f"{usdt_total:.4f}")
+    for symbol, state in states.items():
+        df = frames.get(symbol)
+        last = float(df["close"].iloc[-1]) if df is not None and not df.empty else float("nan")
+        contracts = {"long": 0.0, "short": 0.0}
+        for p in session.positions(symbol):
+            side = (p.get("side") or "").lower()
+            if side in contracts:
+                contracts[side] += float(p.get("contracts", 0) or 0)
+        ops = ", ".join(
+            item["action"]["op"] + (" (failed)" if item.get("error") else "")
+            for item in executed.get(symbol, [])
+        ) or "-"
+        print(
+            f"{symbol:<16}",
+            "| close:", f"{last:.4f}",
+            "| long/short contracts:", f"{contracts['long']:.4f}/{contracts['short']:.4f}",
+            "| entries L/S:", f"{len(state.long_entries)}/{len(state.short_entries)}",
+            "| orders:", ops,
+        )
+    print("=========================\n")
+
+
+async def run_portfolio_once(symbols: list[str] | None = None) -> dict[str, list[dict]]:
+    """
+    单进程跑多个合约：一个已认证的交易所连接、markets/positions 批量拉一次、
+    余额全账户共用；各合约的 K 线与成交记录并发拉取，再一次性评估、并发下单。
+    """
+    symbols = symbols or PORTFOLIO_SYMBOLS
+    exchange = create_async_exchange()
+    try:
+        market_cache = create_market_cache()
+        session = ExchangeSession(
+            exchange, symbols=symbols, market_cache=market_cache, ledger=create_trade_ledger()
+        )
+        store = CandleStore(CANDLES_DIR)
+
+        async def set_position_mode() -> None:
+            try:
+                await exchange.set_position_mode(HEDGE_MODE)
+            except Exception:
+                pass
+
+        await session.markets_async()
+        results = await asyncio.gather(
+            set_position_mode(),
+            session.refresh_async("balance", "positions", "trades"),
+            *(store.sync_async(exchange, s, TIMEFRAME, limit=OHLCV_LIMIT) for s in symbols),
+        )
+        frames = {s: _candles_to_df(tail) for s, tail in zip(symbols, results[2:])}
+
+        checkpoint = create_state_checkpoint()
+        await recover_pending_decision_async(exchange, checkpoint)
+        states = {s: load_strategy_state(checkpoint, s) for s in symbols}
+        for s in symbols:
+            sync_state_from_exchange(exchange, states[s], session, symbol=s)
+
+        account_value, cash = get_account_value_and_cash(exchange, 0.0, session)
+        decision_ids = {s: str(int(frames[s]["timestamp"].iloc[-1])) for s in symbols if not frames[s].empty}
+        # 中断前已下单、恢复时已对账的合约，这根 bar 不再重新决策
+        todo = {s: st for s, st in states.items() if checkpoint.acted(s) != decision_ids.get(s)}
+        plan = plan_portfolio(todo, frames, account_value, cash)
+        plan = {s: plan.get(s, []) for s in symbols}
+        for s in symbols:
+            if plan[s]:
+                assign_client_order_ids(plan[s], s, decision_ids[s])
+        if any(plan.values()):
+            checkpoint.begin(states, None, plan)
+
+        # 所有合约的订单合并成一组，走 OKX 批量下单（每批最多 20 笔）
+        requests = []
+        for s in symbols:
+            if plan[s]:
+                requests.extend(_order_requests(exchange, plan[s], session.contract_size(s), s))
+        executed: dict[str, list[dict]] = {}
+        for req, item in zip(requests, await submit_orders_async(exchange, requests)):
+            executed.setdefault(req["symbol"], []).append(item)
+        for s in symbols:
+            record_strategy_state(session, states[s], s)
+        checkpoint.commit(states, acted={s: decision_ids[s] for s in symbols if plan[s]})
+        if any(item["order"] is not None for items in executed.values() for item in items):
+            session.order_placed()
+            await session.refresh_async("balance", "positions")
+        print_portfolio_summary(session, states, frames, executed)
+        market_cache.join(timeout=30)
+        return executed
+    finally:
+        await exchange.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_portfolio_once())
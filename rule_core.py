@@ -0,0 +1,160 @@
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from entry_book import EntryBook
+from stop_utils import ladder_threshold
+
+
+# 入场信号规则：每个方向是若干条件的“与”，条件为 (类型, 周期)；
+# 周期可以是数字或参数名（如 "ma_fast"，从 params 上取）。类型：
+#   cross_up / cross_down：收盘价上穿 / 下穿该周期 SMA（上一根在线下/上，当前在线上/下）
+#   above / below：收盘价在该周期 SMA 之上 / 之下
+SIGNAL_SPEC: Dict[str, Tuple[Tuple[str, Any], ...]] = {
+    "long": (("cross_up", "ma_fast"), ("cross_up", "ma_slow"), ("above", 120)),
+    "short": (("cross_down", "ma_fast"), ("cross_down", "ma_slow"), ("below", 120)),
+}
+
+# 一个动作：(op, 下单方向, 数量, 成交参考价)
+Action = Tuple[str, str, float, float]
+
+
+def resolve_period(period: Any, params: Any) -> int:
+    return int(getattr(params, period)) if isinstance(period, str) else int(period)
+
+
+def spec_periods(spec: Dict[str, Tuple[Tuple[str, Any], ...]], params: Any) -> list:
+    """规则里引用到的全部 SMA 周期（去重、升序）。"""
+    return sorted({resolve_period(period, params) for conditions in spec.values() for _, period in conditions})
+
+
+def entry_signal(
+    conditions: Tuple[Tuple[str, Any], ...],
+    price: Any,
+    prev_price: Any,
+    smas: Dict[int, Tuple[Any, Any]],
+    params: Any,
+) -> Any:
+    """
+    按一个方向的规则判断入场信号。smas 为 {周期: (当前 SMA, 上一根 SMA)}。
+    price / prev_price / SMA 既可以是标量（实盘、backtrader），也可以是整段数组（向量化回测），
+    条件之间用 & 连接，两种输入得到逐元素一致的结果；SMA 为 NaN 时条件不成立。
+    """
+    ok: Any = bool(conditions)
+    for kind, period in conditions:
+        cur, prev = smas[resolve_period(period, params)]
+        if kind == "cross_up":
+            hit = (prev_price < prev) & (price > cur)
+        elif kind == "cross_down":
+            hit = (prev_price > prev) & (price < cur)
+        elif kind == "above":
+            hit = price > cur
+        elif kind == "below":
+            hit = price < cur
+        else:
+            raise ValueError(f"unknown signal condition: {kind}")
+        ok = ok & hit
+    return ok
+
+
+def take_exit(book: EntryBook, side: str, price: float, p: Any) -> Optional[Tuple[str, str, float]]:
+    """对一个方向的 entry 执行 TP1/SL/TP2 阶梯，返回 (op, 下单方向, 数量)，未触发返回 None。"""
+    hit = book.first_exit(price, side, p.tp1_pct, p.sl_pct, p.tp2_pct)
+    if hit is None:
+        return None
+    j, rule = hit
+    size = book.take_tp1(j, p.tp1_sell_prop) if rule == "tp1" else book.pop(j).size
+    return f"{rule}_{side}", "sell" if side == "long" else "buy", size
+
+
+# 价格上涨 / 下跌时会触发的规则
+_UP_RULES = {"long": ("tp1", "tp2"), "short": ("sl",)}
+_DOWN_RULES = {"long": ("sl",), "short": ("tp1", "tp2")}
+
+
+def intrabar_exit(
+    long_entries: EntryBook,
+    short_entries: EntryBook,
+    open_: float,
+    high: float,
+    low: float,
+    close: float,
+    p: Any,
+    drill: Optional[Callable[[float, float], Optional[str]]] = None,
+) -> Optional[Action]:
+    """
+    用一根 K 线的 open/high/low/close 执行 TP1/SL/TP2 阶梯，返回 (op, 下单方向, 数量, 成交价)。
+
+    只有一个方向（上涨触发的多头止盈/空头止损，或下跌触发的多头止损/空头止盈）被触及时直接取该方向；
+    两个方向都被触及时先问 drill(上涨触发价, 下跌触发价)（用更小周期 K 线判断先到哪边），
+    没有或判断不了时按 OHLC 路径假设：阳线先到低点，阴线先到高点。
+    方向内仍按“多头优先、最新 entry 优先、TP1 -> SL -> TP2”选一个；成交价为阈值价，跳空越过阈值时取开盘价。
+    """
+    books = ((long_entries, "long"), (short_entries, "short"))
+    args = (p.tp1_pct, p.sl_pct, p.tp2_pct)
+    up = [book.touched(high, low, side, *args, rules=_UP_RULES[side]) for book, side in books]
+    down = [book.touched(high, low, side, *args, rules=_DOWN_RULES[side]) for book, side in books]
+    has_up = any(hit is not None for hit in up)
+    has_down = any(hit is not None for hit in down)
+    if not has_up and not has_down:
+        return None
+
+    if has_up and has_down:
+        first = None
+        if drill is not None:
+            levels = [book.trigger_levels(side, *args) for book, side in books]
+            first = drill(min(lv[0] for lv in levels), max(lv[1] for lv in levels))
+        if first is None:
+            first = "down" if close >= open_ else "up"
+        rising = first == "up"
+    else:
+        rising = has_up
+
+    for (book, side), hit in zip(books, up if rising else down):
+        if hit is None:
+            continue
+        j, rule = hit
+        level = ladder_threshold(float(book.prices[j]), side, rule, *args)
+        fill_price = max(level, open_) if rising else min(level, open_)
+        size = book.take_tp1(j, p.tp1_sell_prop) if rule == "tp1" else book.pop(j).size
+        return f"{rule}_{side}", "sell" if side == "long" else "buy", size, fill_price
+    return None
+
+
+def decide(
+    p: Any,
+    long_entries: EntryBook,
+    short_entries: EntryBook,
+    price: float,
+    long_signal: bool,
+    short_signal: bool,
+    account_value: float,
+    cash: float,
+    bar: Optional[Tuple[float, float, float]] = None,
+    drill: Optional[Callable[[float, float], Optional[str]]] = None,
+) -> Optional[Action]:
+    """
+    一根 bar 的完整决策，每根 bar 最多一个动作：做多信号 -> 做空信号 -> TP1/SL/TP2 阶梯。
+    会直接修改 long_entries / short_entries。bar=(open, high, low) 时按盘中高低点处理止盈止损。
+
+    p 只需要有 buy_pct / tp1_pct / sl_pct / tp2_pct / tp1_sell_prop 属性，
+    StrategyParams 和 backtrader 策略的 self.p 都可以直接传入。
+    """
+    if price <= 0:
+        return None
+    if long_signal:
+        buy_amount = account_value * p.buy_pct
+        if buy_amount > 0 and cash >= buy_amount:
+            size = buy_amount / price
+            long_entries.add(price, size)
+            return "open_long", "buy", size, price
+    if short_signal and account_value > 0:
+        size = account_value * p.buy_pct / price
+        short_entries.add(price, size)
+        return "open_short", "sell", size, price
+
+    if bar is not None:
+        return intrabar_exit(long_entries, short_entries, bar[0], bar[1], bar[2], price, p, drill)
+    for book, side in ((long_entries, "long"), (short_entries, "short")):
+        exit_ = take_exit(book, side, price, p) if book else None
+        if exit_ is not None:
+            return exit_ + (price,)
+    return None
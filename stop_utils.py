@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def should_stop_loss(entry_price: float, current_price: float, side: str, sl_pct: float) -> bool:
     """
     通用止损判断函数。
@@ -20,3 +23,123 @@ def should_stop_loss(entry_price: float, current_price: float, side: str, sl_pct
 
     return pnl_pct <= -sl_pct
 
+
+
+# ---- 数组版本：一次 NumPy 运算判断多笔仓位 × 多根 bar ----
+
+def _check_side(side: str) -> None:
+    if side not in ("long", "short"):
+        raise ValueError('side 必须是 "long" 或 "short"')
+
+
+def pnl_pct(entry_prices, prices, side: str) -> np.ndarray:
+    """
+    收益率，与 should_stop_loss 的算法逐元素一致。
+
+    entry_prices、prices 都可以是标量或一维数组；两者都是数组时，
+    返回形状为 (len(prices), len(entry_prices))，即每行一根 bar、每列一笔仓位。
+    """
+    _check_side(side)
+    entry = np.asarray(entry_prices, dtype=np.float64)
+    price = np.asarray(prices, dtype=np.float64)
+    if entry.ndim and price.ndim:
+        price = price[:, None]
+    if side == "long":
+        return price / entry - 1.0
+    return entry / price - 1.0
+
+
+def stop_loss_mask(entry_prices, prices, side: str, sl_pct: float) -> np.ndarray:
+    """逐元素的止损命中掩码；sl_pct <= 0 时全部为 False。"""
+    pnl = pnl_pct(entry_prices, prices, side)
+    if sl_pct <= 0:
+        return np.zeros(pnl.shape, dtype=bool)
+    return pnl <= -sl_pct
+
+
+def take_profit_mask(entry_prices, prices, side: str, tp_pct: float) -> np.ndarray:
+    """逐元素的止盈命中掩码。"""
+    return pnl_pct(entry_prices, prices, side) >= tp_pct
+
+
+def first_hit(mask) -> np.ndarray | int:
+    """
+    沿 bar 方向（第 0 轴）的首次命中下标，未命中为 -1。
+    一维掩码返回 int，二维 (bar, 仓位) 掩码返回每笔仓位的下标数组。
+    """
+    mask = np.asarray(mask, dtype=bool)
+    if mask.shape[0] == 0:
+        return -1 if mask.ndim == 1 else np.full(mask.shape[1:], -1, dtype=np.int64)
+    idx = np.argmax(mask, axis=0)
+    hit = np.take_along_axis(mask, np.expand_dims(idx, 0), axis=0)[0] if mask.ndim > 1 else mask[idx]
+    if mask.ndim == 1:
+        return int(idx) if hit else -1
+    return np.where(hit, idx, -1)
+
+
+def first_stop_loss(entry_prices, prices, side: str, sl_pct: float) -> np.ndarray | int:
+    """每笔仓位在价格序列中首次触发止损的 bar 下标（-1 表示未触发）。"""
+    return first_hit(stop_loss_mask(entry_prices, prices, side, sl_pct))
+
+
+def first_take_profit(entry_prices, prices, side: str, tp_pct: float) -> np.ndarray | int:
+    """每笔仓位在价格序列中首次触发止盈的 bar 下标（-1 表示未触发）。"""
+    return first_hit(take_profit_mask(entry_prices, prices, side, tp_pct))
+
+
+def ladder_exit(
+    entry_prices,
+    tp1_done,
+    price: float,
+    side: str,
+    tp1_pct: float,
+    sl_pct: float,
+    tp2_pct: float,
+    sl_price: float | None = None,
+    rules: tuple[str, ...] = ("tp1", "sl", "tp2"),
+) -> tuple[int, str] | None:
+    """
+    当前价格下的 TP1/SL/TP2 阶梯：返回 (下标, "tp1" | "sl" | "tp2")。
+    从最新（下标最大）的仓位往前找第一笔触发的，同一笔内按 TP1 -> SL -> TP2 的优先级。
+
+    price 用于止盈判断，sl_price 用于止损判断（默认同 price；按 K 线高低点判断时，
+    多头传 high / low、空头传 low / high）；rules 只保留指定的规则。
+    """
+    done = np.asarray(tp1_done, dtype=bool)
+    pnl = pnl_pct(entry_prices, price, side)
+    sl_pnl = pnl if sl_price is None else pnl_pct(entry_prices, sl_price, side)
+    none = np.zeros(pnl.shape, dtype=bool)
+    tp1 = ~done & (pnl >= tp1_pct) if "tp1" in rules else none
+    sl = sl_pnl <= -sl_pct if sl_pct > 0 and "sl" in rules else none
+    tp2 = done & (pnl >= tp2_pct) if "tp2" in rules else none
+    hits = np.flatnonzero(tp1 | sl | tp2)
+    if hits.size == 0:
+        return None
+    j = int(hits[-1])
+    return j, "tp1" if tp1[j] else "sl" if sl[j] else "tp2"
+
+
+def ladder_threshold(entry_price: float, side: str, rule: str, tp1_pct: float, sl_pct: float, tp2_pct: float) -> float:
+    """规则恰好触发时的价格：多头 entry * (1 + pct)，空头 entry / (1 + pct)，止损取 -sl_pct。"""
+    _check_side(side)
+    pct = {"tp1": tp1_pct, "sl": -sl_pct, "tp2": tp2_pct}[rule]
+    return entry_price * (1.0 + pct) if side == "long" else entry_price / (1.0 + pct)
+
+
+def first_touch(open_, high, low, close, up_level: float, down_level: float) -> str | None:
+    """
+    按时间顺序扫描一段（通常是更小周期的）K 线，判断先触及 up_level（high >= up_level）
+    还是 down_level（low <= down_level），返回 "up" / "down"；都未触及返回 None。
+    同一根 K 线两边都触及时，按 OHLC 路径假设：阳线先到低点（"down"），阴线先到高点（"up"）。
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    up = first_hit(high >= up_level)
+    down = first_hit(low <= down_level)
+    if up < 0 and down < 0:
+        return None
+    if down < 0 or 0 <= up < down:
+        return "up"
+    if up < 0 or down < up:
+        return "down"
+    return "down" if close[up] >= open_[up] else "up"
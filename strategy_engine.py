@@ -1,18 +1,36 @@
+import functools
 import json
+import math
 from dataclasses import asdict, dataclass, field
-from typing import List, Dict, Any
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
-import pandas as pd
+from analytics import analyze
+from entry_book import Entry, EntryBook
+from indicators import SignalIndicators
+from rule_core import SIGNAL_SPEC, Action, decide, entry_signal, spec_periods
+from stop_utils import first_touch
+from stop_utils import should_stop_loss  # noqa: F401  兼容从 strategy_engine 导入
 
 
-def should_stop_loss(entry_price: float, current_price: float, side: str, sl_pct: float) -> bool:
-    if sl_pct <= 0:
-        return False
-    if side == "long":
-        pnl_pct = current_price / entry_price - 1.0
-    else:
-        pnl_pct = entry_price / current_price - 1.0
-    return pnl_pct <= -sl_pct
+def ohlcv_column(data: Any, name: str) -> Optional[Sequence[Any]]:
+    """
+    取 K 线数据的一列，返回可按位置下标 / 切片的序列；没有该列时返回 None。
+
+    data 可以是 CandleStore.tail() / candles_from_rows() 返回的结构化数组、
+    {列名: ndarray / array('d') / list} 映射，或 pandas DataFrame（取底层 ndarray，不复制）。
+    """
+    dtype = getattr(data, "dtype", None)
+    if dtype is not None and dtype.names:
+        return data[name] if name in dtype.names else None
+    if name not in (data.columns if hasattr(data, "columns") else data.keys()):
+        return None
+    col = data[name]
+    return col.to_numpy() if hasattr(col, "to_numpy") else col
+
+
+def _tail_floats(values: Sequence[Any], n: int) -> List[float]:
+    tail = values[-n:]
+    return [float(x) for x in (tail.tolist() if hasattr(tail, "tolist") else tail)]
 
 
 @dataclass
@@ -24,212 +42,447 @@ class StrategyParams:
     tp2_pct: float = 0.14
     sl_pct: float = 0.18
     tp1_sell_prop: float = 0.9
-
-
-@dataclass
-class Entry:
-    price: float
-    size: float
-    tp1_done: bool = False
+    # "close"：只用收盘价判断 TP/SL；"intrabar"：用 K 线高低点判断，并按阈值价成交
+    exit_mode: str = "close"
 
 
 @dataclass
 class StrategyState:
     params: StrategyParams = field(default_factory=StrategyParams)
-    long_entries: List[Entry] = field(default_factory=list)
-    short_entries: List[Entry] = field(default_factory=list)
+    long_entries: EntryBook = field(default_factory=EntryBook)
+    short_entries: EntryBook = field(default_factory=EntryBook)
     completed_long_trades: int = 0
     completed_short_trades: int = 0
+    indicators: Optional[SignalIndicators] = None
 
-    def to_json(self) -> str:
-        data = asdict(self)
-        data["params"] = asdict(self.params)
-        data["long_entries"] = [asdict(e) for e in self.long_entries]
-        data["short_entries"] = [asdict(e) for e in self.short_entries]
-        return json.dumps(data)
+    def __setattr__(self, name: str, value: Any) -> None:
+        # 允许直接赋值 List[Entry]，统一存成数组形式的 EntryBook
+        if name in ("long_entries", "short_entries") and not isinstance(value, EntryBook):
+            value = EntryBook(value)
+        super().__setattr__(name, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "params": asdict(self.params),
+            "long_entries": [asdict(e) for e in self.long_entries],
+            "short_entries": [asdict(e) for e in self.short_entries],
+            "completed_long_trades": self.completed_long_trades,
+            "completed_short_trades": self.completed_short_trades,
+            "indicators": self.indicators.to_dict() if self.indicators else None,
+        }
 
     @classmethod
-    def from_json(cls, s: str) -> "StrategyState":
-        raw = json.loads(s)
+    def from_dict(cls, raw: Dict[str, Any]) -> "StrategyState":
         params = StrategyParams(**raw.get("params", {}))
         long_entries = [Entry(**e) for e in raw.get("long_entries", [])]
         short_entries = [Entry(**e) for e in raw.get("short_entries", [])]
         completed_long_trades = raw.get("completed_long_trades", 0)
         completed_short_trades = raw.get("completed_short_trades", 0)
+        indicators = SignalIndicators.from_dict(raw["indicators"]) if raw.get("indicators") else None
         return cls(
             params=params,
             long_entries=long_entries,
             short_entries=short_entries,
             completed_long_trades=completed_long_trades,
             completed_short_trades=completed_short_trades,
+            indicators=indicators,
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_json(cls, s: str) -> "StrategyState":
+        return cls.from_dict(json.loads(s))
+
+    def _signal_inputs(
+        self,
+        df: Any,
+        close: Sequence[Any],
+        incremental: bool,
+    ) -> Tuple[float, float, float, float, float, float, float]:
+        fast, slow = self.params.ma_fast, self.params.ma_slow
+        ts = ohlcv_column(df, "timestamp") if incremental else None
+
+        if ts is not None and self.indicators is not None and self.indicators.matches(fast, slow, 120):
+            if self.indicators.advance(
+                int(ts[-2]),
+                int(ts[-1]),
+                float(close[-2]),
+                float(close[-1]),
+            ):
+                return self.indicators.snapshot()
+
+        # full-frame path: used when cold, on gaps, or when incremental=False.
+        # Only the newest two windows of each SMA are needed, so only the last
+        # max_period + 1 closes are read.
+        warmup = max(fast, slow, 120) + 1
+        closes = _tail_floats(close, warmup)
+
+        def sma(period: int, end: int) -> float:
+            return math.fsum(closes[end - period:end]) / period
+
+        n = len(closes)
+        inputs = (
+            closes[-1],
+            closes[-2],
+            sma(fast, n),
+            sma(fast, n - 1),
+            sma(slow, n),
+            sma(slow, n - 1),
+            sma(120, n),
+        )
+        if ts is not None:
+            self.indicators = SignalIndicators.from_closes(fast, slow, 120, closes, int(ts[-1]))
+        return inputs
+
+    def _apply(self, action: Optional[Action]) -> List[Dict[str, Any]]:
+        if action is None:
+            return []
+        op, order_side, size, price = action
+        if op == "tp2_long":
+            self.completed_long_trades += 1
+        elif op == "tp2_short":
+            self.completed_short_trades += 1
+        out: Dict[str, Any] = {"op": op, "side": order_side, "size": size, "price": price}
+        if op.startswith("open_"):
+            out["notional"] = size * price
+        return [out]
+
+    def check_exits(
+        self,
+        price: float,
+        high: Optional[float] = None,
+        low: Optional[float] = None,
+        open_: Optional[float] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        TP1/SL/TP2 ladder only: newest entry first, at most one action. Used
+        directly on mark-price ticks.
+
+        With the bar's high/low the ladder is resolved intrabar (see
+        rule_core.intrabar_exit) and the action price is the threshold that was touched.
+        """
+        bar = None
+        if high is not None and low is not None:
+            bar = (open_ if open_ is not None else price, high, low)
+        return self._apply(
+            decide(self.params, self.long_entries, self.short_entries, price, False, False, 0.0, 0.0, bar)
         )
 
     def process_bar(
         self,
-        df: pd.DataFrame,
+        df: Any,
         account_value: float,
         cash: float,
+        incremental: bool = True,
     ) -> List[Dict[str, Any]]:
-        if "close" not in df.columns:
+        """
+        Run the entry signals and the exit ladder on the newest bar of df.
+
+        df only needs positional column access (see ohlcv_column): the live
+        runner passes CandleStore's structured arrays directly, a DataFrame
+        still works as an adapter.
+        """
+        close = ohlcv_column(df, "close")
+        if close is None:
             return []
-        close = df["close"]
         max_period = max(self.params.ma_fast, self.params.ma_slow, 120)
         if len(close) < max_period + 1:
             return []
 
-        ma_fast = close.rolling(self.params.ma_fast).mean()
-        ma_slow = close.rolling(self.params.ma_slow).mean()
-        ma120 = close.rolling(120).mean()
-
-        idx = len(close) - 1
-        price = float(close.iloc[idx])
-        prev_price = float(close.iloc[idx - 1])
-        last_ma_fast = float(ma_fast.iloc[idx])
-        prev_ma_fast = float(ma_fast.iloc[idx - 1])
-        last_ma_slow = float(ma_slow.iloc[idx])
-        prev_ma_slow = float(ma_slow.iloc[idx - 1])
-        last_ma120 = float(ma120.iloc[idx])
+        (
+            price,
+            prev_price,
+            last_ma_fast,
+            prev_ma_fast,
+            last_ma_slow,
+            prev_ma_slow,
+            last_ma120,
+        ) = self._signal_inputs(df, close, incremental)
 
         if price <= 0:
             return []
 
-        actions: List[Dict[str, Any]] = []
+        smas = {
+            120: (last_ma120, float("nan")),
+            self.params.ma_slow: (last_ma_slow, prev_ma_slow),
+            self.params.ma_fast: (last_ma_fast, prev_ma_fast),
+        }
+        long_signal = entry_signal(SIGNAL_SPEC["long"], price, prev_price, smas, self.params)
+        short_signal = entry_signal(SIGNAL_SPEC["short"], price, prev_price, smas, self.params)
+
+        bar = None
+        if self.params.exit_mode == "intrabar":
+            high, low = ohlcv_column(df, "high"), ohlcv_column(df, "low")
+            if high is not None and low is not None:
+                opens = ohlcv_column(df, "open")
+                open_ = float(opens[-1]) if opens is not None else prev_price
+                bar = (open_, float(high[-1]), float(low[-1]))
+        return self._apply(
+            decide(
+                self.params,
+                self.long_entries,
+                self.short_entries,
+                price,
+                long_signal,
+                short_signal,
+                account_value,
+                cash,
+                bar,
+            )
+        )
+
+
+@dataclass
+class BacktestResult:
+    equity: Any
+    fills: List[Dict[str, Any]]
+    stats: Dict[str, Any]
+
+
+def backtest(
+    df: Any,
+    params: Optional[StrategyParams] = None,
+    init_cash: float = 10_000.0,
+    commission: float = 0.001,
+    slippage_perc: float = 0.0,
+    fill_on: str = "next_open",
+    bars_per_year: float = 365.0,
+    lower_tf: Any = None,
+) -> BacktestResult:
+    """
+    Replay the StrategyState.process_bar rules over a whole frame in one pass.
+
+    MAs and crossover masks are precomputed as arrays; the entry/TP1/SL/TP2
+    ladder then runs over plain floats. Fills follow backtrader's market-order
+    semantics (next bar open, percentage slippage and commission) unless
+    fill_on="close", which fills at the signal bar's close like live trading.
+
+    With params.exit_mode="intrabar" exits are resolved against each bar's
+    high/low and filled at the touched threshold on that bar. lower_tf
+    (timestamp/open/high/low/close columns of a smaller timeframe, e.g.
+    CandleStore.read(symbol, "1m")) is only consulted for bars where both a
+    take-profit and a stop level were touched.
+    """
+    import numpy as np
+
+    # df 也可以是 candle_store.load_columnar() 返回的 {列名: memmap} 映射或结构化数组
+    def column(name: str, dtype: Any = np.float64) -> Any:
+        col = ohlcv_column(df, name)
+        return None if col is None else np.asarray(col, dtype=dtype)
+
+    close = column("close")
+    open_ = column("open")
+    ts = column("timestamp", None)
+    high = column("high")
+    low = column("low")
+    return backtest_arrays(
+        close,
+        open_=open_,
+        ts=ts,
+        high=high,
+        low=low,
+        lower_tf=lower_tf,
+        params=params,
+        init_cash=init_cash,
+        commission=commission,
+        slippage_perc=slippage_perc,
+        fill_on=fill_on,
+        bars_per_year=bars_per_year,
+    )
+
+
+def backtest_arrays(
+    close: Any,
+    open_: Any = None,
+    ts: Any = None,
+    params: Optional[StrategyParams] = None,
+    init_cash: float = 10_000.0,
+    commission: float = 0.001,
+    slippage_perc: float = 0.0,
+    fill_on: str = "next_open",
+    bars_per_year: float = 365.0,
+    sma_cache: Optional[Dict[int, Any]] = None,
+    high: Any = None,
+    low: Any = None,
+    lower_tf: Any = None,
+) -> BacktestResult:
+    """
+    Array form of backtest(). sma_cache (period -> SMA array) lets callers that
+    run many parameter sets over the same series reuse the moving averages.
+    high/low are required when params.exit_mode="intrabar".
+    """
+    import numpy as np
+
+    from indicators import sma
+
+    if fill_on not in {"next_open", "close"}:
+        raise ValueError('fill_on 必须是 "next_open" 或 "close"')
+    p = params or StrategyParams()
+    if p.exit_mode not in {"close", "intrabar"}:
+        raise ValueError('exit_mode 必须是 "close" 或 "intrabar"')
+    intrabar = p.exit_mode == "intrabar"
+    if intrabar and (high is None or low is None):
+        raise ValueError('exit_mode="intrabar" 需要 high / low')
+
+    close = np.asarray(close, dtype=np.float64)
+    n = close.shape[0]
+    if intrabar:
+        high = np.asarray(high, dtype=np.float64)
+        low = np.asarray(low, dtype=np.float64)
+        # 没有开盘价时用上一根收盘价近似（判断跳空和 OHLC 路径用）
+        bar_open = np.asarray(open_, dtype=np.float64) if open_ is not None else np.concatenate([close[:1], close[:-1]])
+        high_l = high.tolist()
+        low_l = low.tolist()
+        bar_open_l = bar_open.tolist()
+    if fill_on != "next_open" or open_ is None:
+        open_ = close
 
-        long_signal = (
-            prev_price < prev_ma_fast
-            and price > last_ma_fast
-            and prev_price < prev_ma_slow
-            and price > last_ma_slow
-            and price > last_ma120
+    def cached_sma(period: int) -> Any:
+        if sma_cache is None:
+            return sma(close, period)
+        if period not in sma_cache:
+            sma_cache[period] = sma(close, period)
+        return sma_cache[period]
+
+    periods = spec_periods(SIGNAL_SPEC, p)
+    smas = {}
+    for period in periods:
+        ma = cached_sma(period)
+        smas[period] = (ma, np.roll(ma, 1))
+    prev_close = np.roll(close, 1)
+    with np.errstate(invalid="ignore"):
+        long_sig = np.asarray(entry_signal(SIGNAL_SPEC["long"], close, prev_close, smas, p), dtype=bool)
+        short_sig = np.asarray(entry_signal(SIGNAL_SPEC["short"], close, prev_close, smas, p), dtype=bool)
+    start = max(periods)
+    long_sig[:start] = False
+    short_sig[:start] = False
+
+    close_l = close.tolist()
+    open_l = np.asarray(open_, dtype=np.float64).tolist()
+    long_l = long_sig.tolist()
+    short_l = short_sig.tolist()
+
+    cash = float(init_cash)
+    position = 0.0
+    cash_delta = np.zeros(n)
+    pos_delta = np.zeros(n)
+    fills: List[Dict[str, Any]] = []
+    long_entries = EntryBook()
+    short_entries = EntryBook()
+    completed_long = 0
+    completed_short = 0
+    pending: Optional[Tuple[str, str, float]] = None
+    next_open = fill_on == "next_open"
+    drilled = 0
+
+    resolve: Optional[Callable[[int, float, float], Optional[str]]] = None
+    if intrabar and lower_tf is not None and n > 0:
+        if ts is None:
+            raise ValueError("lower_tf 需要 ts 来对齐 K 线")
+        ts_arr = np.asarray(ts, dtype=np.int64)
+        sub_ts = np.asarray(lower_tf["timestamp"], dtype=np.int64)
+        sub_open, sub_high, sub_low, sub_close = (
+            np.asarray(lower_tf[col], dtype=np.float64) for col in ("open", "high", "low", "close")
         )
+        bar_ms = int(np.median(np.diff(ts_arr))) if n > 1 else 0
 
-        if long_signal:
-            buy_amount = account_value * self.params.buy_pct
-            if cash >= buy_amount:
-                size = buy_amount / price
-                self.long_entries.append(Entry(price=price, size=size, tp1_done=False))
-                actions.append(
-                    {
-                        "op": "open_long",
-                        "side": "buy",
-                        "size": size,
-                        "price": price,
-                        "notional": buy_amount,
-                    }
-                )
-                return actions
-
-        short_signal = (
-            prev_price > prev_ma_fast
-            and price < last_ma_fast
-            and prev_price > prev_ma_slow
-            and price < last_ma_slow
-            and price < last_ma120
+        def resolve(i: int, up_level: float, down_level: float) -> Optional[str]:
+            # 只在高低点两边都触及的 bar 上才会调用：取该 bar 时间段内的小周期 K 线逐根判断
+            nonlocal drilled
+            t0 = int(ts_arr[i])
+            t1 = int(ts_arr[i + 1]) if i + 1 < n else t0 + bar_ms
+            a, b = np.searchsorted(sub_ts, (t0, t1))
+            drilled += 1
+            return first_touch(sub_open[a:b], sub_high[a:b], sub_low[a:b], sub_close[a:b], up_level, down_level)
+
+    def fill(i: int, op: str, side: str, size: float, ref_price: float) -> None:
+        nonlocal cash, position
+        slip = ref_price * slippage_perc
+        px = ref_price + slip if side == "buy" else ref_price - slip
+        value = size * px
+        comm = value * commission
+        signed = size if side == "buy" else -size
+        dc = -value - comm if side == "buy" else value - comm
+        cash += dc
+        position += signed
+        cash_delta[i] += dc
+        pos_delta[i] += signed
+        fills.append(
+            {
+                "bar": i,
+                "timestamp": int(ts[i]) if ts is not None else None,
+                "op": op,
+                "side": side,
+                "size": size,
+                "price": px,
+                "commission": comm,
+            }
         )
 
-        if short_signal:
-            sell_amount = account_value * self.params.buy_pct
-            size = sell_amount / price
-            self.short_entries.append(Entry(price=price, size=size, tp1_done=False))
-            actions.append(
-                {
-                    "op": "open_short",
-                    "side": "sell",
-                    "size": size,
-                    "price": price,
-                    "notional": sell_amount,
-                }
-            )
-            return actions
-
-        for i in range(len(self.long_entries) - 1, -1, -1):
-            entry = self.long_entries[i]
-            pnl_pct = price / entry.price - 1.0
-
-            if not entry.tp1_done and pnl_pct >= self.params.tp1_pct:
-                sell_size = entry.size * self.params.tp1_sell_prop
-                entry.tp1_done = True
-                entry.size -= sell_size
-                actions.append(
-                    {
-                        "op": "tp1_long",
-                        "side": "sell",
-                        "size": sell_size,
-                        "price": price,
-                    }
-                )
-                return actions
-
-            if should_stop_loss(entry.price, price, "long", self.params.sl_pct):
-                sell_size = entry.size
-                self.long_entries.pop(i)
-                actions.append(
-                    {
-                        "op": "sl_long",
-                        "side": "sell",
-                        "size": sell_size,
-                        "price": price,
-                    }
-                )
-                return actions
-
-            if entry.tp1_done and pnl_pct >= self.params.tp2_pct:
-                sell_size = entry.size
-                self.long_entries.pop(i)
-                self.completed_long_trades += 1
-                actions.append(
-                    {
-                        "op": "tp2_long",
-                        "side": "sell",
-                        "size": sell_size,
-                        "price": price,
-                    }
-                )
-                return actions
-
-        for i in range(len(self.short_entries) - 1, -1, -1):
-            entry = self.short_entries[i]
-            pnl_pct = entry.price / price - 1.0
-
-            if not entry.tp1_done and pnl_pct >= self.params.tp1_pct:
-                buy_size = entry.size * self.params.tp1_sell_prop
-                entry.tp1_done = True
-                entry.size -= buy_size
-                actions.append(
-                    {
-                        "op": "tp1_short",
-                        "side": "buy",
-                        "size": buy_size,
-                        "price": price,
-                    }
-                )
-                return actions
-
-            if should_stop_loss(entry.price, price, "short", self.params.sl_pct):
-                buy_size = entry.size
-                self.short_entries.pop(i)
-                actions.append(
-                    {
-                        "op": "sl_short",
-                        "side": "buy",
-                        "size": buy_size,
-                        "price": price,
-                    }
-                )
-                return actions
-
-            if entry.tp1_done and pnl_pct >= self.params.tp2_pct:
-                buy_size = entry.size
-                self.short_entries.pop(i)
-                self.completed_short_trades += 1
-                actions.append(
-                    {
-                        "op": "tp2_short",
-                        "side": "buy",
-                        "size": buy_size,
-                        "price": price,
-                    }
+    signal_bars = np.flatnonzero(long_sig | short_sig)
+
+    def next_event(i: int) -> int:
+        # i 之后第一根可能产生动作的 bar：信号 bar，或价格触及 entry 阶梯的 bar；中间的 bar 必然无动作
+        k = int(np.searchsorted(signal_bars, i, side="right"))
+        nxt = int(signal_bars[k]) if k < signal_bars.shape[0] else n
+        lo, width = i + 1, 64
+        while lo < nxt and (long_entries or short_entries):
+            hi = min(nxt, lo + width)
+            seg_high, seg_low = (high[lo:hi], low[lo:hi]) if intrabar else (close[lo:hi],) * 2
+            hits = [
+                h
+                for h in (
+                    long_entries.next_candidate(seg_high, seg_low, "long", p.tp1_pct, p.sl_pct, p.tp2_pct),
+                    short_entries.next_candidate(seg_high, seg_low, "short", p.tp1_pct, p.sl_pct, p.tp2_pct),
                 )
-                return actions
+                if h >= 0
+            ]
+            if hits:
+                return lo + min(hits)
+            lo, width = hi, min(width * 2, 1 << 16)
+        return nxt
+
+    i = start
+    while i < n:
+        if pending is not None:
+            fill(i, pending[0], pending[1], pending[2], open_l[i])
+            pending = None
+        if next_open and i == n - 1:
+            break
+        price = close_l[i]
+        bar = None
+        drill = None
+        if intrabar:
+            bar = (bar_open_l[i], high_l[i], low_l[i])
+            if resolve is not None:
+                drill = functools.partial(resolve, i)
+        action = decide(
+            p, long_entries, short_entries, price, long_l[i], short_l[i], cash + position * price, cash, bar, drill
+        )
+        if action is None:
+            i = next_event(i)
+            continue
+        op, side, size, ref_price = action
+        completed_long += op == "tp2_long"
+        completed_short += op == "tp2_short"
+        if intrabar and not op.startswith("open_"):
+            # 盘中触发的止盈止损在本根 bar 的阈值价成交
+            fill(i, op, side, size, ref_price)
+        elif next_open:
+            pending = (op, side, size)
+        else:
+            fill(i, op, side, size, price)
+        i += 1
 
-        return actions
+    equity = init_cash + np.cumsum(cash_delta) + np.cumsum(pos_delta) * close
+    stats = {
+        **analyze(equity, fills, init_cash, bars_per_year),
+        "completed_long_trades": completed_long,
+        "completed_short_trades": completed_short,
+        "total_completed": completed_long + completed_short,
+        "fills": len(fills),
+        "drilled_bars": drilled,
+    }
+    return BacktestResult(equity=equity, fills=fills, stats=stats)
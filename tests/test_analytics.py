@@ -0,0 +1,101 @@
+import math
+from datetime import datetime, timezone
+
+import backtrader as bt
+import pytest
+
+from analytics import analyze
+from bench import synthetic_ohlcv
+from future_main import make_data_feed
+from future_strategy import BTCMaBreakoutTP
+
+INIT_CASH = 10_000.0
+
+
+def _write_csv(path, rows) -> None:
+    # 与 daily_download 输出同一格式，走 CryptoCSVData 读取
+    lines = ["date,open,high,low,close,volume"]
+    for ts, o, h, lo, c, v in rows:
+        date = datetime.fromtimestamp(ts / 1000, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+        lines.append(",".join([date, *(repr(float(x)) for x in (o, h, lo, c, v))]))
+    path.write_text("\n".join(lines) + "\n")
+
+
+# 手算样例：多空两个方向交叉持有
+#   多头：bar0 开 2 @100（手续费 0.2）-> bar1 TP1 平 1 @110（0.11）-> bar2 TP2 平 1 @120（0.12）
+#         pnl = -200.2 + 109.89 + 119.88 = 29.57，持有 2 根 bar
+#   空头：bar1 开 1 @110 -> bar3 止损平 1 @121，pnl = -11，持有 2 根 bar
+#   bar4 再开多 1 @100 未平，不计入交易统计
+FILLS = [
+    {"bar": 0, "op": "open_long", "side": "buy", "size": 2.0, "price": 100.0, "commission": 0.2},
+    {"bar": 1, "op": "tp1_long", "side": "sell", "size": 1.0, "price": 110.0, "commission": 0.11},
+    {"bar": 1, "op": "open_short", "side": "sell", "size": 1.0, "price": 110.0, "commission": 0.0},
+    {"bar": 2, "op": "tp2_long", "side": "sell", "size": 1.0, "price": 120.0, "commission": 0.12},
+    {"bar": 3, "op": "sl_short", "side": "buy", "size": 1.0, "price": 121.0, "commission": 0.0},
+    {"bar": 4, "op": "open_long", "side": "buy", "size": 1.0, "price": 100.0, "commission": 0.0},
+]
+# 逐 bar 收益 +10%、-10%、+10%、+10%：均值 0.05，样本标准差 0.1，下行均方根 0.05
+EQUITY = [100.0, 110.0, 99.0, 108.9, 119.79]
+
+
+def test_round_trips_both_sides():
+    stats = analyze(EQUITY, FILLS, 100.0)
+    assert stats["trades"] == 2
+    assert (stats["won"], stats["lost"]) == (1, 1)
+    assert stats["win_rate_pct"] == 50.0
+    assert stats["best_trade"] == pytest.approx(29.57)
+    assert stats["worst_trade"] == pytest.approx(-11.0)
+    assert stats["avg_trade_pnl"] == pytest.approx((29.57 - 11.0) / 2)
+    assert stats["avg_win"] == pytest.approx(29.57)
+    assert stats["avg_loss"] == pytest.approx(-11.0)
+    assert stats["profit_factor"] == pytest.approx(29.57 / 11.0)
+    assert stats["avg_bars_held"] == 2.0
+    # bar0-bar2 有仓位，bar3 空头平掉后空仓，bar4 收盘时持有新开的多头
+    assert stats["exposure_pct"] == pytest.approx(80.0)
+
+
+def test_return_and_risk_metrics():
+    stats = analyze(EQUITY, FILLS, 100.0, bars_per_year=5)
+    assert stats["final_value"] == 119.79
+    assert stats["total_return_pct"] == pytest.approx(19.79)
+    # bars_per_year 等于 bar 数时年化收益就是总收益
+    assert stats["annual_return_pct"] == pytest.approx(19.79)
+    # 前高 110 之后跌到 99：回撤 10%，bar2、bar3 两根 bar 低于前高
+    assert stats["max_drawdown"] == pytest.approx(10.0)
+    assert stats["max_drawdown_bars"] == 2
+    assert stats["sharpe"] == pytest.approx(0.05 / 0.1 * math.sqrt(5))
+    assert stats["sortino"] == pytest.approx(0.05 / 0.05 * math.sqrt(5))
+
+
+def test_no_fills_and_flat_equity():
+    stats = analyze([100.0] * 4, [], 100.0)
+    assert stats["trades"] == 0
+    assert stats["max_drawdown"] == 0.0
+    assert stats["sharpe"] is None and stats["sortino"] is None
+    assert stats["win_rate_pct"] is None and stats["profit_factor"] is None
+
+
+# 与 backtrader 对比（多空双向、任意种子）：权益曲线逐 bar 相同，最大回撤（%）相差不超过 1e-9，
+# 回撤持续 bar 数与 DrawDown.max.len 完全相同，期末价值相对误差不超过 1e-12。
+# 交易统计不与 TradeAnalyzer 比：backtrader 把多空轧差成一个净持仓，且净持仓精确为 0 才结束一笔交易，
+# 分批平仓留下的浮点残量会让它合并或多出交易；逐方向的回合统计由上面的手算样例覆盖。
+@pytest.mark.parametrize("seed", range(6))
+def test_drawdown_and_value_match_backtrader(tmp_path, seed):
+    csv_path = tmp_path / "candles.csv"
+    _write_csv(csv_path, synthetic_ohlcv(1000, seed=seed))
+
+    cerebro = bt.Cerebro(stdstats=False)
+    cerebro.adddata(make_data_feed(str(csv_path)))
+    cerebro.broker.setcash(INIT_CASH)
+    cerebro.broker.setcommission(commission=0.001)
+    cerebro.addstrategy(BTCMaBreakoutTP, csv_output=None)
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name="drawdown")
+    strat = cerebro.run()[0]
+
+    stats = analyze(strat.equity, strat.fills, INIT_CASH)
+    drawdown = strat.analyzers.drawdown.get_analysis()
+
+    assert any(f["op"].endswith("_short") for f in strat.fills)
+    assert stats["max_drawdown"] == pytest.approx(drawdown.max.drawdown, abs=1e-9)
+    assert stats["max_drawdown_bars"] == drawdown.max.len
+    assert stats["final_value"] == pytest.approx(cerebro.broker.getvalue(), rel=1e-12)
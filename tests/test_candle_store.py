@@ -0,0 +1,26 @@
+from candle_store import CandleStore, candles_from_rows, read_candle_rows, save_columnar
+
+# 2020-09-13 12:26:40 UTC
+TS = 1_600_000_000_000
+ROW = [TS, 10000.0, 10100.0, 9900.0, 10050.0, 12.5]
+
+
+def test_csv_date_column_round_trips_to_milliseconds(tmp_path):
+    path = tmp_path / "candles.csv"
+    path.write_text(
+        "date,open,high,low,close,volume\n"
+        "2020-09-13 12:26:40.000000,10000,10100,9900,10050,12.5\n"
+        "2020-09-14 12:26:40.000000,10050,10200,10000,10150,8.0\n"
+    )
+    rows = read_candle_rows(str(path))
+    assert [r[0] for r in rows] == [TS, TS + 86_400_000]
+    assert rows[0] == ROW
+
+
+def test_columnar_and_store_keep_timestamps(tmp_path):
+    save_columnar(str(tmp_path / "cols"), candles_from_rows([ROW]))
+    assert read_candle_rows(str(tmp_path / "cols")) == [ROW]
+
+    store = CandleStore(str(tmp_path / "store"))
+    store.write("BTC/USDT:USDT", "1d", [ROW])
+    assert int(store.last_timestamp("BTC/USDT:USDT", "1d")) == TS
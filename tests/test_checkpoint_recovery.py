@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+import live_okx
+from bench import synthetic_ohlcv
+from checkpoint import StateCheckpoint
+from live_okx import SYMBOL, run_once
+from mock_exchange import MockOKX
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+class CrashBeforeCommit(StateCheckpoint):
+    """下单之后、commit 之前进程被杀：.wal 留在磁盘上。"""
+
+    def commit(self, states, decision_id=None, acted=None):
+        if self.pending:
+            raise SimulatedCrash()
+        super().commit(states, decision_id, acted)
+
+
+def _orders_sent(exchange: MockOKX) -> int:
+    return len(exchange.orders)
+
+
+def _run_until_crash(exchange: MockOKX, checkpoint: StateCheckpoint) -> None:
+    while True:
+        try:
+            run_once(exchange, verbose=False, checkpoint=checkpoint)
+        except SimulatedCrash:
+            return
+        if not exchange.advance():
+            pytest.fail("synthetic data never produced an order")
+
+
+@pytest.fixture
+def exchange():
+    return MockOKX(synthetic_ohlcv(600, seed=3), start=299)
+
+
+def test_rerun_after_crash_does_not_resend(exchange, tmp_path):
+    path = str(tmp_path / "state.json")
+    _run_until_crash(exchange, CrashBeforeCommit(path))
+    assert os.path.exists(f"{path}.wal")
+    sent = _orders_sent(exchange)
+    positions = {k: list(v) for k, v in exchange.positions.items()}
+    assert sent > 0
+
+    # 重启后重跑同一根 bar：按 clOrdId 查到已成交的订单，不再决策、不再下单
+    checkpoint = StateCheckpoint(path)
+    assert run_once(exchange, verbose=False, checkpoint=checkpoint) == []
+    assert _orders_sent(exchange) == sent
+    assert exchange.positions == positions
+    assert not os.path.exists(f"{path}.wal")
+    assert checkpoint.acted(SYMBOL) == str(exchange.now)
+
+    # 恢复后的逐笔 entry 与交易所持仓一致
+    state = checkpoint.load(SYMBOL)
+    held = sum(contracts for (_, side), (contracts, _) in exchange.positions.items() if side == "long")
+    assert sum(e.size for e in state.long_entries) == pytest.approx(held * 0.01)
+
+
+def test_rerun_after_crash_before_send_decides_once(exchange, tmp_path, monkeypatch):
+    path = str(tmp_path / "state.json")
+
+    def crash(exchange, actions, *args, **kwargs):
+        if actions:
+            raise SimulatedCrash()
+        return []
+
+    with monkeypatch.context() as m:
+        m.setattr(live_okx, "execute_actions", crash)
+        _run_until_crash(exchange, StateCheckpoint(path))
+    assert os.path.exists(f"{path}.wal")
+    assert _orders_sent(exchange) == 0
+
+    # 一笔都没发出去：退回决策前的状态，这根 bar 照常决策并只下单一次
+    checkpoint = StateCheckpoint(path)
+    executed = run_once(exchange, verbose=False, checkpoint=checkpoint)
+    assert executed and all(item["order"] is not None for item in executed)
+    assert _orders_sent(exchange) == len(executed)
+    assert checkpoint.acted(SYMBOL) == str(exchange.now)
+
+    assert run_once(exchange, verbose=False, checkpoint=checkpoint) == []
+    assert _orders_sent(exchange) == len(executed)
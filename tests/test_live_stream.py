@@ -0,0 +1,91 @@
+import asyncio
+
+from bench import synthetic_ohlcv
+from candle_store import CandleStore
+from checkpoint import StateCheckpoint
+from live_okx import ExchangeSession, create_strategy_state, run_once
+from live_stream import ReplaySource, StreamRunner
+from mock_exchange import AsyncMockOKX, MockOKX
+
+WARMUP = 300
+ROWS = synthetic_ohlcv(WARMUP + 160, seed=3)
+
+
+def _orders(exchange: MockOKX) -> list[tuple]:
+    return [(o["clientOrderId"], o["side"], o["amount"]) for o in exchange.orders.values()]
+
+
+class BarCloseSource(ReplaySource):
+    """
+    只推 K 线、不推 mark price 的回放源。每个 tick 到来时把模拟交易所的时钟停在上一根已收盘的 bar，
+    StreamRunner 在收盘时下的单与 run_once 在同一根 bar 上按同一个收盘价成交。
+    """
+
+    def __init__(self, rows, exchange: MockOKX, warmup: int):
+        super().__init__(rows, warmup=warmup)
+        self.exchange = exchange
+        self.index = {int(r[0]): i for i, r in enumerate(rows)}
+
+    async def watch_ohlcv(self, symbol, timeframe="1d", since=None, limit=None):
+        candles = await super().watch_ohlcv(symbol, timeframe, since, limit)
+        self.exchange.cursor = self.index[int(candles[-1][0])] - 1
+        return candles
+
+    async def watch_mark_price(self, symbol, params=None):
+        await asyncio.Event().wait()
+
+
+def test_stream_bar_close_matches_run_once(tmp_path):
+    # run_once 带检查点在每根已收盘的 bar 上跑一次，与常驻进程内存里的状态对应；
+    # 最后一根在回放里不会收盘，不计入
+    reference = MockOKX(ROWS, start=WARMUP - 1)
+    checkpoint = StateCheckpoint(str(tmp_path / "state.json"))
+    while reference.cursor < len(ROWS) - 1:
+        run_once(reference, verbose=False, checkpoint=checkpoint)
+        reference.advance()
+
+    exchange = AsyncMockOKX(ROWS, start=WARMUP - 1)
+
+    async def replay() -> StreamRunner:
+        session = ExchangeSession(exchange)
+        await session.markets_async()
+        runner = StreamRunner(
+            BarCloseSource(ROWS, exchange, WARMUP),
+            create_strategy_state(),
+            CandleStore(str(tmp_path / "candles")),
+            exchange=exchange,
+            session=session,
+        )
+        await runner.run()
+        return runner
+
+    runner = asyncio.run(replay())
+    assert len(reference.orders) > 2
+    assert _orders(exchange) == _orders(reference)
+    assert len(runner.executed) == len(reference.orders)
+
+
+def test_mark_price_tick_runs_exit_ladder(tmp_path):
+    exchange = AsyncMockOKX(ROWS, start=WARMUP - 1)
+    price = exchange.last_price()
+
+    async def tick() -> list[dict]:
+        session = ExchangeSession(exchange)
+        await session.markets_async()
+        await exchange.create_order(exchange.symbol, "market", "buy", 5, params={"posSide": "long"})
+        state = create_strategy_state()
+        state.long_entries.add(price, 0.05)
+        runner = StreamRunner(
+            ReplaySource(ROWS, warmup=WARMUP),
+            state,
+            CandleStore(str(tmp_path / "candles")),
+            exchange=exchange,
+            session=session,
+        )
+        # 低于止损线的 mark price：check_exits 触发 SL，整笔平仓
+        return await runner.on_mark_price(price * (1 - state.params.sl_pct) * 0.99, ts=123)
+
+    executed = asyncio.run(tick())
+    assert [item["action"]["op"] for item in executed] == ["sl_long"]
+    assert executed[0]["order"]["side"] == "sell"
+    assert exchange.positions == {}
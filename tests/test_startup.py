@@ -0,0 +1,41 @@
+import json
+import os
+import subprocess
+import sys
+
+from bench import STARTUP_BUDGET_MS, STARTUP_PROBE
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run(script: str) -> str:
+    # 每次都是全新解释器，sys.modules 里没有任何之前导入过的模块
+    proc = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, cwd=ROOT, check=True)
+    return proc.stdout.strip().splitlines()[-1]
+
+
+def test_cold_start_stays_lean():
+    # 首次运行包含 .pyc 编译，取两次中较快的一次
+    probes = [json.loads(_run(STARTUP_PROBE)) for _ in range(2)]
+    assert all(not p["loaded"] for p in probes), probes
+    assert min(p["import_ms"] for p in probes) < STARTUP_BUDGET_MS
+
+
+def test_okx_class_falls_back_to_full_import():
+    script = """
+import importlib
+real = importlib.import_module
+
+def import_module(name, package=None):
+    if name in ("ccxt.okx", "ccxt.async_support.okx"):
+        raise ImportError("layout changed")
+    return real(name, package)
+
+importlib.import_module = import_module
+import live_okx
+sync_cls, async_cls = live_okx.okx_class(), live_okx.okx_class(async_support=True)
+import ccxt
+import ccxt.async_support
+print(sync_cls is ccxt.okx and async_cls is ccxt.async_support.okx)
+"""
+    assert _run(script) == "True"
@@ -0,0 +1,60 @@
+import pytest
+
+from trade_ledger import TradeLedger
+
+SYMBOL = "BTC/USDT:USDT"
+
+
+def _fill(i: int, side: str, amount: float, pos_side: str = "long") -> dict:
+    return {"id": str(i), "timestamp": 1_000 + i, "side": side, "amount": amount, "price": 100.0, "info": {"posSide": pos_side}}
+
+
+def _net(ledger: TradeLedger, pos_side: str = "long") -> float:
+    row = ledger.conn.execute("SELECT net FROM legs WHERE symbol = ? AND pos_side = ?", (SYMBOL, pos_side)).fetchone()
+    return row[0] if row else 0.0
+
+
+def test_first_page_starting_mid_position_does_not_go_negative(tmp_path):
+    ledger = TradeLedger(str(tmp_path / "ledger.db"))
+    # 第一页只看到了一笔减仓，开仓在更早的页里
+    ledger.ingest(SYMBOL, [_fill(1, "sell", 9)], 0.01)
+    assert _net(ledger) == 0.0
+    assert not ledger.tp1_done(SYMBOL, "long")
+
+    ledger.ingest(SYMBOL, [_fill(2, "buy", 10), _fill(3, "sell", 9)], 0.01)
+    assert _net(ledger) == pytest.approx(0.01)
+    assert ledger.tp1_done(SYMBOL, "long")
+
+
+def test_reset_net_follows_exchange_position(tmp_path):
+    ledger = TradeLedger(str(tmp_path / "ledger.db"))
+    ledger.ingest(SYMBOL, [_fill(1, "buy", 10), _fill(2, "sell", 9)], 0.01)
+    ledger.reset_net(SYMBOL, "long", 0.05)
+    assert _net(ledger) == 0.05
+    assert ledger.tp1_done(SYMBOL, "long")
+
+    ledger.reset_net(SYMBOL, "long", 0.0)
+    assert _net(ledger) == 0.0
+    assert not ledger.tp1_done(SYMBOL, "long")
+
+    ledger.reset_net(SYMBOL, "short", 0.0)
+    assert ledger.conn.execute("SELECT COUNT(*) FROM legs WHERE pos_side = 'short'").fetchone()[0] == 0
+
+
+def test_session_pages_back_through_more_than_one_fills_page(tmp_path):
+    from bench import synthetic_ohlcv
+    from live_okx import ExchangeSession
+    from mock_exchange import MockOKX
+
+    exchange = MockOKX(synthetic_ohlcv(10), start=9)
+    ledger = TradeLedger(str(tmp_path / "ledger.db"))
+    exchange.create_order(SYMBOL, "market", "buy", 1, params={"posSide": "long"})
+    ExchangeSession(exchange, ledger=ledger).trades()
+
+    # 两次运行之间成交超过一页（100 笔）
+    for i in range(250):
+        exchange.create_order(SYMBOL, "market", "buy" if i % 2 else "sell", 1, params={"posSide": "long"})
+    fresh = ExchangeSession(exchange, ledger=ledger).trades()
+    assert len(fresh) == 250
+    assert ledger.conn.execute("SELECT COUNT(*) FROM fills").fetchone()[0] == 251
+    assert exchange.calls["fetch_my_trades"] == 1 + 3
@@ -0,0 +1,231 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import time
+from typing import Any, Iterator
+
+
+# 会被计时的 ccxt 方法（只包装交易所实例上存在的）；throttle 是 enableRateLimit 的限速等待
+TRACED_METHODS = (
+    "load_markets",
+    "fetch_ohlcv",
+    "fetch_balance",
+    "fetch_positions",
+    "fetch_my_trades",
+    "fetch_order",
+    "create_order",
+    "create_orders",
+    "set_position_mode",
+)
+
+TRACE_JSONL = os.getenv("TRACE_JSONL")
+TRACE_PROM = os.getenv("TRACE_PROM")
+METRIC_PREFIX = "btc_trade_run"
+
+_current_stage: contextvars.ContextVar[str] = contextvars.ContextVar("stage", default="-")
+
+
+def _new_stats() -> dict:
+    return {"count": 0, "wall_s": 0.0, "calls": 0, "resubmits": 0, "errors": 0, "throttle_s": 0.0}
+
+
+def _order_ids(method: str, args: tuple, kwargs: dict) -> list[str]:
+    if method == "create_order":
+        params = kwargs.get("params", args[5] if len(args) > 5 else None) or {}
+        return [params["clOrdId"]] if params.get("clOrdId") else []
+    if method == "create_orders":
+        orders = kwargs.get("orders", args[0] if args else None) or []
+        return [o["params"]["clOrdId"] for o in orders if (o.get("params") or {}).get("clOrdId")]
+    return []
+
+
+class RunTracer:
+    """
+    单次运行的分阶段延迟追踪：每个阶段的墙钟时间、ccxt 调用次数、订单重复提交次数、报错次数
+    和限速器等待时间，以及每个阶段内每个 ccxt 方法的同样统计。
+
+    stage() 标记当前阶段（contextvar，asyncio.gather 出去的请求也归到发起它的阶段）；
+    instrument() 在 with 块内临时包装交易所实例上的方法，退出时还原。
+    同一 clOrdId 的订单再次提交（批量失败后补发）记为一次 resubmit；ccxt 内部没有自动重试，
+    其它失败的请求只计入 errors。
+    结果可以导出为 JSON lines（每阶段 / 每方法一行）和 Prometheus 文本格式。
+    """
+
+    def __init__(self, run: str = "live_okx", symbol: str | None = None):
+        self.run = run
+        self.symbol = symbol
+        self.started_at = time.time()
+        self.stages: dict[str, dict] = {}
+        self.calls: dict[tuple[str, str], dict] = {}
+        self._submitted: set[str] = set()
+
+    # ---- 记录 ----
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        token = _current_stage.set(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.stages.setdefault(name, _new_stats())
+            stats["count"] += 1
+            stats["wall_s"] += time.perf_counter() - started
+            _current_stage.reset(token)
+
+    def _record(self, method: str, elapsed: float, error: bool, resubmits: int) -> None:
+        stage = _current_stage.get()
+        stage_stats = self.stages.setdefault(stage, _new_stats())
+        if method == "throttle":
+            stage_stats["throttle_s"] += elapsed
+            return
+        call = self.calls.setdefault((stage, method), _new_stats())
+        for stats in (stage_stats, call):
+            stats["calls"] += 1
+            stats["resubmits"] += resubmits
+            stats["errors"] += int(error)
+        call["count"] += 1
+        call["wall_s"] += elapsed
+
+    def _resubmits(self, method: str, args: tuple, kwargs: dict) -> int:
+        ids = _order_ids(method, args, kwargs)
+        resubmits = sum(1 for i in ids if i in self._submitted)
+        self._submitted.update(ids)
+        return resubmits
+
+    def _wrap(self, method: str, fn: Any) -> Any:
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def traced_async(*args: Any, **kwargs: Any) -> Any:
+                resubmits = self._resubmits(method, args, kwargs)
+                started = time.perf_counter()
+                error = False
+                try:
+                    return await fn(*args, **kwargs)
+                except BaseException:
+                    error = True
+                    raise
+                finally:
+                    self._record(method, time.perf_counter() - started, error, resubmits)
+
+            return traced_async
+
+        @functools.wraps(fn)
+        def traced(*args: Any, **kwargs: Any) -> Any:
+            resubmits = self._resubmits(method, args, kwargs)
+            started = time.perf_counter()
+            error = False
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException:
+                error = True
+                raise
+            if inspect.isawaitable(result):
+                # ccxt.async_support 的 throttle 是返回 future 的普通方法
+                return self._await(method, result, started, resubmits)
+            self._record(method, time.perf_counter() - started, error, resubmits)
+            return result
+
+        return traced
+
+    async def _await(self, method: str, awaitable: Any, started: float, resubmits: int) -> Any:
+        error = False
+        try:
+            return await awaitable
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self._record(method, time.perf_counter() - started, error, resubmits)
+
+    @contextlib.contextmanager
+    def instrument(self, exchange: Any) -> Iterator[Any]:
+        wrapped = []
+        for method in (*TRACED_METHODS, "throttle"):
+            fn = getattr(exchange, method, None)
+            if fn is None or not callable(fn):
+                continue
+            had_own = method in getattr(exchange, "__dict__", {})
+            setattr(exchange, method, self._wrap(method, fn))
+            wrapped.append((method, had_own, fn))
+        try:
+            yield exchange
+        finally:
+            for method, had_own, fn in wrapped:
+                if had_own:
+                    setattr(exchange, method, fn)
+                else:
+                    delattr(exchange, method)
+
+    # ---- 导出 ----
+    def total_s(self) -> float:
+        return sum(s["wall_s"] for name, s in self.stages.items() if name != "-")
+
+    def records(self) -> list[dict]:
+        base = {"ts": int(self.started_at * 1000), "run": self.run, "symbol": self.symbol}
+        out = []
+        for name, s in self.stages.items():
+            out.append(
+                {
+                    **base,
+                    "kind": "stage",
+                    "stage": name,
+                    "wall_ms": round(s["wall_s"] * 1e3, 3),
+                    "calls": s["calls"],
+                    "resubmits": s["resubmits"],
+                    "errors": s["errors"],
+                    "throttle_ms": round(s["throttle_s"] * 1e3, 3),
+                }
+            )
+        for (stage, method), s in self.calls.items():
+            out.append(
+                {
+                    **base,
+                    "kind": "call",
+                    "stage": stage,
+                    "method": method,
+                    "count": s["count"],
+                    "wall_ms": round(s["wall_s"] * 1e3, 3),
+                    "resubmits": s["resubmits"],
+                    "errors": s["errors"],
+                }
+            )
+        out.append({**base, "kind": "run", "wall_ms": round(self.total_s() * 1e3, 3)})
+        return out
+
+    def to_json_lines(self) -> str:
+        return "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in self.records())
+
+    def to_prometheus(self) -> str:
+        run = f'run="{self.run}"'
+
+        def gauge(name: str, help_: str, samples: list[tuple[str, float]]) -> list[str]:
+            lines = [f"# HELP {METRIC_PREFIX}_{name} {help_}", f"# TYPE {METRIC_PREFIX}_{name} gauge"]
+            lines += [f"{METRIC_PREFIX}_{name}{{{run}{labels}}} {value:.6g}" for labels, value in samples]
+            return lines
+
+        stages = [(f',stage="{name}"', s) for name, s in self.stages.items()]
+        calls = [(f',stage="{stage}",method="{method}"', s) for (stage, method), s in self.calls.items()]
+        lines = gauge("seconds", "Wall time of the whole run", [("", self.total_s())])
+        lines += gauge("stage_seconds", "Wall time per stage", [(l, s["wall_s"]) for l, s in stages])
+        lines += gauge("stage_throttle_seconds", "Time spent in the ccxt rate limiter per stage", [(l, s["throttle_s"]) for l, s in stages])
+        lines += gauge("api_calls", "ccxt calls per stage and method", [(l, s["count"]) for l, s in calls])
+        lines += gauge("api_call_seconds", "Wall time of ccxt calls per stage and method", [(l, s["wall_s"]) for l, s in calls])
+        lines += gauge("api_resubmits", "Orders resubmitted with an already used clOrdId per stage and method", [(l, s["resubmits"]) for l, s in calls])
+        lines += gauge("api_errors", "Failed ccxt calls per stage and method", [(l, s["errors"]) for l, s in calls])
+        lines += gauge("last_run_timestamp_seconds", "Start time of the run", [("", self.started_at)])
+        return "\n".join(lines) + "\n"
+
+    def export(self, jsonl_path: str | None = TRACE_JSONL, prom_path: str | None = TRACE_PROM) -> None:
+        """JSON lines 追加写入；Prometheus 文本原子替换（适合 node_exporter textfile collector）。"""
+        if jsonl_path:
+            with open(jsonl_path, "a", encoding="utf-8") as f:
+                f.write(self.to_json_lines())
+        if prom_path:
+            tmp = f"{prom_path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp, prom_path)
@@ -0,0 +1,185 @@
+import os
+import sqlite3
+from typing import Iterable
+
+from strategy_engine import Entry
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fills (
+    id        TEXT NOT NULL,
+    symbol    TEXT NOT NULL,
+    ts        INTEGER NOT NULL,
+    side      TEXT NOT NULL,
+    pos_side  TEXT,
+    amount    REAL NOT NULL,
+    price     REAL,
+    order_id  TEXT,
+    PRIMARY KEY (symbol, id)
+);
+CREATE INDEX IF NOT EXISTS fills_symbol_ts ON fills (symbol, ts);
+
+-- 按 (symbol, posSide) 增量维护的持仓轨迹，等价于对全部成交跑一遍 _infer_tp1_done_from_trades
+CREATE TABLE IF NOT EXISTS legs (
+    symbol    TEXT NOT NULL,
+    pos_side  TEXT NOT NULL,
+    net       REAL NOT NULL,
+    reduced   INTEGER NOT NULL,
+    PRIMARY KEY (symbol, pos_side)
+);
+
+-- 策略最近一次决策后的逐笔 entry（保留每笔的 TP1 状态）
+CREATE TABLE IF NOT EXISTS entries (
+    symbol    TEXT NOT NULL,
+    pos_side  TEXT NOT NULL,
+    seq       INTEGER NOT NULL,
+    price     REAL NOT NULL,
+    size      REAL NOT NULL,
+    tp1_done  INTEGER NOT NULL,
+    PRIMARY KEY (symbol, pos_side, seq)
+);
+"""
+
+
+def _fill_pos_side(trade: dict) -> str | None:
+    info = trade.get("info") or {}
+    pos_side = trade.get("posSide") or info.get("posSide") or info.get("positionSide")
+    pos_side = str(pos_side).lower() if pos_side else None
+    return pos_side if pos_side in {"long", "short"} else None
+
+
+class TradeLedger:
+    """
+    本地 SQLite 成交账本：记录已见过的成交和每笔 entry 的状态。
+
+    每次只向交易所拉取 since(最后一笔已入账成交的时间) 之后的成交，按 id 去重后入账，
+    同时增量更新各方向的净持仓与“开仓后是否已减仓”（TP1）标记，同步开销与新成交数量成正比。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def since(self, symbol: str) -> int | None:
+        """下次增量拉取的起点（含），与最后一笔成交同毫秒的成交靠 id 去重。"""
+        row = self.conn.execute("SELECT MAX(ts) FROM fills WHERE symbol = ?", (symbol,)).fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+
+    def ingest(self, symbol: str, trades: Iterable[dict], contract_size: float) -> list[dict]:
+        """入账新成交，返回真正新增的那部分（按时间排序）。"""
+        fresh = []
+        with self.conn:
+            for t in sorted((t for t in trades if t.get("timestamp") is not None), key=lambda x: x["timestamp"]):
+                trade_id = str(t.get("id") or t.get("order") or "")
+                if not trade_id:
+                    continue
+                cur = self.conn.execute(
+                    "INSERT OR IGNORE INTO fills VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        trade_id,
+                        symbol,
+                        int(t["timestamp"]),
+                        t.get("side") or "",
+                        _fill_pos_side(t),
+                        float(t.get("amount", 0) or 0),
+                        float(t["price"]) if t.get("price") is not None else None,
+                        str(t.get("order") or ""),
+                    ),
+                )
+                if cur.rowcount:
+                    fresh.append(t)
+                    self._apply_leg(symbol, t, contract_size)
+        return fresh
+
+    def _apply_leg(self, symbol: str, trade: dict, contract_size: float) -> None:
+        pos_side = _fill_pos_side(trade)
+        if pos_side is None:
+            return
+        btc = float(trade.get("amount", 0) or 0) * contract_size
+        if btc <= 0:
+            return
+        row = self.conn.execute(
+            "SELECT net, reduced FROM legs WHERE symbol = ? AND pos_side = ?", (symbol, pos_side)
+        ).fetchone()
+        net, reduced = (row[0], bool(row[1])) if row else (0.0, False)
+
+        opening_side = "buy" if pos_side == "long" else "sell"
+        delta = btc if trade.get("side") == opening_side else -btc
+        prev_net = net
+        # 首次入账可能从持仓中途开始，先看到的减仓不能把净持仓压到 0 以下
+        net = max(net + delta, 0.0)
+        if prev_net <= 0 and net > 0:
+            reduced = False
+        else:
+            if prev_net > 0 and delta < 0:
+                reduced = True
+            if net <= 0:
+                reduced = False
+        self.conn.execute(
+            "INSERT OR REPLACE INTO legs VALUES (?, ?, ?, ?)", (symbol, pos_side, net, int(reduced))
+        )
+
+    def reset_net(self, symbol: str, pos_side: str, net: float) -> None:
+        """用交易所的实时持仓（contracts * contractSize）校准净持仓；持仓为 0 时清掉减仓标记。"""
+        net = max(float(net), 0.0)
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT reduced FROM legs WHERE symbol = ? AND pos_side = ?", (symbol, pos_side)
+            ).fetchone()
+            if row is None and net <= 0:
+                return
+            reduced = bool(row and row[0]) and net > 0
+            self.conn.execute(
+                "INSERT OR REPLACE INTO legs VALUES (?, ?, ?, ?)", (symbol, pos_side, net, int(reduced))
+            )
+
+    def tp1_done(self, symbol: str, pos_side: str) -> bool:
+        row = self.conn.execute(
+            "SELECT reduced FROM legs WHERE symbol = ? AND pos_side = ?", (symbol, pos_side)
+        ).fetchone()
+        return bool(row and row[0])
+
+    def recent_fills(self, symbol: str, n: int = 10) -> list[dict]:
+        rows = self.conn.execute(
+            "SELECT id, ts, side, pos_side, amount, price, order_id FROM fills"
+            " WHERE symbol = ? ORDER BY ts DESC LIMIT ?",
+            (symbol, n),
+        ).fetchall()
+        return [
+            {
+                "id": r[0],
+                "timestamp": r[1],
+                "side": r[2],
+                "amount": r[4],
+                "price": r[5],
+                "order": r[6] or None,
+                "symbol": symbol,
+                "info": {"posSide": r[3]} if r[3] else {},
+            }
+            for r in reversed(rows)
+        ]
+
+    def save_entries(self, symbol: str, long_entries: list[Entry], short_entries: list[Entry]) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM entries WHERE symbol = ?", (symbol,))
+            self.conn.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (symbol, pos_side, seq, e.price, e.size, int(e.tp1_done))
+                    for pos_side, entries in (("long", long_entries), ("short", short_entries))
+                    for seq, e in enumerate(entries)
+                ],
+            )
+
+    def load_entries(self, symbol: str, pos_side: str) -> list[Entry]:
+        rows = self.conn.execute(
+            "SELECT price, size, tp1_done FROM entries WHERE symbol = ? AND pos_side = ? ORDER BY seq",
+            (symbol, pos_side),
+        ).fetchall()
+        return [Entry(price=r[0], size=r[1], tp1_done=bool(r[2])) for r in rows]